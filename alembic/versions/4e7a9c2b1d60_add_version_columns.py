@@ -0,0 +1,29 @@
+"""add version columns
+
+Revision ID: 4e7a9c2b1d60
+Revises: 8c2d5f1a9b3e
+Create Date: 2026-10-19 11:04:27.918340
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e7a9c2b1d60'
+down_revision: Union[str, None] = '8c2d5f1a9b3e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rows start at version 1
+    op.add_column('book', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('customer', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('customer', 'version')
+    op.drop_column('book', 'version')
@@ -0,0 +1,47 @@
+"""add wallet ledger
+
+Revision ID: 8c2d5f1a9b3e
+Revises: 15c4fa264b54
+Create Date: 2026-10-19 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c2d5f1a9b3e'
+down_revision: Union[str, None] = '15c4fa264b54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing balances stay in customer.wallet_money_amount, which becomes the snapshot
+    op.create_table('wallet_entry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.Column('reason', sa.String(length=20), nullable=False),
+    sa.Column('compacted', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['customer_id'], ['customer.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_wallet_entry_id'), 'wallet_entry', ['id'], unique=False)
+    op.create_index('ix_wallet_entry_uncompacted', 'wallet_entry', ['customer_id'], unique=False, postgresql_where=sa.text('NOT compacted'))
+
+
+def downgrade() -> None:
+    # Folding the entries not compacted yet back into the balances before dropping the ledger
+    op.execute(
+        "UPDATE customer SET wallet_money_amount = wallet_money_amount + pending.amount "
+        "FROM (SELECT customer_id, SUM(amount) AS amount FROM wallet_entry "
+        "WHERE NOT compacted GROUP BY customer_id) AS pending "
+        "WHERE customer.id = pending.customer_id"
+    )
+    op.drop_index('ix_wallet_entry_uncompacted', table_name='wallet_entry', postgresql_where=sa.text('NOT compacted'))
+    op.drop_index(op.f('ix_wallet_entry_id'), table_name='wallet_entry')
+    op.drop_table('wallet_entry')
@@ -7,8 +7,9 @@ from sqlalchemy import (
     DateTime,
     Table,
     Boolean,
+    Index,
 )
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from app.db.base import metadata
 
 # Table for storing user information
@@ -85,7 +86,34 @@ customer_table = Table(
     ),  # Subscription end time
     Column(
         "wallet_money_amount", Integer, default=0, nullable=False
-    ),  # Customer's wallet balance
+    ),  # Customer's wallet balance as of the last wallet ledger compaction
+    Column(
+        "version", Integer, nullable=False, server_default="1"
+    ),  # Row version, incremented by every update (optimistic concurrency control)
+)
+
+# Append-only ledger of the wallet movements of customers
+wallet_entry_table = Table(
+    "wallet_entry",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True),  # Primary key for entry ID
+    Column(
+        "customer_id", Integer, ForeignKey("customer.id"), nullable=False
+    ),  # Reference to customer ID
+    Column("amount", Integer, nullable=False),  # Positive for credits, negative for debits
+    Column("reason", String(20), nullable=False),  # What the movement was for
+    Column(
+        "compacted", Boolean, default=False, nullable=False
+    ),  # Whether the amount was folded into the customer's wallet_money_amount
+    Column(
+        "created_at", DateTime(timezone=True), server_default=func.now(), nullable=False
+    ),  # Time of the movement
+    # Only entries not yet compacted are summed when reading a balance
+    Index(
+        "ix_wallet_entry_uncompacted",
+        "customer_id",
+        postgresql_where=text("NOT compacted"),
+    ),
 )
 
 # Table for storing book information
@@ -104,6 +132,9 @@ book_table = Table(
     Column(
         "reserved_units", Integer, default=0, nullable=False
     ),  # Number of reserved book units
+    Column(
+        "version", Integer, nullable=False, server_default="1"
+    ),  # Row version, incremented by every update (optimistic concurrency control)
 )
 
 # Table for storing reservation information
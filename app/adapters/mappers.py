@@ -3,7 +3,7 @@ from sqlalchemy import event
 from app.book.domain.entities import Book, Genre
 from app.db.base import mapper_registry
 from app.adapters.data_models import *
-from app.reservation.domain.entities import Customer, Reservation
+from app.reservation.domain.entities import Customer, Reservation, WalletEntry
 from app.user.domain.entities import Author, City, User
 
 
@@ -58,6 +58,7 @@ def start_mappers(mapper_registry):
                 Reservation, back_populates="customer", cascade="all, delete-orphan"
             ),  # One-to-many relationship with Reservation
         },
+        version_id_col=customer_table.c.version,  # Updates fail if the row changed meanwhile
     )
 
     # Mapping for the Genre entity
@@ -75,8 +76,12 @@ def start_mappers(mapper_registry):
                 Author, secondary=book_author_table, backref="books"
             ),  # Many-to-many relationship with Author
         },
+        version_id_col=book_table.c.version,  # Updates fail if the row changed meanwhile
     )
 
+    # Mapping for the WalletEntry entity (no relationships, entries are read in bulk)
+    mapper_registry.map_imperatively(WalletEntry, wallet_entry_table)
+
     # Mapping for the Reservation entity and its relationships with Customer and Book
     mapper_registry.map_imperatively(
         Reservation,
@@ -1,15 +1,44 @@
-from typing import TypeVar, Generic, Type, Optional, Sequence
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Generic,
+    Iterable,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+)
+from sqlalchemy import bindparam, delete, inspect, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from sqlalchemy.sql import Executable
+from sqlalchemy.sql.dml import UpdateBase
 from sqlalchemy.engine import Result
+from app.db.unit_of_work import get_memo
+from app.exceptions import ConcurrencyConflictError
+from app.settings import settings
 
-# Define a generic type variable for the repository
+# Define generic type variables for the repository and the result of its operations
 T = TypeVar("T")
+R = TypeVar("R")
 
 
 class AbstractRepository(Generic[T]):
+    # Whether updates rely on the version column of the entity instead of row locks
+    optimistic_locking: bool = False
+
+    # Statements of the hot queries, keyed by repository class, entity and query name
+    _statements: Dict[Tuple[type, type, str], Executable] = {}
+
     def __init__(self, session: AsyncSession, model: Type[T]):
         """
         Abstract repository for handling database operations.
@@ -20,23 +49,82 @@ class AbstractRepository(Generic[T]):
         self.session = session
         self.model = model
 
+    @property
+    def memo(self) -> dict:
+        # Entities already looked up in the current transaction, shared by repositories
+        return get_memo(self.session)
+
+    async def memoized(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Looks up an entity once per transaction: the first call loads it, later calls
+        with the same key return the same result (including None) without a query.
+
+        :param key: What identifies the lookup, prefixed by the entity class.
+        :param load: Loads the entity when the key was not looked up yet.
+        :return: The entity or None if not found.
+        """
+        memo = self.memo
+        if key not in memo:
+            memo[key] = await load()
+        return memo[key]
+
+    def statement(self, name: str, build: Callable[[], Executable]) -> Executable:
+        """
+        Returns the statement of a hot query, built on first use and then reused with
+        the values of each call passed as bound parameters.
+
+        Building a statement and computing its cache key on every call costs more
+        Python time than the rest of a simple query. A reused statement keeps its cache
+        key, so SQLAlchemy goes straight to the compiled SQL it cached.
+
+        :param name: The name of the query, unique within the repository.
+        :param build: Builds the statement, using bindparam() for the values of a call.
+        :return: The statement, to be executed with the values of its parameters.
+        """
+        key = (type(self), self.model, name)
+        stmt = self._statements.get(key)
+        if stmt is None:
+            stmt = self._statements[key] = build()
+        return stmt
+
+    def forget(self) -> None:
+        """
+        Clears the memo of the transaction. Called by every write, since a statement may
+        create or delete rows that were looked up before.
+        """
+        self.memo.clear()
+
     async def add(self, entity: T) -> None:
         """
         Adds a new entity to the database and flushes the session.
 
         :param entity: The entity to be added.
+        :raises ConcurrencyConflictError: If a versioned row changed by the flush was
+            changed by another transaction since it was read.
         """
         self.session.add(entity)
-        await self.session.flush()
+        await self._flush()
+        self.forget()
 
     async def remove(self, entity: T) -> None:
         """
         Removes an entity from the database and flushes the session.
 
         :param entity: The entity to be removed.
+        :raises ConcurrencyConflictError: If a versioned row changed by the flush was
+            changed by another transaction since it was read.
         """
         await self.session.delete(entity)
-        await self.session.flush()
+        await self._flush()
+        self.forget()
+
+    async def _flush(self):
+        # Flushes the session outside of retry_on_conflict, where a conflict can't be
+        # retried anymore, as UnitOfWork.flush does
+        try:
+            await self.session.flush()
+        except StaleDataError:
+            raise ConcurrencyConflictError()
 
     async def get(
         self, entity_id: int, with_relations: Optional[list] = None
@@ -44,17 +132,40 @@ class AbstractRepository(Generic[T]):
         """
         Retrieves an entity by its ID, optionally loading related data.
 
+        Without relations, the entity is taken from the identity map of the session or
+        the memo of the transaction when it was already looked up, without a query.
+
         :param entity_id: The ID of the entity to retrieve.
         :param with_relations: A list of related entities to eagerly load.
         :return: The retrieved entity or None if not found.
         """
+        if not with_relations:
+            return await self.memoized(
+                (self.model, entity_id), lambda: self._get_by_id(entity_id)
+            )
+
         stmt = select(self.model).where(self.model.id == entity_id)
-        if with_relations:
-            for relation in with_relations:
-                stmt = stmt.options(selectinload(relation))
+        for relation in with_relations:
+            stmt = stmt.options(selectinload(relation))
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
 
+    async def _get_by_id(self, entity_id: int) -> Optional[T]:
+        # Like session.get: a loaded entity is returned as is, others are queried
+        entity = self.session.identity_map.get(
+            self.session.identity_key(self.model, entity_id)
+        )
+        if entity is not None:
+            state = inspect(entity)
+            if not state.expired_attributes and not state.deleted:
+                return entity
+
+        stmt = self.statement(
+            "get", lambda: select(self.model).where(self.model.id == bindparam("id"))
+        )
+        result = await self.session.execute(stmt, {"id": entity_id})
+        return result.scalar_one_or_none()
+
     async def list(self, limit: int = 100, offset: int = 0) -> Sequence[T]:
         """
         Retrieves a list of entities with pagination support.
@@ -63,26 +174,225 @@ class AbstractRepository(Generic[T]):
         :param offset: Number of entities to skip.
         :return: A sequence of retrieved entities.
         """
-        stmt = select(self.model).limit(limit).offset(offset)
-        result = await self.session.execute(stmt)
+        stmt = self.statement(
+            "list",
+            lambda: select(self.model)
+            .limit(bindparam("limit"))
+            .offset(bindparam("offset")),
+        )
+        result = await self.session.execute(stmt, {"limit": limit, "offset": offset})
         return result.scalars().all()
 
+    async def get_existing_ids(self, entity_ids: Iterable[int]) -> Set[int]:
+        """
+        Checks which of the given IDs belong to existing entities, in a single query.
+
+        :param entity_ids: The IDs to check.
+        :return: The subset of the IDs that exist.
+        """
+        stmt = self.statement(
+            "existing_ids",
+            lambda: select(self.model.id).where(
+                self.model.id.in_(bindparam("ids", expanding=True))
+            ),
+        )
+        result = await self.session.execute(stmt, {"ids": list(set(entity_ids))})
+        return set(result.scalars().all())
+
+    async def stream(self, batch_size: int = 1000) -> AsyncIterator[Sequence[T]]:
+        """
+        Reads every entity in ID order through a server-side cursor, one batch at a time,
+        so memory use doesn't grow with the size of the table.
+
+        :param batch_size: Number of entities fetched from the cursor per batch.
+        :return: An async iterator over batches of entities.
+        """
+        stmt = (
+            select(self.model)
+            .order_by(self.model.id)
+            .execution_options(yield_per=batch_size)
+        )
+        result = await self.session.stream_scalars(stmt)
+        async for batch in result.partitions():
+            yield batch
+
     async def update(self, entity_id: int, **kwargs) -> Optional[T]:
         """
         Updates an entity with the provided attributes.
 
+        Repositories with optimistic locking read the entity without a lock and let the
+        versioned UPDATE detect concurrent changes, retrying from a fresh read. Others
+        lock the row with SELECT ... FOR UPDATE until the end of the transaction.
+
         :param entity_id: The ID of the entity to update.
         :param kwargs: Key-value pairs of attributes to update.
         :return: The updated entity or None if not found.
         """
-        stmt = select(self.model).where(self.model.id == entity_id).with_for_update()
+
+        async def apply() -> Optional[T]:
+            entity = await self.get_for_update(entity_id)
+            if entity:
+                for key, value in kwargs.items():
+                    setattr(entity, key, value)
+                await self.session.flush()
+            return entity
+
+        if self.optimistic_locking:
+            return await self.retry_on_conflict(apply)
+        return await apply()
+
+    async def get_for_update(self, entity_id: int) -> Optional[T]:
+        """
+        Reads an entity that is about to be modified: with its latest committed state
+        under optimistic locking, or locked with SELECT ... FOR UPDATE otherwise.
+
+        :param entity_id: The ID of the entity to read.
+        :return: The entity or None if not found.
+        """
+        stmt = select(self.model).where(self.model.id == entity_id)
+        if self.optimistic_locking:
+            # Overwriting the copy in the identity map, which may be stale after a conflict
+            stmt = stmt.execution_options(populate_existing=True)
+        else:
+            stmt = stmt.with_for_update()
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def retry_on_conflict(
+        self,
+        operation: Callable[[], Awaitable[R]],
+        retries: int = settings.OPTIMISTIC_LOCK_RETRIES,
+    ) -> R:
+        """
+        Runs an operation in a SAVEPOINT, running it again when one of the versioned rows
+        it updates was changed by another transaction since it was read.
+
+        The operation must read what it modifies (e.g. with get_for_update), so a retry
+        works from the current state rather than the stale one.
+
+        :param operation: The operation to run.
+        :param retries: How many times the operation is re-run after a conflict.
+        :return: The result of the operation.
+        :raises ConcurrencyConflictError: If every attempt conflicted.
+        """
+        for _ in range(retries + 1):
+            try:
+                async with self.session.begin_nested():
+                    return await operation()
+            except StaleDataError:
+                # The savepoint was rolled back, only the operation's changes are lost
+                continue
+        raise ConcurrencyConflictError()
+
+    def _versioned(self, values: dict) -> dict:
+        # Bumps the version of entities using optimistic locking, so sessions holding
+        # an older copy of the row detect the change when they update it
+        version_column = inspect(self.model).version_id_col
+        if version_column is None:
+            return values
+        return {**values, version_column.key: version_column + 1}
+
+    def _dialect(self) -> str:
+        return self.session.get_bind().dialect.name
+
+    def insert_statement(self, table):
+        """
+        Starts an INSERT supporting ON CONFLICT clauses, which are specific to the
+        dialect in use.
+
+        :param table: The table or entity to insert into.
+        :return: The INSERT statement.
+        """
+        dialect = postgresql if self._dialect() == "postgresql" else sqlite
+        return dialect.insert(table)
+
+    async def update_returning(self, entity_id: int, **values) -> Optional[T]:
+        """
+        Updates an entity in a single UPDATE ... RETURNING statement, without reading it
+        first, and builds the entity from the returned row.
+
+        :param entity_id: The ID of the entity to update.
+        :param values: The columns to update.
+        :return: The updated entity or None if not found.
+        """
+        if not values:
+            return await self.get(entity_id)
+
+        stmt = (
+            update(self.model)
+            .where(self.model.id == entity_id)
+            .values(**self._versioned(values))
+            .returning(self.model)
+            .execution_options(populate_existing=True)
+        )
         result = await self.session.execute(stmt)
-        entity = result.scalar_one_or_none()
-        if entity:
-            for key, value in kwargs.items():
-                setattr(entity, key, value)
-            await self.session.flush()
-        return entity
+        self.forget()
+        return result.scalar_one_or_none()
+
+    async def delete_returning(
+        self, entity_id: int, *dependents: UpdateBase
+    ) -> Optional[T]:
+        """
+        Deletes an entity in a single DELETE ... RETURNING statement, without loading it
+        first, and builds the entity from the returned row.
+
+        Rows referencing the entity are deleted by the given statements, attached as
+        data-modifying CTEs of the same statement on PostgreSQL (its foreign keys are
+        checked at the end of the statement, and every CTE sees the rows as they were
+        before it) or run before it, in order, on other databases.
+
+        :param entity_id: The ID of the entity to delete.
+        :param dependents: DELETE statements for the rows referencing the entity, or
+            UPDATE statements for what those rows hold.
+        :return: The deleted entity or None if not found.
+        """
+        stmt = (
+            delete(self.model).where(self.model.id == entity_id).returning(self.model)
+        )
+        if self._dialect() == "postgresql":
+            for i, dependent in enumerate(dependents):
+                stmt = stmt.add_cte(dependent.cte(f"dependent_{i}"))
+        else:
+            for dependent in dependents:
+                await self.session.execute(dependent)
+
+        result = await self.session.execute(stmt)
+        self.forget()
+        return result.scalar_one_or_none()
+
+    async def upsert(
+        self,
+        values: dict,
+        conflict_columns: Sequence[str],
+        update_columns: Sequence[str] = (),
+    ) -> Optional[T]:
+        """
+        Inserts an entity in a single INSERT ... ON CONFLICT ... RETURNING statement and
+        builds the entity from the returned row.
+
+        :param values: The columns of the new entity.
+        :param conflict_columns: The unique columns identifying an existing entity.
+        :param update_columns: The columns overwritten on an existing entity. When empty,
+            an existing entity is left untouched.
+        :return: The inserted or updated entity, or None if an existing one was left
+            untouched.
+        """
+        stmt = self.insert_statement(self.model).values(**values)
+        if update_columns:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=conflict_columns,
+                set_=self._versioned(
+                    {column: stmt.excluded[column] for column in update_columns}
+                ),
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+
+        result = await self.session.execute(
+            stmt.returning(self.model).execution_options(populate_existing=True)
+        )
+        self.forget()
+        return result.scalar_one_or_none()
 
     async def execute(self, stmt: Executable) -> Result:
         """
@@ -91,4 +401,7 @@ class AbstractRepository(Generic[T]):
         :param stmt: The SQL statement to execute.
         :return: The result of the execution.
         """
-        return await self.session.execute(stmt)
+        result = await self.session.execute(stmt)
+        if not getattr(stmt, "is_select", False):
+            self.forget()
+        return result
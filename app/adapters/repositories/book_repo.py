@@ -1,13 +1,17 @@
-from typing import Optional, List
-from sqlalchemy import and_, select, update
+from typing import Dict, Iterable, Optional, List
+from sqlalchemy import and_, delete, insert, select
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.adapters.data_models import book_author_table, book_table
 from app.book.domain.entities import Book
 from app.exceptions import NotFoundException
 from app.adapters.repositories.abstract_repo import AbstractRepository
 
 
 class BookRepository(AbstractRepository[Book]):
+    # Books are read far more than written, so updates rely on their version column
+    optimistic_locking = True
+
     def __init__(self, session: AsyncSession):
         """
         Repository for handling database operations related to the Book entity.
@@ -26,6 +30,30 @@ class BookRepository(AbstractRepository[Book]):
         """
         return await super().list(limit, skip)
 
+    async def cancel_reservation(self, book_id: int) -> Optional[Book]:
+        """
+        Releases the unit of a book held by a cancelled reservation.
+
+        The book row isn't locked: if a reservation or another cancellation changed it
+        since it was read, its versioned update fails and the unit is released again
+        from the current state of the book.
+
+        :param book_id: The ID of the book.
+        :return: The updated book or None if not found.
+        :raises ConcurrencyConflictError: If the book kept changing on every attempt.
+        """
+
+        async def release() -> Optional[Book]:
+            book = await self.get_for_update(book_id)
+            if book:
+                book.cancel_reservation()
+                await self.session.flush()
+            return book
+
+        book = await self.retry_on_conflict(release)
+        self.forget()
+        return book
+
     async def add_book(self, book: Book) -> None:
         """
         Adds a new book to the database.
@@ -36,21 +64,17 @@ class BookRepository(AbstractRepository[Book]):
 
     async def update_book(self, book_id: int, book_data: dict) -> Optional[Book]:
         """
-        Updates an existing book's attributes.
+        Updates an existing book's attributes in a single statement.
 
         :param book_id: The ID of the book to update.
         :param book_data: A dictionary of fields to update.
         :return: The updated Book entity.
         :raises NoResultFound: If the book does not exist.
         """
-        existing_book = await self.get_book_by_id(book_id)
-        if not existing_book:
+        book = await self.update_returning(book_id, **book_data)
+        if not book:
             raise NoResultFound("Book not found.")
-
-        stmt = update(Book).where(Book.id == book_id).values(**book_data)
-        await self.execute(stmt)
-
-        return await self.get_book_by_id(book_id)
+        return book
 
     async def get_book_by_id(
         self, book_id: int, with_relations: Optional[List[str]] = None
@@ -64,18 +88,34 @@ class BookRepository(AbstractRepository[Book]):
         """
         return await super().get(book_id, with_relations)
 
-    async def delete_book_by_id(self, book_id: int) -> bool:
+    async def delete_book_by_id(self, book_id: int) -> Optional[Book]:
         """
-        Deletes a book by its ID.
+        Deletes a book and its author links by its ID in a single statement.
 
         :param book_id: The ID of the book to delete.
-        :return: A success message.
+        :return: The deleted Book entity or None if not found.
         """
-        book = await self.get_book_by_id(book_id)
-        if not book:
-            return {"message": "Book not found."}
-        await super().remove(book)
-        return {"message": "Book deleted successfully."}
+        return await self.delete_returning(
+            book_id,
+            delete(book_author_table).where(book_author_table.c.book_id == book_id),
+        )
+
+    async def set_author_ids(self, book_id: int, author_ids: Iterable[int]) -> None:
+        """
+        Replaces the authors of a book.
+
+        :param book_id: The ID of the book.
+        :param author_ids: The IDs of its authors.
+        """
+        await self.session.execute(
+            delete(book_author_table).where(book_author_table.c.book_id == book_id)
+        )
+        await self.add_author_links(
+            [
+                {"book_id": book_id, "author_id": author_id}
+                for author_id in set(author_ids)
+            ]
+        )
 
     async def get_author_ids_from_books(self, book_id: int) -> List[int]:
         """
@@ -93,3 +133,68 @@ class BookRepository(AbstractRepository[Book]):
             raise NotFoundException("No authors found for the provided book IDs.")
 
         return author_ids
+
+    async def get_titles_by_ids(self, book_ids: Iterable[int]) -> Dict[int, str]:
+        """
+        Retrieves the titles of several books in a single query.
+
+        Rows are read through a server-side cursor so large ID sets are not
+        buffered in full by the driver.
+
+        :param book_ids: The IDs of the books.
+        :return: A mapping of book ID to title for the books that exist.
+        """
+        stmt = (
+            select(Book.id, Book.title)
+            .where(Book.id.in_(set(book_ids)))
+            .execution_options(yield_per=1000)
+        )
+        result = await self.session.stream(stmt)
+        return {book_id: title async for book_id, title in result}
+
+    async def get_author_ids_by_book_ids(
+        self, book_ids: Iterable[int]
+    ) -> Dict[int, List[int]]:
+        """
+        Retrieves the author IDs of several books in a single query.
+
+        :param book_ids: The IDs of the books.
+        :return: A mapping of book ID to its author IDs (books without authors are left out).
+        """
+        stmt = select(book_author_table.c.book_id, book_author_table.c.author_id).where(
+            book_author_table.c.book_id.in_(set(book_ids))
+        )
+        author_ids: Dict[int, List[int]] = {}
+        for book_id, author_id in await self.session.execute(stmt):
+            author_ids.setdefault(book_id, []).append(author_id)
+        return author_ids
+
+    async def add_many(self, books: List[dict]) -> Dict[str, int]:
+        """
+        Inserts many books with multi-row INSERT statements, skipping those whose ISBN
+        already exists.
+
+        :param books: The column values of each book.
+        :return: A mapping of ISBN to the new ID for the books that were inserted.
+        """
+        if not books:
+            return {}
+
+        stmt = (
+            self.insert_statement(book_table)
+            .on_conflict_do_nothing(index_elements=["isbn"])
+            .returning(book_table.c.isbn, book_table.c.id)
+        )
+        # Executed with a list of rows, SQLAlchemy batches them into multi-row VALUES
+        result = await self.session.execute(stmt, books)
+        self.forget()
+        return {isbn: book_id for isbn, book_id in result}
+
+    async def add_author_links(self, links: List[dict]) -> None:
+        """
+        Links many books to their authors with multi-row INSERT statements.
+
+        :param links: The book_id and author_id of each link.
+        """
+        if links:
+            await self.session.execute(insert(book_author_table), links)
@@ -1,12 +1,23 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional
-from sqlalchemy import select
+from typing import Dict, Iterable, Optional
+from sqlalchemy import bindparam, delete, select
 from app.adapters.repositories.abstract_repo import AbstractRepository
-from app.exceptions import InvalidFieldError, NotFoundException
-from app.reservation.domain.entities import Customer, CustomerCreate, CustomerUpdate
+from app.adapters.repositories.reservation_repo import release_reserved_units
+from app.exceptions import DuplicateCustomerError, InvalidFieldError, NotFoundException
+from app.reservation.domain.entities import (
+    Customer,
+    CustomerCreate,
+    CustomerUpdate,
+    Reservation,
+    WalletEntry,
+)
+from app.user.domain.entities import User
 
 
 class CustomerRepository(AbstractRepository[Customer]):
+    # Customers are read far more than written, so updates rely on their version column
+    optimistic_locking = True
+
     def __init__(self, db: AsyncSession):
         """
         Repository for handling customer-related database operations.
@@ -17,17 +28,19 @@ class CustomerRepository(AbstractRepository[Customer]):
 
     async def create_item(self, customer_data: CustomerCreate) -> Optional[Customer]:
         """
-        Creates a new customer and adds it to the database.
+        Creates a new customer in a single INSERT ... RETURNING statement.
 
         :param customer_data: Data used to create the new customer.
         :return: The created Customer entity.
+        :raises DuplicateCustomerError: If the user already has a customer.
         :raises InvalidFieldError: If customer data is invalid.
         """
         try:
-            new_customer = Customer(**customer_data.model_dump())
-            self.session.add(new_customer)
-            await self.session.flush()
-            await self.session.refresh(new_customer)
+            new_customer = await self.upsert(
+                customer_data.model_dump(), conflict_columns=["user_id"]
+            )
+            if not new_customer:
+                raise DuplicateCustomerError(customer_data.user_id)
             return new_customer
         except InvalidFieldError as e:
             raise InvalidFieldError(f"Customer creation failed: {e}")
@@ -36,7 +49,8 @@ class CustomerRepository(AbstractRepository[Customer]):
         self, id: int, customer_data: CustomerUpdate
     ) -> Optional[Customer]:
         """
-        Updates an existing customer by its ID with the provided data.
+        Updates an existing customer by its ID with the provided data, in a single
+        UPDATE ... RETURNING statement.
 
         :param id: The ID of the customer to update.
         :param customer_data: Data to update the customer with.
@@ -45,29 +59,30 @@ class CustomerRepository(AbstractRepository[Customer]):
         :raises InvalidFieldError: If the update data is invalid.
         """
         try:
-            current_customer = await self.get(id)
-            if not current_customer:
+            updated_customer = await self.update_returning(
+                id, **customer_data.model_dump(exclude_none=True)
+            )
+            if not updated_customer:
                 raise NotFoundException("Customer not found")
-            for key, value in customer_data.model_dump(exclude_none=True).items():
-                setattr(current_customer, key, value)
-            await self.session.flush()
-            await self.session.refresh(current_customer)
-            return current_customer
+            return updated_customer
         except InvalidFieldError as e:
             raise InvalidFieldError(f"Customer update failed: {e}")
 
-    async def delete_item(self, id: int) -> bool:
+    async def delete_item(self, id: int) -> Optional[Customer]:
         """
-        Deletes a customer by its ID from the database.
+        Deletes a customer by its ID, along with its reservations and wallet ledger,
+        in a single statement. The units held by its active reservations are given
+        back to their books.
 
         :param id: The ID of the customer to delete.
-        :return: True if the customer was deleted, False if not found.
+        :return: The deleted Customer entity or None if not found.
         """
-        customer = await self.get(id)
-        if not customer:
-            return False
-        await self.session.delete(customer)
-        return True
+        return await self.delete_returning(
+            id,
+            delete(WalletEntry).where(WalletEntry.customer_id == id),
+            release_reserved_units([id]),
+            delete(Reservation).where(Reservation.customer_id == id),
+        )
 
     async def get_by_user_id(self, user_id: int) -> Optional[Customer]:
         """
@@ -76,7 +91,28 @@ class CustomerRepository(AbstractRepository[Customer]):
         :param user_id: The user ID associated with the customer.
         :return: The found Customer entity or None if not found.
         """
-        result = await self.session.execute(
-            select(Customer).where(Customer.user_id == user_id)
+        stmt = self.statement(
+            "by_user_id",
+            lambda: select(Customer).where(Customer.user_id == bindparam("user_id")),
         )
+        result = await self.session.execute(stmt, {"user_id": user_id})
         return result.scalar()
+
+    async def get_phone_numbers_by_ids(
+        self, customer_ids: Iterable[int]
+    ) -> Dict[int, str]:
+        """
+        Retrieves the phone numbers of several customers through their user relation
+        in a single query, reading rows through a server-side cursor.
+
+        :param customer_ids: The IDs of the customers.
+        :return: A mapping of customer ID to phone number for the customers that exist.
+        """
+        stmt = (
+            select(Customer.id, User.phone)
+            .join(User, Customer.user_id == User.id)
+            .where(Customer.id.in_(set(customer_ids)))
+            .execution_options(yield_per=1000)
+        )
+        result = await self.session.stream(stmt)
+        return {customer_id: phone async for customer_id, phone in result}
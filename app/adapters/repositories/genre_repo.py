@@ -0,0 +1,13 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.adapters.repositories.abstract_repo import AbstractRepository
+from app.book.domain.entities import Genre
+
+
+class GenreRepository(AbstractRepository[Genre]):
+    def __init__(self, session: AsyncSession):
+        """
+        Repository for handling database operations related to the Genre entity.
+
+        :param session: The asynchronous SQLAlchemy session.
+        """
+        super().__init__(session, Genre)
@@ -0,0 +1,91 @@
+from typing import Optional
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from app.infrastructure.redis_registry import OTP, redis_registry
+from app.settings import settings
+from app.user.domain.entities import Principal
+from app.utils.ttl_cache import TTLCache
+
+
+class PrincipalRepositoryRedis:
+    def __init__(self, redis_client: Redis, local_ttl: float, ttl: int):
+        """
+        Two-tier cache of the principals of authenticated users.
+
+        Lookups are served from a short-lived in-process cache first, then from Redis,
+        so resolving the user behind a token does not need a database round-trip. The
+        in-process tier bounds how long another worker may serve a principal after it
+        was invalidated.
+
+        :param redis_client: Async Redis client holding the shared tier.
+        :param local_ttl: Number of seconds a principal stays in the in-process cache.
+        :param ttl: Number of seconds a principal stays in Redis.
+        """
+        self.redis = redis_client
+        self.ttl = ttl
+        self.local: TTLCache[Principal] = TTLCache(
+            settings.PRINCIPAL_CACHE_SIZE, ttl=local_ttl
+        )
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"principal:{user_id}"
+
+    async def get(self, user_id: int) -> Optional[Principal]:
+        """
+        Retrieves the cached principal of a user.
+
+        :param user_id: The ID of the user.
+        :return: The principal if it is cached, otherwise None.
+        """
+        principal = self.local.get(user_id)
+        if principal is not None:
+            return principal
+
+        try:
+            data = await self.redis.get(self._key(user_id))
+        except RedisError as e:
+            print(f"Principal cache unavailable: {e}")
+            return None
+        if data is None:
+            return None
+
+        principal = Principal.model_validate_json(data)
+        self.local.set(user_id, principal)
+        return principal
+
+    async def add(self, principal: Principal):
+        """
+        Caches the principal of a user.
+
+        :param principal: The principal to cache.
+        """
+        self.local.set(principal.id, principal)
+        try:
+            await self.redis.set(
+                self._key(principal.id), principal.model_dump_json(), ex=self.ttl
+            )
+        except RedisError as e:
+            print(f"Principal cache unavailable: {e}")
+
+    async def invalidate(self, user_id: int):
+        """
+        Drops the cached principal of a user after it changed or was deleted. It is
+        called once the change is committed, so when Redis is unavailable the entry
+        is left to expire rather than failing the request.
+
+        :param user_id: The ID of the user.
+        """
+        self.local.pop(user_id)
+        try:
+            await self.redis.delete(self._key(user_id))
+        except RedisError as e:
+            print(f"Principal cache unavailable: {e}")
+
+
+# Principal cache shared by every request of this worker
+principal_repo = PrincipalRepositoryRedis(
+    redis_registry.client(OTP),
+    local_ttl=settings.PRINCIPAL_CACHE_LOCAL_TTL_MS / 1000,
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
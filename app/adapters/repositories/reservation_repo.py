@@ -1,16 +1,44 @@
 from datetime import datetime, timedelta
+from typing import Iterable, List, Union
 from fastapi import HTTPException
 import pytz
-from sqlalchemy import select
+from sqlalchemy import Select, Update, bindparam, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import func
 from app.adapters.repositories.abstract_repo import AbstractRepository
 from app.book.domain.entities import Book
-from app.reservation.domain.entities import Reservation
+from app.reservation.domain.entities import Customer, Reservation
 
 iran_timezone = pytz.timezone("Asia/Tehran")
-now = datetime.now(iran_timezone)
+
+
+def release_reserved_units(customer_ids: Union[Iterable[int], Select]) -> Update:
+    """
+    Returns the UPDATE giving back to their books the units held by the active
+    reservations of customers, one per reservation, to run before the reservations
+    are deleted in bulk (see AbstractRepository.delete_returning).
+
+    :param customer_ids: The IDs of the customers, or a SELECT of them.
+    """
+    held = (
+        select(Reservation.book_id, func.count().label("units"))
+        .where(
+            Reservation.customer_id.in_(customer_ids),
+            Reservation.status == "active",
+        )
+        .group_by(Reservation.book_id)
+        .subquery()
+    )
+    return (
+        update(Book)
+        .where(Book.id == held.c.book_id)
+        .values(
+            reserved_units=Book.reserved_units - held.c.units,
+            # Bumped as by any update, so a concurrent reservation of the book conflicts
+            version=Book.version + 1,
+        )
+    )
 
 
 class ReservationRepository(AbstractRepository[Reservation]):
@@ -26,30 +54,41 @@ class ReservationRepository(AbstractRepository[Reservation]):
         """
         Adds a reservation to the database, after checking if the book is available.
 
+        The book row isn't locked: if another reservation changed it since it was read,
+        its versioned update fails and the availability check runs again on the
+        current state of the book.
+
         :param reservation: The Reservation entity to be added.
         :raises HTTPException: If the book is not found or is fully reserved.
-        :raises IntegrityError: If there is a pessimistic lock error.
+        :raises ConcurrencyConflictError: If the book kept changing on every attempt.
         """
-        query = await self.session.execute(
-            select(Book).where(Book.id == reservation.book_id).with_for_update()
-        )
-        book = query.scalar_one_or_none()
-        if not book:
-            raise HTTPException(status_code=404, detail="Book not found.")
-
-        if book.units - book.reserved_units <= 0:
-            raise HTTPException(status_code=400, detail="Book is fully reserved.")
-
-        # Update book reserved units
-        book.reserve_book()
-
-        self.session.add(reservation)
-        try:
-            await self.session.flush()
-        except IntegrityError:
-            raise HTTPException(
-                status_code=409, detail="Pessimistic Lock Error. Please try again."
+
+        async def reserve():
+            query = await self.session.execute(
+                select(Book)
+                .where(Book.id == reservation.book_id)
+                .execution_options(populate_existing=True)
             )
+            book = query.scalar_one_or_none()
+            if not book:
+                raise HTTPException(status_code=404, detail="Book not found.")
+
+            if book.units - book.reserved_units <= 0:
+                raise HTTPException(status_code=400, detail="Book is fully reserved.")
+
+            # Update book reserved units
+            book.reserve_book()
+
+            self.session.add(reservation)
+            try:
+                await self.session.flush()
+            except IntegrityError:
+                raise HTTPException(
+                    status_code=409, detail="Reservation conflict. Please try again."
+                )
+
+        await self.retry_on_conflict(reserve)
+        self.forget()
 
     async def has_read_more_than_3_books(self, customer_id: int) -> bool:
         """
@@ -58,13 +97,17 @@ class ReservationRepository(AbstractRepository[Reservation]):
         :param customer_id: The customer ID to check.
         :return: True if the customer has read more than 3 books, False otherwise.
         """
-        thirty_days_ago = now - timedelta(days=30)
-        books_read = await self.session.execute(
-            select(func.count()).where(
-                Reservation.customer_id == customer_id,
-                Reservation.end_of_reservation >= thirty_days_ago,
+        stmt = self.statement(
+            "books_read",
+            lambda: select(func.count()).where(
+                Reservation.customer_id == bindparam("customer_id"),
+                Reservation.end_of_reservation >= bindparam("since"),
                 Reservation.status == "completed",
-            )
+            ),
+        )
+        thirty_days_ago = datetime.now(iran_timezone) - timedelta(days=30)
+        books_read = await self.session.execute(
+            stmt, {"customer_id": customer_id, "since": thirty_days_ago}
         )
         return books_read.scalar() > 3
 
@@ -75,13 +118,17 @@ class ReservationRepository(AbstractRepository[Reservation]):
         :param customer_id: The customer ID to check.
         :return: True if the customer has paid more than 300,000, False otherwise.
         """
-        sixty_days_ago = now - timedelta(days=60)
-        total_paid = await self.session.execute(
-            select(func.sum(Reservation.price)).where(
-                Reservation.customer_id == customer_id,
-                Reservation.start_of_reservation >= sixty_days_ago,
+        stmt = self.statement(
+            "total_paid",
+            lambda: select(func.sum(Reservation.price)).where(
+                Reservation.customer_id == bindparam("customer_id"),
+                Reservation.start_of_reservation >= bindparam("since"),
                 Reservation.status == "completed",
-            )
+            ),
+        )
+        sixty_days_ago = datetime.now(iran_timezone) - timedelta(days=60)
+        total_paid = await self.session.execute(
+            stmt, {"customer_id": customer_id, "since": sixty_days_ago}
         )
         return (total_paid.scalar() or 0) > 300000
 
@@ -92,11 +139,41 @@ class ReservationRepository(AbstractRepository[Reservation]):
         :param customer_id: The customer ID to check.
         :return: The number of active reservations.
         """
-        stmt = select(Reservation).where(
+        stmt = self.statement(
+            "active_count",
+            lambda: select(func.count()).where(
+                Reservation.customer_id == bindparam("customer_id"),
+                Reservation.status == "active",
+            ),
+        )
+        result = await self.session.execute(stmt, {"customer_id": customer_id})
+        return result.scalar()
+
+    async def get_active_ids_by_customer(self, customer_id: int) -> List[int]:
+        """
+        Retrieves the IDs of the active reservations of a customer.
+
+        :param customer_id: The customer ID to check.
+        :return: The IDs of the active reservations.
+        """
+        stmt = select(Reservation.id).where(
             Reservation.customer_id == customer_id, Reservation.status == "active"
         )
-        result = await self.session.execute(stmt)
-        return len(result.scalars().all())
+        return list((await self.session.execute(stmt)).scalars())
+
+    async def get_active_ids_by_user(self, user_id: int) -> List[int]:
+        """
+        Retrieves the IDs of the active reservations of the customer of a user.
+
+        :param user_id: The user ID of the customer.
+        :return: The IDs of the active reservations.
+        """
+        stmt = (
+            select(Reservation.id)
+            .join(Customer, Reservation.customer_id == Customer.id)
+            .where(Customer.user_id == user_id, Reservation.status == "active")
+        )
+        return list((await self.session.execute(stmt)).scalars())
 
     async def get_reservation_by_id_and_customer(
         self, reservation_id: int, customer_id: int
@@ -104,15 +181,17 @@ class ReservationRepository(AbstractRepository[Reservation]):
         """
         Retrieves a reservation by its ID and associated customer ID.
 
+        The reservation is looked up by its ID, so a reservation already loaded in the
+        transaction is not read again.
+
         :param reservation_id: The ID of the reservation to retrieve.
         :param customer_id: The customer ID associated with the reservation.
         :return: The found Reservation entity or None if not found.
         """
-        stmt = select(Reservation).where(
-            Reservation.id == reservation_id, Reservation.customer_id == customer_id
-        )
-        result = await self.session.execute(stmt)
-        return result.scalars().first()
+        reservation = await self.get(reservation_id)
+        if reservation and reservation.customer_id == customer_id:
+            return reservation
+        return None
 
     async def get_all_active_reservations(self) -> list[Reservation] | None:
         """
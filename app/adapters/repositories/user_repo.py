@@ -1,10 +1,13 @@
 from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import or_
+from sqlalchemy import bindparam, delete, or_
+from app.adapters.data_models import book_author_table
 from app.adapters.repositories.abstract_repo import AbstractRepository
+from app.adapters.repositories.reservation_repo import release_reserved_units
 from app.exceptions import InvalidFieldError, NotFoundException
-from app.user.domain.entities import User, UserCreate, UserUpdate
+from app.reservation.domain.entities import Customer, Reservation, WalletEntry
+from app.user.domain.entities import Author, User, UserCreate, UserUpdate
 
 
 class AuthRepository(AbstractRepository[User]):
@@ -44,6 +47,7 @@ class AuthRepository(AbstractRepository[User]):
         new_user = User(**user_data.model_dump())  # Create a new User entity
         self.db.add(new_user)  # Add the new user to the session
         await self.db.flush()  # Flush the changes to the database
+        self.forget()
         await self.db.refresh(
             new_user
         )  # Refresh the user instance with the latest data from DB
@@ -56,7 +60,11 @@ class AuthRepository(AbstractRepository[User]):
         :param username: The username of the user.
         :return: A User instance if found, otherwise None.
         """
-        result = await self.db.execute(select(User).where(User.username == username))
+        stmt = self.statement(
+            "by_username",
+            lambda: select(User).where(User.username == bindparam("username")),
+        )
+        result = await self.db.execute(stmt, {"username": username})
         return result.scalar()
 
     async def get_by_id(self, user_id: int) -> Optional[User]:
@@ -66,8 +74,7 @@ class AuthRepository(AbstractRepository[User]):
         :param user_id: The ID of the user.
         :return: A User instance if found, otherwise None.
         """
-        result = await self.db.execute(select(User).where(User.id == user_id))
-        return result.scalar()
+        return await self.get(user_id)
 
     async def get_all(self) -> List[User]:
         """
@@ -80,37 +87,45 @@ class AuthRepository(AbstractRepository[User]):
 
     async def update_item(self, id: int, user_data: UserUpdate) -> Optional[User]:
         """
-        Updates the user with the given ID using the provided data.
+        Updates the user with the given ID using the provided data, in a single
+        UPDATE ... RETURNING statement.
 
         :param id: The ID of the user to update.
         :param user_data: The data to update the user with.
         :return: The updated User instance.
+        :raises NotFoundException: If the user is not found.
         """
         try:
-            current_user = await self.get_by_id(id)
-            if not current_user:
+            updated_user = await self.update_returning(
+                id, **user_data.model_dump(exclude_none=True)
+            )
+            if not updated_user:
                 raise NotFoundException("User not found")
-            for key, value in user_data.model_dump(exclude_none=True).items():
-                setattr(
-                    current_user, key, value
-                )  # Set each attribute from the user_data
-            await self.db.flush()  # Commit changes to the database
-            await self.db.refresh(
-                current_user
-            )  # Refresh the user instance with the latest data from DB
-            return current_user
+            return updated_user
         except InvalidFieldError as e:
             raise InvalidFieldError(f"User update failed: {e}")
 
     async def delete_item(self, id: int) -> bool:
         """
-        Deletes a user by their ID.
+        Deletes a user by their ID, along with their customer and author profiles,
+        in a single statement. The units held by the active reservations of the
+        customer are given back to their books.
 
         :param id: The ID of the user to delete.
         :return: True if the user was deleted, otherwise False.
         """
-        user = await self.get_by_id(id)
-        if not user:
-            return False
-        await self.db.delete(user)  # Delete the user from the session
-        return True
+        customer_ids = select(Customer.id).where(Customer.user_id == id)
+        author_ids = select(Author.id).where(Author.user_id == id)
+        deleted_user = await self.delete_returning(
+            id,
+            # Listed so that rows are deleted before the rows they reference
+            delete(WalletEntry).where(WalletEntry.customer_id.in_(customer_ids)),
+            release_reserved_units(customer_ids),
+            delete(Reservation).where(Reservation.customer_id.in_(customer_ids)),
+            delete(Customer).where(Customer.user_id == id),
+            delete(book_author_table).where(
+                book_author_table.c.author_id.in_(author_ids)
+            ),
+            delete(Author).where(Author.user_id == id),
+        )
+        return deleted_user is not None
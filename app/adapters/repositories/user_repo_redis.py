@@ -1,18 +1,16 @@
 from typing import Optional
-import secrets, redis
-from app.settings import settings
+import secrets
+from app.infrastructure.redis_registry import OTP, redis_registry
 
 
 class AuthRepositoryRedis:
     def __init__(self):
         """
-        Initializes the Redis connection for OTP storage and retrieval.
+        Initializes the Redis client for OTP storage and retrieval.
 
-        Redis connection details are loaded from the application settings.
+        The client comes from the shared registry, so no connection is opened per instance.
         """
-        self.redis = redis.Redis(
-            host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB0
-        )
+        self.redis = redis_registry.client(OTP)
 
     async def generate_otp(self, user_id: int) -> str:
         """
@@ -25,7 +23,7 @@ class AuthRepositoryRedis:
             999999
         )  # Generates a random integer between 0 and 999999
         otp_code = f"{otp:06d}"  # Formats the OTP as a 6-digit string, e.g. 000123
-        self.redis.set(
+        await self.redis.set(
             otp_code, user_id, ex=300
         )  # Store the OTP in Redis with an expiration time of 300 seconds (5 minutes)
         return otp_code
@@ -37,7 +35,7 @@ class AuthRepositoryRedis:
         :param otp: The OTP to verify.
         :return: The associated user ID if the OTP is valid, None if invalid or expired.
         """
-        user_id = self.redis.get(
+        user_id = await self.redis.get(
             otp
         )  # Get the user ID associated with the OTP from Redis
         if not user_id:
@@ -0,0 +1,179 @@
+from typing import Dict, Iterable, Optional
+from sqlalchemy import Integer, String, bindparam, func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.adapters.data_models import customer_table, wallet_entry_table
+from app.adapters.repositories.abstract_repo import AbstractRepository
+from app.reservation.domain.entities import Customer, WalletEntry
+
+# First key of the advisory locks serializing the debits of a wallet
+WALLET_LOCK_NAMESPACE = 1
+
+
+class WalletRepository(AbstractRepository[WalletEntry]):
+    def __init__(self, session: AsyncSession):
+        """
+        Repository for the wallet ledger of customers.
+
+        Every movement is a new row of the ledger, so wallet operations never update the
+        customer row and don't contend with each other. The balance is the snapshot kept
+        in the customer's wallet_money_amount plus the entries not compacted into it yet.
+
+        :param session: The asynchronous SQLAlchemy session.
+        """
+        super().__init__(session, WalletEntry)
+
+    def _pending_total(self, customer_id):
+        # Sum of the entries of a wallet not yet folded into its snapshot
+        return (
+            select(func.coalesce(func.sum(WalletEntry.amount), 0))
+            .where(
+                WalletEntry.customer_id == customer_id,
+                ~WalletEntry.compacted,
+            )
+            .scalar_subquery()
+        )
+
+    async def get_balance(self, customer_id: int) -> Optional[int]:
+        """
+        Retrieves the balance of a wallet, reading the snapshot and the recent entries
+        in a single statement so a concurrent compaction can't be seen half done.
+
+        :param customer_id: The ID of the customer.
+        :return: The balance, or None if the customer doesn't exist.
+        """
+        stmt = self.statement(
+            "balance",
+            lambda: select(
+                Customer.wallet_money_amount + self._pending_total(Customer.id)
+            ).where(Customer.id == bindparam("customer_id")),
+        )
+        result = await self.session.execute(stmt, {"customer_id": customer_id})
+        return result.scalar()
+
+    async def get_balances(self, customer_ids: Iterable[int]) -> Dict[int, int]:
+        """
+        Retrieves the balances of several wallets in a single query.
+
+        :param customer_ids: The IDs of the customers.
+        :return: A mapping of customer ID to balance for the customers that exist.
+        """
+        result = await self.session.execute(
+            select(
+                Customer.id,
+                Customer.wallet_money_amount + self._pending_total(Customer.id),
+            ).where(Customer.id.in_(set(customer_ids)))
+        )
+        return {customer_id: balance for customer_id, balance in result}
+
+    async def credit(self, customer_id: int, amount: int, reason: str) -> bool:
+        """
+        Adds an amount to a wallet with a plain INSERT into the ledger.
+
+        :param customer_id: The ID of the customer.
+        :param amount: The amount to add.
+        :param reason: What the amount is for (e.g. "charge", "refund").
+        :return: False if the customer doesn't exist.
+        """
+        # Inserting from the customer row, so nothing is written for a missing customer
+        stmt = self.statement(
+            "credit",
+            # (into the table, an ORM insert executed with values is a bulk insert)
+            lambda: insert(wallet_entry_table).from_select(
+                ["customer_id", "amount", "reason", "compacted"],
+                select(
+                    Customer.id,
+                    bindparam("amount", type_=Integer),
+                    bindparam("reason", type_=String),
+                    literal(False),
+                ).where(Customer.id == bindparam("customer_id")),
+            ),
+        )
+        result = await self.session.execute(
+            stmt, {"customer_id": customer_id, "amount": amount, "reason": reason}
+        )
+        return result.rowcount > 0
+
+    async def _lock(self, customer_id: int):
+        # Serializes the debits of a wallet until the end of the transaction
+        # (PostgreSQL only, SQLite used in development serializes writers anyway)
+        if self.session.get_bind().dialect.name == "postgresql":
+            await self.session.execute(
+                select(func.pg_advisory_xact_lock(WALLET_LOCK_NAMESPACE, customer_id))
+            )
+
+    async def debit(self, customer_id: int, amount: int, reason: str) -> Optional[int]:
+        """
+        Takes an amount from a wallet if its balance covers it.
+
+        The debits of a wallet are serialized by a transaction-level advisory lock, so
+        two of them can't both spend the same balance. Credits don't need the lock as
+        they can't overdraw the wallet.
+
+        :param customer_id: The ID of the customer.
+        :param amount: The amount to take.
+        :param reason: What the amount is for (e.g. "reservation", "subscription").
+        :return: The new balance, or None if the balance was insufficient.
+        """
+        await self._lock(customer_id)
+        balance = await self.get_balance(customer_id)
+        if balance is None or balance < amount:
+            return None
+
+        if amount:
+            await self.session.execute(
+                insert(WalletEntry).values(
+                    customer_id=customer_id,
+                    amount=-amount,
+                    reason=reason,
+                    compacted=False,
+                )
+            )
+        return balance - amount
+
+    async def set_balance(self, customer_id: int, balance: int, reason: str) -> bool:
+        """
+        Brings a wallet to the given balance by appending the difference to the ledger.
+
+        :param customer_id: The ID of the customer.
+        :param balance: The balance the wallet should have.
+        :param reason: Why the balance is set (e.g. "adjustment").
+        :return: False if the customer doesn't exist.
+        """
+        await self._lock(customer_id)
+        current = await self.get_balance(customer_id)
+        if current is None:
+            return False
+        if balance != current:
+            await self.credit(customer_id, balance - current, reason)
+        return True
+
+    async def compact(self) -> int:
+        """
+        Folds every entry not compacted yet into the snapshot of its wallet, in a single
+        statement: the entries are flagged and their totals added to the customers.
+        Entries of transactions still in flight aren't visible yet and are left for the
+        next compaction. Relies on data-modifying CTEs (PostgreSQL).
+
+        :return: The number of wallets whose snapshot was updated.
+        """
+        folded = (
+            update(wallet_entry_table)
+            .where(~wallet_entry_table.c.compacted)
+            .values(compacted=True)
+            .returning(wallet_entry_table.c.customer_id, wallet_entry_table.c.amount)
+            .cte("folded")
+        )
+        totals = (
+            select(folded.c.customer_id, func.sum(folded.c.amount).label("amount"))
+            .group_by(folded.c.customer_id)
+            .cte("totals")
+        )
+        result = await self.session.execute(
+            update(customer_table)
+            .where(customer_table.c.id == totals.c.customer_id)
+            .values(
+                wallet_money_amount=customer_table.c.wallet_money_amount
+                + totals.c.amount
+            )
+        )
+        return result.rowcount
@@ -20,6 +20,7 @@ class Book:
     description: str
     reserved_units: int
     authors: List[int]
+    version: int
 
     def __init__(
         self,
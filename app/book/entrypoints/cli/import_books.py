@@ -0,0 +1,62 @@
+"""
+Loads books in bulk from a CSV or NDJSON file.
+
+Usage:
+    python -m app.book.entrypoints.cli.import_books books.csv
+    python -m app.book.entrypoints.cli.import_books feed.jsonl --format ndjson
+"""
+
+import argparse
+import asyncio
+import json
+from dataclasses import asdict
+from pathlib import Path
+from typing import AsyncIterator
+from app.adapters.mappers import start_mappers
+from app.book.service_layer.book_import import CSV, NDJSON, READERS, BookImporter
+from app.db.base import mapper_registry
+from app.db.unit_of_work import UnitOfWork
+from app.infrastructure.redis_registry import CACHE, redis_registry
+from app.settings import settings
+
+# Bytes read from the file at a time
+READ_SIZE = 1024 * 1024
+
+
+async def read_file(path: Path) -> AsyncIterator[bytes]:
+    # Reads the file in a worker thread so the event loop keeps serving the database
+    with path.open("rb") as file:
+        while chunk := await asyncio.to_thread(file.read, READ_SIZE):
+            yield chunk
+
+
+async def import_books(path: Path, file_format: str, batch_size: int):
+    importer = BookImporter(redis_registry.client(CACHE), batch_size=batch_size)
+    rows = READERS[file_format](read_file(path))
+    report = await importer.run(rows, UnitOfWork())
+    print(json.dumps(asdict(report), indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load books in bulk.")
+    parser.add_argument("path", type=Path, help="CSV or NDJSON file to import")
+    parser.add_argument(
+        "--format",
+        choices=[CSV, NDJSON],
+        help="File format, guessed from the file extension by default",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=settings.BOOK_IMPORT_BATCH_SIZE,
+        help="Rows inserted and committed together",
+    )
+    args = parser.parse_args()
+    file_format = args.format or (CSV if args.path.suffix == ".csv" else NDJSON)
+
+    start_mappers(mapper_registry)
+    asyncio.run(import_books(args.path, file_format, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,46 @@
 from fastapi.security import OAuth2PasswordBearer
-from fastapi import APIRouter, Depends, status
+from dataclasses import asdict
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
 from pika import BlockingConnection, ConnectionParameters
-from redis import Redis
-from app.settings import settings
+from redis.asyncio import Redis
 from app.book.domain.entities import BookCreate, BookOut, BookUpdate
-from app.book.service_layer.service import BookService
+from app.book.service_layer.book_import import CONTENT_TYPES, READERS, BookImporter
+from app.book.service_layer.service import BookService, CachedResponse
 from app.db.unit_of_work import UnitOfWork, get_uow
 from app.permissions import permission_required
+from app.infrastructure.edge_cache import LIST_KEY, cache_headers
 from app.infrastructure.mongodb.mongodb import books_collection
+from app.infrastructure.rabbitmq.publish_rabbitmq import book_updates_channel
+from app.infrastructure.redis_registry import get_cache_redis
+from app.settings import settings
+from app.utils.compression import negotiate
+from app.utils.ndjson import ndjson_response
+from app.utils.responses import ORJSONResponse, etag_matches
 
 
 router = APIRouter()
 
-# Initialize Redis and RabbitMQ connections
-# Redis will be used for caching purposes, RabbitMQ for message queuing
-redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB2)
+# Initialize the RabbitMQ connection used for message queuing
+# (Redis, used for caching, comes from the shared connection registry)
 mq_connection = BlockingConnection(ConnectionParameters("localhost"))
+# Channel publishing the book events, opened once rather than by every request
+mq_channel = book_updates_channel(mq_connection)
+
+
+def cached_response(cached: CachedResponse) -> Response:
+    # The cached bytes are returned as they are, already compressed when the client
+    # accepts it, without parsing or compressing them again
+    headers = {"ETag": cached.etag, **cache_headers(cached.keys)}
+    if cached.encoding:
+        headers["Content-Encoding"] = cached.encoding
+    return Response(cached.body, media_type="application/json", headers=headers)
 
 
 # Dependency to inject BookService
 # This ensures that the service used by the routes has access to Redis and RabbitMQ
-def get_book_service():
-    return BookService(cache=redis, mq_connection=mq_connection)
+def get_book_service(cache: Redis = Depends(get_cache_redis)):
+    return BookService(cache=cache, mq_channel=mq_channel)
 
 # Route to create a new book
 @router.post("/", status_code=status.HTTP_201_CREATED)
@@ -38,27 +57,49 @@ async def create_book(
         return {"message": "Book created successfully."}
 
 
-@router.get("/{book_id}", response_model=BookOut)
-# Route to get a book by its ID
-async def get_book(
-    book_id: int,  # The ID of the book
+@router.post("/import")
+# Route to load books in bulk from a CSV or NDJSON request body
+@permission_required(allowed_roles=["admin"])
+async def import_books(
+    request: Request,  # Request carrying the file, read as it arrives
+    cache: Redis = Depends(get_cache_redis),  # Book cache, whose lists get stale
+    uow: UnitOfWork = Depends(get_uow),  # Inject Unit of Work for database transactions
+):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in CONTENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Expected one of: {', '.join(CONTENT_TYPES)}",
+        )
+
+    # Rows are parsed from the body while it is received, a batch at a time
+    rows = READERS[CONTENT_TYPES[content_type]](request.stream())
+    report = await BookImporter(cache).run(rows, uow)
+    return asdict(report)
+
+
+@router.get("/export")
+# Route to download every book as newline-delimited JSON
+@permission_required(allowed_roles=["admin"])
+async def export_books(
+    request: Request,  # Request to access user data
     book_service: BookService = Depends(get_book_service),  # Inject BookService
-    uow: UnitOfWork = Depends(get_uow),  # Inject Unit of Work
+    uow: UnitOfWork = Depends(get_uow),  # Inject Unit of Work, used while streaming
 ):
-    async with uow:  # Ensure that the operation is part of a transaction
-        # Retrieve the book using the book service
-        return await book_service.get_item(book_id, uow)
+    # The transaction is opened by the service while the response is streamed
+    return ndjson_response(book_service.export_items(uow), "books.ndjson")
 
 
 @router.get("/search", response_model=list[BookOut])
 # Route to search for books by title or description
+# (declared before /{book_id}, which would otherwise capture it)
 async def search_books(
     query: str,  # The search query
     skip: int = 0,  # Pagination: how many records to skip
     limit: int = 100,  # Pagination: how many records to return
 ):
     # Create a text index on the 'title' and 'description' fields for searching
-    books_collection.create_index([("title", "text"), ("description", "text")])
+    await books_collection.create_index([("title", "text"), ("description", "text")])
 
     # Perform the search query using MongoDB's text search functionality
     results = (
@@ -71,8 +112,43 @@ async def search_books(
         .limit(limit)  # Limit the number of results to 'limit'
     )
 
-    # Return the search results as a list of BookOut objects
-    return [BookOut(**book) for book in results]
+    # The catalog documents are written from validated books, keyed by the book ID
+    books = []
+    async for book in results:
+        book.pop("score", None)
+        books.append(BookOut.model_construct(id=book.pop("_id"), **book))
+    # The catalog is updated by a consumer of the book events of its own, possibly
+    # after the edge cache was purged, so the proxy only keeps the results briefly
+    return ORJSONResponse(
+        books,
+        headers=cache_headers([LIST_KEY], settings.CATALOG_SEARCH_EDGE_MAX_AGE),
+    )
+
+
+@router.get("/{book_id}", response_model=BookOut)
+# Route to get a book by its ID
+async def get_book(
+    book_id: int,  # The ID of the book
+    if_none_match: Optional[str] = Header(None),  # ETag of the client's copy
+    accept_encoding: Optional[str] = Header(None),  # Compression the client accepts
+    book_service: BookService = Depends(get_book_service),  # Inject BookService
+    uow: UnitOfWork = Depends(get_uow),  # Inject Unit of Work
+):
+    # A client whose copy is current only costs a read of the cached ETag
+    if if_none_match:
+        etag, keys = await book_service.get_item_etag(book_id)
+        if etag and etag_matches(if_none_match, etag):
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                headers={"ETag": etag, **cache_headers(keys)},
+            )
+
+    async with uow:  # Ensure that the operation is part of a transaction
+        # Retrieve the serialized book using the book service
+        cached = await book_service.get_item_body(
+            book_id, uow, negotiate(accept_encoding)
+        )
+    return cached_response(cached)
 
 
 @router.get("/", response_model=list[BookOut])
@@ -80,11 +156,16 @@ async def search_books(
 async def get_all_books(
     skip: int = 0,  # Pagination: how many records to skip
     limit: int = 100,  # Pagination: how many records to return
+    accept_encoding: Optional[str] = Header(None),  # Compression the client accepts
+    book_service: BookService = Depends(get_book_service),  # Inject BookService
     uow: UnitOfWork = Depends(get_uow),  # Inject Unit of Work for database transactions
 ):
     async with uow:  # Ensure that the operation is part of a transaction
-        book_service = get_book_service()  # Get the BookService
-        return await book_service.get_items(uow, skip, limit)  # Retrieve books with pagination
+        # Retrieve the serialized page of books using the book service
+        cached = await book_service.get_items_body(
+            uow, skip, limit, negotiate(accept_encoding)
+        )
+    return cached_response(cached)
 
 
 @router.patch("/{book_id}", response_model=BookOut)
@@ -0,0 +1,297 @@
+import codecs
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Set, Tuple, Union
+from fastapi import HTTPException
+from pydantic import ValidationError
+from redis.asyncio import Redis
+from app.adapters.repositories.author_repo import AuthorRepository
+from app.adapters.repositories.book_repo import BookRepository
+from app.adapters.repositories.genre_repo import GenreRepository
+from app.book.domain.entities import BookCreate
+from app.book.service_layer.service import invalidate_book_lists
+from app.db.unit_of_work import UnitOfWork
+from app.infrastructure.rabbitmq.publish_rabbitmq import publish_book_event
+from app.settings import settings
+
+# Supported import formats
+CSV = "csv"
+NDJSON = "ndjson"
+
+# Formats accepted for each request content type
+CONTENT_TYPES = {
+    "text/csv": CSV,
+    "application/x-ndjson": NDJSON,
+    "application/jsonl": NDJSON,
+}
+
+# Separator of the author IDs within the author_ids column of a CSV file
+CSV_AUTHOR_SEPARATOR = ";"
+
+
+@dataclass
+class ImportReport:
+    """Outcome of a bulk import."""
+
+    imported: int = 0  # Books inserted
+    duplicates: int = 0  # Rows skipped because their ISBN already exists
+    invalid: int = 0  # Rows rejected by validation
+    errors: List[dict] = field(default_factory=list)  # First rejected rows and why
+
+
+@dataclass
+class UnreadableRow:
+    """A row of the file that could not be parsed, rejected like an invalid one."""
+
+    error: str
+
+
+# A row as returned by the readers
+Row = Union[dict, UnreadableRow]
+
+
+def _parse_json_line(line: bytes) -> Row:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        # Malformed JSON, or bytes that aren't UTF-8
+        return UnreadableRow(f"Invalid JSON: {e}")
+
+
+async def read_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Row]:
+    """
+    Parses newline-delimited JSON arriving in arbitrary chunks, one object at a time.
+    A malformed line is returned as an UnreadableRow, so it is reported instead of
+    stopping an import whose earlier batches are already committed.
+
+    :param chunks: The raw bytes of the file.
+    """
+    pending = b""
+    async for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield _parse_json_line(line)
+    if pending.strip():
+        yield _parse_json_line(pending)
+
+
+def _split_complete_records(text: str) -> Tuple[str, str]:
+    # Splits CSV text after its last line break that is outside a quoted field,
+    # quotes being escaped by doubling, an even count means the field is closed
+    quotes = text.count('"')
+    for i in range(len(text) - 1, -1, -1):
+        if text[i] == '"':
+            quotes -= 1
+        elif text[i] == "\n" and quotes % 2 == 0:
+            return text[: i + 1], text[i + 1 :]
+    return "", text
+
+
+def _csv_row(header: List[str], values: List[str]) -> dict:
+    # Empty cells are left out so the schema defaults apply
+    row = {name: value for name, value in zip(header, values) if value != ""}
+    if "author_ids" in row:
+        row["author_ids"] = [
+            author_id.strip()
+            for author_id in row["author_ids"].split(CSV_AUTHOR_SEPARATOR)
+            if author_id.strip()
+        ]
+    return row
+
+
+async def _decode(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[str, bool]]:
+    # Decodes UTF-8 chunks that may split characters, flagging the end of the file
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    async for chunk in chunks:
+        yield decoder.decode(chunk), False
+    yield decoder.decode(b"", final=True), True
+
+
+async def read_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+    """
+    Parses a CSV file with a header row arriving in arbitrary chunks, one row at a time.
+    Author IDs are separated by semicolons within the author_ids column.
+
+    :param chunks: The raw bytes of the file.
+    """
+    header = None
+    pending = ""
+    async for text, final in _decode(chunks):
+        if final:
+            records, pending = pending + text, ""
+        else:
+            records, pending = _split_complete_records(pending + text)
+
+        for values in csv.reader(io.StringIO(records)):
+            if not values:
+                continue
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            yield _csv_row(header, values)
+
+
+READERS = {CSV: read_csv, NDJSON: read_ndjson}
+
+
+class BookImporter:
+    """
+    Loads books in bulk from a stream of rows. Rows are validated with BookCreate and
+    loaded a batch at a time: the referenced authors and genres of a batch are checked
+    with one query each, the books and their author links are written with multi-row
+    inserts, and one event announces the whole batch to the catalog.
+
+    Each batch is committed on its own and existing ISBNs are skipped, so an
+    interrupted import can simply be run again.
+    """
+
+    def __init__(
+        self,
+        cache: Redis,
+        batch_size: int = settings.BOOK_IMPORT_BATCH_SIZE,
+        max_errors: int = settings.BOOK_IMPORT_MAX_ERRORS,
+    ):
+        """
+        Initialize BookImporter with the book cache. The book events are published
+        with aio_pika, so an import run by a request doesn't block the event loop.
+
+        :param cache: Async Redis client of the book cache, whose lists get stale
+        :param batch_size: Number of rows loaded per transaction
+        :param max_errors: Number of rejected rows reported in detail
+        """
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+
+        # Authors and genres already found, so later batches don't look them up again
+        self.author_ids: Set[int] = set()
+        self.genre_ids: Set[int] = set()
+
+    async def run(self, rows: AsyncIterator[Row], uow: UnitOfWork) -> ImportReport:
+        """
+        Import every row.
+
+        :param rows: The rows to import, as parsed by read_csv or read_ndjson
+        :param uow: Unit of Work for database transaction management
+        :return: How many rows were imported, skipped or rejected
+        """
+        report = ImportReport()
+        batch: List[Tuple[int, Row]] = []
+        row_number = 0
+        async with uow:
+            async for row in rows:
+                row_number += 1
+                batch.append((row_number, row))
+                if len(batch) >= self.batch_size:
+                    await self._load(batch, uow, report)
+                    batch = []
+            if batch:
+                await self._load(batch, uow, report)
+        return report
+
+    def _reject(self, report: ImportReport, row_number: int, error: str):
+        report.invalid += 1
+        if len(report.errors) < self.max_errors:
+            report.errors.append({"row": row_number, "error": error})
+
+    def _validate(
+        self, batch: List[Tuple[int, Row]], report: ImportReport
+    ) -> Dict[str, Tuple[int, BookCreate]]:
+        # Validates the rows of a batch, keyed by ISBN keeping the first of each
+        books: Dict[str, Tuple[int, BookCreate]] = {}
+        for row_number, row in batch:
+            if isinstance(row, UnreadableRow):
+                self._reject(report, row_number, row.error)
+                continue
+            try:
+                book = BookCreate.model_validate(row)
+            except ValidationError as e:
+                self._reject(
+                    report,
+                    row_number,
+                    "; ".join(
+                        f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                        for error in e.errors()
+                    ),
+                )
+                continue
+            except HTTPException as e:
+                # Raised by the field validators of the schema
+                self._reject(report, row_number, e.detail)
+                continue
+
+            if book.isbn in books:
+                report.duplicates += 1
+                continue
+            books[book.isbn] = (row_number, book)
+        return books
+
+    async def _resolve_references(self, books: List[BookCreate], uow: UnitOfWork):
+        # Looks up the authors and genres of the batch that were not seen before
+        author_ids = {i for book in books for i in book.author_ids} - self.author_ids
+        if author_ids:
+            repo = uow.get_repository(AuthorRepository)
+            self.author_ids |= await repo.get_existing_ids(author_ids)
+
+        genre_ids = {book.genre_id for book in books} - self.genre_ids
+        if genre_ids:
+            repo = uow.get_repository(GenreRepository)
+            self.genre_ids |= await repo.get_existing_ids(genre_ids)
+
+    async def _load(
+        self, batch: List[Tuple[int, Row]], uow: UnitOfWork, report: ImportReport
+    ):
+        books = self._validate(batch, report)
+        await self._resolve_references([book for _, book in books.values()], uow)
+
+        rows = []
+        for isbn, (row_number, book) in list(books.items()):
+            unknown_authors = set(book.author_ids) - self.author_ids
+            if book.genre_id not in self.genre_ids:
+                self._reject(report, row_number, f"Unknown genre {book.genre_id}")
+            elif unknown_authors:
+                self._reject(
+                    report, row_number, f"Unknown authors {sorted(unknown_authors)}"
+                )
+            else:
+                row = book.model_dump(exclude={"author_ids"})
+                rows.append({**row, "reserved_units": 0})
+                continue
+            del books[isbn]
+
+        repo = uow.get_repository(BookRepository)
+        book_ids = await repo.add_many(rows)
+        await repo.add_author_links(
+            [
+                {"book_id": book_id, "author_id": author_id}
+                for isbn, book_id in book_ids.items()
+                for author_id in set(books[isbn][1].author_ids)
+            ]
+        )
+        await uow.commit()
+
+        report.imported += len(book_ids)
+        report.duplicates += len(rows) - len(book_ids)
+        if book_ids:
+            # The cached pages of the book list are stale, before the event purges
+            # them from the edge cache
+            await invalidate_book_lists(self.cache)
+            await self._publish(
+                [(book_id, books[isbn][1]) for isbn, book_id in book_ids.items()]
+            )
+
+    async def _publish(self, books: List[Tuple[int, BookCreate]]):
+        # A single event carries the whole batch to the catalog
+        await publish_book_event(
+            {
+                "event_type": "books_imported",
+                "books": [
+                    {"book_id": book_id, "book_data": book.model_dump()}
+                    for book_id, book in books
+                ],
+            }
+        )
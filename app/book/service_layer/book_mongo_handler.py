@@ -1,4 +1,5 @@
-from typing import Any
+from typing import Any, List
+from pymongo.errors import BulkWriteError
 
 
 class MongoDBHandler:
@@ -10,6 +11,14 @@ class MongoDBHandler:
         # Insert a new book document into the MongoDB collection
         self.books_collection.insert_one(book_data)
 
+    async def handle_books_imported(self, books: List[dict]):
+        # Insert a batch of imported books, unordered so the documents already
+        # inserted by an earlier delivery of the same batch don't stop the others
+        try:
+            await self.books_collection.insert_many(books, ordered=False)
+        except BulkWriteError as e:
+            print(f"Skipped {len(e.details['writeErrors'])} imported books: {e}")
+
     def handle_book_updated(self, book_data: dict):
         book_id = book_data.pop("id", None)
         if book_id:
@@ -1,13 +1,98 @@
 import json
 import pickle
-from typing import List, Optional
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
 from fastapi import HTTPException, Response, status
-from pika import BlockingConnection
-from redis import Redis
+from pika.adapters.blocking_connection import BlockingChannel
+from redis.asyncio import Redis
 from app.adapters.repositories.author_repo import AuthorRepository
 from app.adapters.repositories.book_repo import BookRepository
 from app.book.domain.entities import Book, BookCreate, BookOut, BookUpdate
 from app.db.unit_of_work import UnitOfWork
+from app.infrastructure.edge_cache import LIST_KEY, book_key
+from app.infrastructure.rabbitmq.publish_rabbitmq import BOOK_UPDATES_EXCHANGE
+from app.settings import settings
+from app.utils.compression import ENCODINGS, compress
+from app.utils.ndjson import from_entity
+from app.utils.responses import dumps, loads, make_etag
+
+
+def book_cache_key(id: int) -> str:
+    # Hash holding the response body of a book ("body"), its compressed variants ("br",
+    # "gzip"), its ETag ("etag") and its surrogate keys ("keys")
+    return f"book:{id}:response"
+
+
+def book_generation_key(id: int) -> str:
+    # Generation of a book's cached response, bumped once a change to the book is
+    # committed. A response built from the book read before the change isn't cached
+    # once the generation it was read under is stale.
+    return f"book:{id}:generation"
+
+
+async def invalidate_book(cache: Redis, id: int):
+    """
+    Drops the cached response of a book, after it was updated or deleted. Its
+    generation is bumped in the same transaction, so a response built concurrently
+    from the old book can't be cached again afterwards.
+
+    :param cache: The Redis client of the book cache.
+    :param id: The ID of the book.
+    """
+    async with cache.pipeline(transaction=True) as pipe:
+        pipe.incr(book_generation_key(id))
+        pipe.delete(book_cache_key(id))
+        await pipe.execute()
+
+
+# Generation of the cached pages of the book list, bumped once a change to the books is
+# committed. Pages are cached under the generation read before the books were, so
+# the pages of earlier generations are never read again, and expire on their own.
+LIST_GENERATION_KEY = "books:generation"
+
+
+def book_list_cache_key(generation: int, skip: int, limit: int) -> str:
+    # Hash holding a page of the book list, with the same fields as a book's
+    return f"books:{generation}:{skip}:{limit}:response"
+
+
+async def invalidate_book_lists(cache: Redis):
+    """
+    Makes every cached page of the book list stale, after books were created,
+    updated or deleted.
+
+    :param cache: The Redis client of the book cache.
+    """
+    await cache.incr(LIST_GENERATION_KEY)
+
+
+# Caches a response only if the generation it was built under (ARGV[1]) is still the
+# one in KEYS[2], replacing the hash KEYS[1] with the field/value pairs following its
+# TTL in seconds (ARGV[2]). Returns 1 if it was cached, 0 if it was stale.
+CACHE_RESPONSE_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+return 1
+"""
+
+
+class CachedResponse(NamedTuple):
+    # A serialized response as it is cached, in the content coding it is sent with
+    body: bytes
+    etag: str
+    keys: List[str]
+    encoding: Optional[str]  # None when the body isn't compressed
 
 
 class BookService:
@@ -17,17 +102,18 @@ class BookService:
     and a message queue (RabbitMQ) for efficient processing and event-driven design.
     """
 
-    def __init__(self, cache: Redis, mq_connection: BlockingConnection):
+    def __init__(self, cache: Redis, mq_channel: BlockingChannel):
         """
-        Initialize BookService with Redis cache and RabbitMQ connection.
+        Initialize BookService with Redis cache and RabbitMQ channel. It is built for
+        every request, so it only keeps them: the channel is opened, and its exchange
+        declared, once (see book_updates_channel).
 
-        :param cache: Redis instance for caching book data
-        :param mq_connection: RabbitMQ connection for publishing book events
+        :param cache: Async Redis client for caching book data
+        :param mq_channel: RabbitMQ channel for publishing book events
         """
         self.cache = cache
-        self.mq_connection = mq_connection
-        self.mq_channel = self.mq_connection.channel()
-        self.mq_channel.queue_declare(queue="book_updates")
+        self._cache_response = self.cache.register_script(CACHE_RESPONSE_SCRIPT)
+        self.mq_channel = mq_channel
 
     async def create_item(
         self, new_book: BookCreate, uow: UnitOfWork
@@ -62,18 +148,35 @@ class BookService:
         )
         await repo.add(book_data)
 
-        self.mq_channel.basic_publish(
-            exchange="",
-            routing_key="book_updates",
-            body=json.dumps(
-                {
-                    "event_type": "book_created",
-                    "book_id": book_data.id,
-                    "book_data": new_book.model_dump(),
-                }
-            ),
+        uow.on_commit(lambda: invalidate_book_lists(self.cache))
+        self._publish_on_commit(
+            uow,
+            {
+                "event_type": "book_created",
+                "book_id": book_data.id,
+                "book_data": new_book.model_dump(),
+            },
         )
 
+    def _publish_on_commit(self, uow: UnitOfWork, event: dict):
+        """
+        Publish a book event once the transaction is committed, after the cached
+        responses it makes stale were dropped. Its consumers (the catalog, the edge
+        cache purges) then never see a change that was rolled back, nor read the
+        books before the change is visible.
+
+        :param uow: Unit of Work of the change
+        :param event: The event, serialized now, before the commit expires the entities
+        """
+        body = json.dumps(event)
+
+        async def publish():
+            self.mq_channel.basic_publish(
+                exchange=BOOK_UPDATES_EXCHANGE, routing_key="", body=body
+            )
+
+        uow.on_commit(publish)
+
     async def get_authors_by_ids(self, uow: UnitOfWork, author_ids: List[int]):
         """
         Retrieve authors by their IDs.
@@ -85,60 +188,181 @@ class BookService:
         repo = uow.get_repository(AuthorRepository)
         return await repo.get_by_ids(author_ids)
 
-    async def get_item(self, id: int, uow: UnitOfWork) -> Book | BookOut:
+    async def get_item(self, id: int, uow: UnitOfWork) -> BookOut:
         """
         Retrieve a book by its ID. Uses caching for performance improvement.
 
+        Cached books come from the database, not from a client, so they are rebuilt
+        without validating them against the input constraints again.
+
         :param id: Book ID
         :param uow: Unit of Work for database transaction management
-        :return: Book or BookOut object
+        :return: BookOut object
         """
-        cache_key = f"book:{id}"
-        cached_book = self.cache.get(cache_key)
-        if cached_book:
-            return BookOut(**json.loads(cached_book))
+        cached = await self.get_item_body(id, uow)
+        return BookOut.model_construct(**loads(cached.body))
 
-        repo = uow.get_repository(BookRepository)
-        result = await repo.get(id)
-        if not result:
-            raise HTTPException(status_code=404, detail="Book not found")
+    async def get_item_body(
+        self, id: int, uow: UnitOfWork, encoding: Optional[str] = None
+    ) -> CachedResponse:
+        """
+        Retrieve the serialized response of a book, its ETag and its surrogate keys,
+        so they can be returned as they are. They are cached together, in one hash.
 
-        author_ids = await repo.get_author_ids_from_books(id)
-        result.author_ids = author_ids
+        :param id: Book ID
+        :param uow: Unit of Work for database transaction management
+        :param encoding: Content coding accepted by the client, if any
+        :return: The cached response of the book
+        """
 
-        book_dict = {c.name: getattr(result, c.name) for c in result.__table__.columns}
-        book_dict["author_ids"] = author_ids
-        self.cache.set(cache_key, json.dumps(book_dict), ex=10080)
-        return result
+        async def build():
+            repo = uow.get_repository(BookRepository)
+            book = await repo.get(id)
+            if not book:
+                raise HTTPException(status_code=404, detail="Book not found")
+
+            author_ids = await repo.get_author_ids_by_book_ids([id])
+            body = dumps(from_entity(BookOut, book, author_ids=author_ids.get(id, [])))
+            return body, [book_key(id)]
+
+        return await self._cached_response(
+            book_cache_key(id), encoding, build, book_generation_key(id)
+        )
 
-    async def get_items(
-        self, uow: UnitOfWork, skip: int, limit: int
-    ) -> List[Book] | list[BookOut]:
+    async def get_item_etag(self, id: int) -> Tuple[Optional[str], List[str]]:
+        """
+        Retrieve the ETag and the surrogate keys of a cached book, reading only
+        those fields of its hash.
+
+        :param id: Book ID
+        :return: The ETag, or None if the book isn't cached, and the surrogate keys
+        """
+        etag, keys = await self.cache.hmget(book_cache_key(id), "etag", "keys")
+        if etag is None:
+            return None, []
+        return etag.decode(), keys.decode().split() if keys else []
+
+    async def get_items(self, uow: UnitOfWork, skip: int, limit: int) -> List[BookOut]:
         """
         Retrieve a paginated list of books. Uses caching for improved performance.
 
         :param uow: Unit of Work for database transaction management
         :param skip: Number of records to skip
         :param limit: Maximum number of records to return
-        :return: List of Book or BookOut objects
+        :return: List of BookOut objects
         """
-        cache_key = f"books:{skip}:{limit}"
-        cached_books = self.cache.get(cache_key)
-        if cached_books:
-            return [BookOut(**book) for book in json.loads(cached_books)]
+        cached = await self.get_items_body(uow, skip, limit)
+        return [BookOut.model_construct(**book) for book in loads(cached.body)]
 
-        repo = uow.get_repository(BookRepository)
-        result = await repo.get_book_list(skip, limit)
-        if not result:
-            raise HTTPException(status_code=404, detail="No books found")
+    async def get_items_body(
+        self, uow: UnitOfWork, skip: int, limit: int, encoding: Optional[str] = None
+    ) -> CachedResponse:
+        """
+        Retrieve the serialized response of a page of books, so it can be returned
+        as it is. The author IDs of the page are fetched with a single query.
 
-        for book in result:
-            book.author_ids = await repo.get_author_ids_from_books(book.id)
+        :param uow: Unit of Work for database transaction management
+        :param skip: Number of records to skip
+        :param limit: Maximum number of records to return
+        :param encoding: Content coding accepted by the client, if any
+        :return: The cached response of the page
+        """
 
-        self.cache.set(
-            cache_key, json.dumps([book.to_dict() for book in result]), ex=10080
+        async def build():
+            repo = uow.get_repository(BookRepository)
+            books = await repo.get_book_list(skip, limit)
+            if not books:
+                raise HTTPException(status_code=404, detail="No books found")
+
+            author_ids = await repo.get_author_ids_by_book_ids(
+                book.id for book in books
+            )
+            body = dumps(
+                [
+                    from_entity(BookOut, book, author_ids=author_ids.get(book.id, []))
+                    for book in books
+                ]
+            )
+            return body, [LIST_KEY]
+
+        # Read before the books, so a page built from books changed meanwhile is
+        # cached under a generation that is already stale
+        generation = int(await self.cache.get(LIST_GENERATION_KEY) or 0)
+        return await self._cached_response(
+            book_list_cache_key(generation, skip, limit),
+            encoding,
+            build,
+            LIST_GENERATION_KEY,
+            generation,
         )
-        return result
+
+    async def _cached_response(
+        self,
+        cache_key: str,
+        encoding: Optional[str],
+        build: Callable[[], Awaitable[Tuple[bytes, List[str]]]],
+        generation_key: str,
+        generation: Optional[int] = None,
+    ) -> CachedResponse:
+        """
+        Read a cached response in the content coding accepted by the client, reading
+        only that variant of the body. On a miss the response is built, and cached
+        with its compressed variants, so hits are never compressed again, unless
+        what it was built from changed meanwhile.
+
+        :param cache_key: Key of the hash holding the response
+        :param encoding: Content coding accepted by the client, if any
+        :param build: Coroutine function returning the body and its surrogate keys
+        :param generation_key: Key of the generation the response is cached under
+        :param generation: The generation, if already read before the build
+        :return: The cached response
+        """
+        body, etag, keys = await self.cache.hmget(
+            cache_key, encoding or "body", "etag", "keys"
+        )
+        if etag is not None and keys is not None:
+            if body is None and encoding is not None:
+                # Too small to be worth compressing, cached only as it is
+                body, encoding = await self.cache.hget(cache_key, "body"), None
+            if body is not None:
+                return CachedResponse(
+                    body, etag.decode(), keys.decode().split(), encoding
+                )
+
+        if generation is None:
+            # Read before the build, as the generation of the book list
+            generation = int(await self.cache.get(generation_key) or 0)
+        body, keys = await build()
+        entry = {"body": body, "etag": make_etag(body), "keys": " ".join(keys)}
+        if len(body) >= settings.COMPRESSION_MINIMUM_SIZE:
+            for coding in ENCODINGS:
+                entry[coding] = compress(body, coding, cached=True)
+        fields = [item for pair in entry.items() for item in pair]
+        await self._cache_response(
+            keys=[cache_key, generation_key], args=[generation, 10080, *fields]
+        )
+        if encoding not in entry:
+            encoding = None
+        return CachedResponse(entry[encoding or "body"], entry["etag"], keys, encoding)
+
+    async def export_items(self, uow: UnitOfWork) -> AsyncIterator[BookOut]:
+        """
+        Stream every book for a bulk export, reading the database batch by batch.
+        The author IDs of each batch are fetched with a single query.
+
+        :param uow: Unit of Work for database transaction management
+        :return: Async iterator of BookOut objects
+        """
+        async with uow:
+            repo = uow.get_repository(BookRepository)
+            async for books in repo.stream(settings.EXPORT_BATCH_SIZE):
+                author_ids = await repo.get_author_ids_by_book_ids(
+                    book.id for book in books
+                )
+                for book in books:
+                    yield from_entity(
+                        BookOut, book, author_ids=author_ids.get(book.id, [])
+                    )
 
     async def update_item(self, id: int, book_data: BookUpdate, uow: UnitOfWork):
         """
@@ -150,26 +374,31 @@ class BookService:
         :return: Updated Book object
         """
         repo = uow.get_repository(BookRepository)
-        old_book = await repo.get(id)
-        if not old_book:
+        book = await repo.update_returning(
+            id, **book_data.model_dump(exclude_unset=True, exclude={"author_ids"})
+        )
+        if not book:
             raise HTTPException(status_code=404, detail="Book not found")
 
-        result = await repo.update(id, book_data)
-        if not result:
-            raise HTTPException(status_code=404, detail="Book update failed")
-
-        result.author_ids = await repo.get_author_ids_from_books(id)
-
-        self.mq_channel.basic_publish(
-            exchange="",
-            routing_key="book_updates",
-            body=json.dumps(
-                {
-                    "event_type": "book_updated",
-                    "book_id": id,
-                    "book_data": result.model_dump(),
-                }
-            ),
+        if book_data.author_ids is not None:
+            await repo.set_author_ids(id, book_data.author_ids)
+            author_ids = sorted(set(book_data.author_ids))
+        else:
+            author_ids = (await repo.get_author_ids_by_book_ids([id])).get(id, [])
+
+        # Built before the commit expires the returned entity
+        result = from_entity(BookOut, book, author_ids=author_ids)
+        # Its cached response and ETag are stale once the change is committed (dropped
+        # before, a concurrent read could cache the old book again until it expires)
+        uow.on_commit(lambda: invalidate_book(self.cache, id))
+        uow.on_commit(lambda: invalidate_book_lists(self.cache))
+        self._publish_on_commit(
+            uow,
+            {
+                "event_type": "book_updated",
+                "book_id": id,
+                "book_data": result.model_dump(),
+            },
         )
         return result
 
@@ -182,16 +411,11 @@ class BookService:
         :return: HTTP response confirming deletion
         """
         repo = uow.get_repository(BookRepository)
-        book = await repo.get(id)
-        if not book:
+        if not await repo.delete_book_by_id(id):
             raise HTTPException(status_code=404, detail="Book not found")
-
-        await repo.remove(book)
-
-        self.mq_channel.basic_publish(
-            exchange="",
-            routing_key="book_updates",
-            body=json.dumps({"event_type": "book_deleted", "book_id": id}),
-        )
+        # Dropped once the deletion is committed, as in update_item
+        uow.on_commit(lambda: invalidate_book(self.cache, id))
+        uow.on_commit(lambda: invalidate_book_lists(self.cache))
+        self._publish_on_commit(uow, {"event_type": "book_deleted", "book_id": id})
 
         return Response("Book deleted successfully", status_code=status.HTTP_200_OK)
@@ -1,8 +1,33 @@
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 from abc import ABC, abstractmethod
-from typing import Type
+from typing import Awaitable, Callable, List, Type
 
 from app.db.database import SessionLocal
+from app.exceptions import ConcurrencyConflictError
+
+# Key of the entity memo in the info dictionary of a session
+MEMO_KEY = "entity_memo"
+
+
+def get_memo(session: AsyncSession | Session) -> dict:
+    """
+    Returns the memo of the current transaction of a session, holding the entities
+    (or their absence) already looked up, keyed by (entity class, key).
+
+    :param session: The session of the transaction.
+    """
+    return session.info.setdefault(MEMO_KEY, {})
+
+
+# The memo only holds within a transaction: committed entities are expired, and rolled
+# back ones (including those of a savepoint) may no longer exist
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_soft_rollback")
+def clear_memo(session: Session, *args):
+    session.info.pop(MEMO_KEY, None)
 
 
 # Abstract base class defining the essential methods for UnitOfWork
@@ -32,6 +57,11 @@ class AbstractUnitOfWork(ABC):
         # Flush the session to apply the changes to the database
         raise NotImplementedError
 
+    @abstractmethod
+    def on_commit(self, callback: Callable[[], Awaitable]):
+        # Run a callback once the current transaction is committed
+        raise NotImplementedError
+
 
 # Concrete implementation of the UnitOfWork pattern
 class UnitOfWork(AbstractUnitOfWork):
@@ -39,6 +69,12 @@ class UnitOfWork(AbstractUnitOfWork):
         # Initialize with an asynchronous session from the SessionLocal factory
         self.session: AsyncSession = SessionLocal()
         self.repositories = {}  # Cache of repository instances for reuse
+        self.commit_callbacks: List[Callable[[], Awaitable]] = []
+
+    @property
+    def memo(self) -> dict:
+        # Entities already looked up in the current transaction, see get_memo
+        return get_memo(self.session)
 
     def get_repository(self, repo_class):
         # Retrieve a repository, creating it if it hasn't been created yet
@@ -46,16 +82,44 @@ class UnitOfWork(AbstractUnitOfWork):
             self.repositories[repo_class] = repo_class(self.session)
         return self.repositories[repo_class]
 
+    def on_commit(self, callback: Callable[[], Awaitable]):
+        """
+        Runs a callback once the current transaction is committed, for side effects
+        outside the database (Redis, RabbitMQ) that must not happen when it is rolled
+        back. The callbacks run in the order they were added, and are dropped if the
+        commit fails or the transaction is rolled back.
+
+        Entities are expired by the commit, so the callback must not read them: the
+        values it needs are read when it is added.
+
+        :param callback: The function returning the awaitable to run.
+        """
+        self.commit_callbacks.append(callback)
+
     async def commit(self):
-        # Commit the session to persist all changes made during the session
-        await self.session.commit()
+        # Commit the session to persist all changes made during the session,
+        # a versioned row changed by another transaction meanwhile is a conflict
+        callbacks, self.commit_callbacks = self.commit_callbacks, []
+        try:
+            await self.session.commit()
+        except StaleDataError:
+            raise ConcurrencyConflictError()
+
+        # Side effects of the committed transaction
+        for callback in callbacks:
+            await callback()
 
     async def flush(self):
         # Flush the session to apply changes to the database (without committing)
-        await self.session.flush()
+        try:
+            await self.session.flush()
+        except StaleDataError:
+            raise ConcurrencyConflictError()
 
     async def rollback(self):
         # Rollback the session, undoing all changes made since the last commit
+        # (and dropping their side effects)
+        self.commit_callbacks.clear()
         await self.session.rollback()
 
     async def refresh(self, item):
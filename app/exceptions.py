@@ -2,7 +2,9 @@ from fastapi import HTTPException
 from starlette.status import (
     HTTP_404_NOT_FOUND,
     HTTP_400_BAD_REQUEST,
+    HTTP_409_CONFLICT,
     HTTP_500_INTERNAL_SERVER_ERROR,
+    HTTP_503_SERVICE_UNAVAILABLE,
 )
 
 
@@ -57,3 +59,27 @@ class DatabaseError(HTTPException):
             status_code=HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Database error: {message}",
         )
+
+
+# Custom exception for when a worker pool is saturated and sheds load
+class ServiceOverloadedError(HTTPException):
+    """Raised when a request is rejected because the server is overloaded."""
+
+    def __init__(self, detail: str, retry_after: int = 1):
+        # Initializes the exception with a 503 status code and a Retry-After hint
+        super().__init__(
+            status_code=HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+# Custom exception for when a row kept changing under an optimistic update
+class ConcurrencyConflictError(HTTPException):
+    """Raised when an entity was modified concurrently and the change couldn't be applied."""
+
+    def __init__(
+        self, detail: str = "The resource was modified concurrently. Please try again."
+    ):
+        # Initializes the exception with a 409 status code so the client can retry
+        super().__init__(status_code=HTTP_409_CONFLICT, detail=detail)
@@ -0,0 +1,252 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Set
+import httpx
+
+
+class DispatcherOverloadedError(Exception):
+    """Raised when the dispatcher queue is full and the caller asked not to wait."""
+
+
+@dataclass
+class SmsMessage:
+    """A single SMS waiting in the dispatcher queue."""
+
+    phone_number: str
+    message: str
+
+
+@dataclass
+class ProviderConfig:
+    """
+    Connection and throttling settings of one SMS provider.
+
+    :param name: Name used in logs.
+    :param url: Endpoint used to send a single message.
+    :param bulk_url: Endpoint of the provider bulk-send API, if it has one.
+    :param api_key: API key sent with every request.
+    :param max_concurrency: Maximum number of in-flight requests to the provider.
+    :param rate_per_second: Sustained number of messages per second the provider accepts.
+    :param burst: Number of messages that can be sent at once before throttling kicks in.
+    :param bulk_size: Maximum number of messages per bulk request.
+    """
+
+    name: str
+    url: str
+    bulk_url: Optional[str] = None
+    api_key: str = ""
+    max_concurrency: int = 10
+    rate_per_second: float = 50.0
+    burst: int = 100
+    bulk_size: int = 100
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        """
+        Token bucket used to keep the send rate of a provider under its limit.
+
+        :param rate: Number of tokens added per second.
+        :param capacity: Maximum number of tokens the bucket holds.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    async def acquire(self, tokens: int = 1):
+        """
+        Waits until `tokens` tokens can be taken from the bucket.
+
+        Requests larger than the capacity wait for a full bucket and leave it in
+        debt, so the long-term rate is still respected.
+
+        :param tokens: Number of tokens to take.
+        """
+        needed = min(tokens, self.capacity)
+        self._refill()
+        while self.tokens < needed:
+            await asyncio.sleep((needed - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= tokens
+
+
+class SmsDispatcher:
+    def __init__(self, providers: List[ProviderConfig], queue_size: int = 10000):
+        """
+        Asynchronous SMS dispatcher for notification traffic.
+
+        Messages are buffered in a bounded in-memory queue and drained by one
+        worker per provider over a shared, persistent HTTP connection pool. Each
+        worker enforces the concurrency and rate limits of its provider and
+        groups messages into bulk requests when the provider supports them.
+
+        :param providers: The providers messages can be sent through.
+        :param queue_size: Maximum number of messages waiting to be sent.
+        """
+        self.providers = providers
+        self.queue: asyncio.Queue[SmsMessage] = asyncio.Queue(maxsize=queue_size)
+        self.client: Optional[httpx.AsyncClient] = None
+        self.workers: List[asyncio.Task] = []
+        self.in_flight: Set[asyncio.Task] = set()  # Sends of every worker
+        self.sent = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self.workers)
+
+    async def start(self):
+        """
+        Opens the HTTP connection pool and starts one worker per provider.
+        """
+        if self.running:
+            return
+        max_connections = sum(provider.max_concurrency for provider in self.providers)
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=httpx.Timeout(10.0),
+        )
+        self.workers = [
+            asyncio.create_task(self._work(provider)) for provider in self.providers
+        ]
+
+    async def stop(self, drain_timeout: float = 10.0, send_timeout: float = 10.0):
+        """
+        Waits for queued messages to be sent, then stops the workers and closes the pool.
+        Sends still in flight once the queue drained or the drain timed out are waited
+        for before the pool is closed, those that don't finish in time are cancelled
+        and counted as failed.
+
+        :param drain_timeout: Maximum number of seconds to wait for the queue to drain.
+        :param send_timeout: Maximum number of seconds to wait for the sends in flight.
+        """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"SMS dispatcher stopped with {self.queue.qsize()} messages unsent")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+        if self.in_flight:
+            _, pending = await asyncio.wait(self.in_flight, timeout=send_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        await self.client.aclose()
+        self.client = None
+
+    async def submit(self, phone_number: str, message: str):
+        """
+        Queues a message, waiting for room if the queue is full.
+
+        :param phone_number: The phone number to send the SMS to.
+        :param message: The message content.
+        """
+        await self.queue.put(SmsMessage(phone_number, message))
+
+    def submit_nowait(self, phone_number: str, message: str):
+        """
+        Queues a message, failing fast if the queue is full.
+
+        :param phone_number: The phone number to send the SMS to.
+        :param message: The message content.
+        :raises DispatcherOverloadedError: If the queue is full.
+        """
+        try:
+            self.queue.put_nowait(SmsMessage(phone_number, message))
+        except asyncio.QueueFull:
+            raise DispatcherOverloadedError("SMS dispatcher queue is full")
+
+    async def submit_many(self, messages: Iterable[tuple[str, str]]):
+        """
+        Queues several messages, applying backpressure while the queue is full.
+
+        :param messages: (phone_number, message) pairs to send.
+        """
+        for phone_number, message in messages:
+            await self.queue.put(SmsMessage(phone_number, message))
+
+    async def _work(self, provider: ProviderConfig):
+        # Worker loop: takes a batch from the queue, waits for rate and concurrency
+        # budget, then sends the batch in the background
+        semaphore = asyncio.Semaphore(provider.max_concurrency)
+        bucket = TokenBucket(provider.rate_per_second, provider.burst)
+        batch_size = provider.bulk_size if provider.bulk_url else 1
+
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            try:
+                await bucket.acquire(len(batch))
+                await semaphore.acquire()
+            except asyncio.CancelledError:
+                # Stopped while the batch waited for its budget
+                self._drop(provider, batch)
+                raise
+            task = asyncio.create_task(self._send(provider, batch, semaphore))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    def _drop(self, provider: ProviderConfig, batch: List[SmsMessage]):
+        self.failed += len(batch)
+        print(f"{provider.name} dropped {len(batch)} SMS: the dispatcher stopped")
+
+    async def _send(
+        self, provider: ProviderConfig, batch: List[SmsMessage], semaphore
+    ):
+        try:
+            if provider.bulk_url:
+                response = await self.client.post(
+                    provider.bulk_url,
+                    json={
+                        "messages": [
+                            {"to": sms.phone_number, "message": sms.message}
+                            for sms in batch
+                        ],
+                        "api_key": provider.api_key,
+                    },
+                )
+            else:
+                sms = batch[0]
+                response = await self.client.post(
+                    provider.url,
+                    json={
+                        "to": sms.phone_number,
+                        "message": sms.message,
+                        "api_key": provider.api_key,
+                    },
+                )
+            response.raise_for_status()
+            self.sent += len(batch)
+        except httpx.HTTPError as e:
+            self.failed += len(batch)
+            print(f"{provider.name} failed to send {len(batch)} SMS: {e}")
+        except asyncio.CancelledError:
+            # Still in flight when the dispatcher stopped
+            self._drop(provider, batch)
+            raise
+        finally:
+            semaphore.release()
+            for _ in batch:
+                self.queue.task_done()
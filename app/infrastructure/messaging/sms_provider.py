@@ -1,32 +1,63 @@
 # app/adapters/sms_provider.py
-import requests
+from app.infrastructure.messaging.dispatcher import ProviderConfig, SmsDispatcher
 from app.settings import settings
 
+# Dispatcher sending notification SMS through the configured provider
+sms_dispatcher = SmsDispatcher(
+    [
+        ProviderConfig(
+            name="default",
+            url=settings.SMS_API_URL,
+            bulk_url=settings.SMS_BULK_API_URL,
+            api_key=settings.SMS_API_KEY,
+            max_concurrency=settings.SMS_MAX_CONCURRENCY,
+            rate_per_second=settings.SMS_RATE_LIMIT_PER_SECOND,
+            burst=settings.SMS_RATE_LIMIT_BURST,
+            bulk_size=settings.SMS_BULK_SIZE,
+        )
+    ],
+    queue_size=settings.SMS_QUEUE_SIZE,
+)
 
-def send_sms(phone_number: str, message: str):
+
+async def start_sms_dispatcher():
+    """
+    Starts the SMS dispatcher workers if an SMS provider is configured.
+    """
+    if settings.SMS_API_URL:
+        await sms_dispatcher.start()
+
+
+async def stop_sms_dispatcher():
+    """
+    Sends the messages still queued and stops the SMS dispatcher.
     """
-    Sends an SMS to the specified phone number using an SMS provider API.
+    await sms_dispatcher.stop()
 
-    This function is an example of how to integrate with an SMS service. Currently,
-    the actual API call is commented out. When active, it sends a POST request to the
-    SMS API with the phone number, message, and API key.
+
+async def send_sms(phone_number: str, message: str):
+    """
+    Queues an SMS to the specified phone number for the SMS dispatcher.
+
+    The call only waits for room in the dispatcher queue, never for the HTTP
+    round-trip to the provider. While no provider is configured, the message
+    is dropped.
 
     :param phone_number: The phone number to send the SMS to.
     :param message: The message content to send in the SMS.
     """
-    # Example using an SMS provider API
-    # payload = {
-    #     "to": phone_number,
-    #     "message": message,
-    #     "api_key": settings.SMS_API_KEY,
-    # }
-    # response = requests.post(settings.SMS_API_URL, data=payload)
+    if not sms_dispatcher.running:
+        return  # No SMS provider configured, nothing is sent.
+    await sms_dispatcher.submit(phone_number, message)
 
-    # Uncomment the lines above to send the actual request when the provider is available.
 
-    # if response.status_code == 200:
-    #     print(f"SMS sent successfully to {phone_number}")
-    # else:
-    #     print(f"Failed to send SMS to {phone_number}")
+async def send_bulk_sms(messages: list[tuple[str, str]]):
+    """
+    Queues a batch of SMS messages for the SMS dispatcher, which groups them into
+    bulk requests when the provider supports them.
 
-    pass  # The function is currently not sending SMS, it's a placeholder.
+    :param messages: A list of (phone_number, message) pairs to send.
+    """
+    if not sms_dispatcher.running:
+        return  # No SMS provider configured, nothing is sent.
+    await sms_dispatcher.submit_many(messages)
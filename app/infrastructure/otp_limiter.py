@@ -1,6 +1,17 @@
-import time
+import math
 import redis.asyncio as redis
 from fastapi import HTTPException
+from app.infrastructure.rate_limiter import (
+    RateLimitResult,
+    RateLimitWindow,
+    SlidingWindowRateLimiter,
+)
+
+# OTP limits: 5 requests in any 2 minutes and 10 requests in any hour
+OTP_WINDOWS = [
+    RateLimitWindow(limit=5, period=120),
+    RateLimitWindow(limit=10, period=3600),
+]
 
 
 class RateLimiter:
@@ -8,53 +19,34 @@ class RateLimiter:
         """
         Initialize the rate limiter with a Redis client and a key prefix.
 
-        :param redis_client: Redis client instance.
+        :param redis_client: Async Redis client instance.
         :param key_prefix: Prefix to use for Redis keys to uniquely identify rate limits for each user.
         """
-        self.redis = redis_client
-        self.key_prefix = key_prefix
+        self.limiter = SlidingWindowRateLimiter(redis_client, key_prefix, OTP_WINDOWS)
 
-    async def is_allowed(self, user_id: int):
+    async def is_allowed(self, user_id: int) -> RateLimitResult:
         """
         Check if the user has exceeded the rate limit for OTP requests.
 
-        It checks two different time windows:
+        Both windows are checked and updated atomically in a single Redis round-trip:
         - 2 minutes for a limit of 5 requests.
         - 1 hour for a limit of 10 requests.
 
         :param user_id: Unique identifier for the user whose rate limit is being checked.
+        :return: The outcome of the check, with the remaining quota.
         :raises HTTPException: If the user has exceeded the rate limit.
         """
-        now = int(time.time())
-
-        # Redis keys to track request counts in the last 2 minutes and 1 hour
-        two_minute_key = f"{self.key_prefix}:{user_id}:2min"
-        one_hour_key = f"{self.key_prefix}:{user_id}:1hour"
+        result = await self.limiter.hit(user_id)
 
-        # Get the number of OTP requests made by the user in the last 2 minutes and 1 hour
-        two_minute_count = self.redis.get(two_minute_key) or 0
-        one_hour_count = self.redis.get(one_hour_key) or 0
-
-        # Check if the user has exceeded the 2-minute limit (5 requests)
-        if int(two_minute_count) >= 5:
+        if not result.allowed:
+            retry_after = math.ceil(result.retry_after)
             raise HTTPException(
                 status_code=429,
-                detail="Too many OTP requests. Try again after 2 minutes.",
+                detail=f"Too many OTP requests. Try again after {retry_after} seconds.",
+                headers={"Retry-After": str(retry_after)},
             )
 
-        # Check if the user has exceeded the 1-hour limit (10 requests)
-        if int(one_hour_count) >= 10:
-            raise HTTPException(
-                status_code=429, detail="Too many OTP requests. Try again after 1 hour."
-            )
-
-        # Increment the request count for the user in both time windows
-        self.redis.incr(two_minute_key)
-        self.redis.incr(one_hour_key)
-
-        # Set time-to-live (TTL) for the keys so they expire after the specified time windows
-        self.redis.expire(two_minute_key, 120)  # 2 minutes
-        self.redis.expire(one_hour_key, 3600)  # 1 hour
+        return result
 
     async def reset(self, user_id: int):
         """
@@ -64,6 +56,4 @@ class RateLimiter:
 
         :param user_id: Unique identifier for the user to reset the rate limit.
         """
-        # Delete the keys tracking the request counts in the last 2 minutes and 1 hour
-        self.redis.delete(f"{self.key_prefix}:{user_id}:2min")
-        self.redis.delete(f"{self.key_prefix}:{user_id}:1hour")
+        await self.limiter.reset(user_id)
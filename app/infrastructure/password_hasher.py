@@ -0,0 +1,118 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from prometheus_client import Counter, Histogram
+from app.exceptions import ServiceOverloadedError
+from app.settings import settings
+from app.user.service_layer.utils import get_password_hash, verify_password
+
+QUEUE_WAIT = Histogram(
+    "password_hash_queue_wait_seconds",
+    "Time password hashing jobs wait for a free worker process.",
+    ["operation"],
+)
+DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "Time spent hashing or verifying a password in a worker process.",
+    ["operation"],
+)
+REJECTED = Counter(
+    "password_hash_rejected_total",
+    "Password hashing jobs rejected because too many were already pending.",
+    ["operation"],
+)
+
+
+def _run(func, *args):
+    # Runs in the worker process and reports when the job started and how long it took
+    started_at = time.time()
+    result = func(*args)
+    return started_at, time.time() - started_at, result
+
+
+class PasswordHasher:
+    def __init__(self, workers: Optional[int] = None, max_pending: int = 64):
+        """
+        Runs bcrypt hashing and verification in a pool of worker processes.
+
+        bcrypt is deliberately slow, so running it inline blocks the event loop and
+        stalls every other request on the worker. Jobs are sent to a process pool
+        sized to the CPU cores instead, and at most `max_pending` of them may be
+        queued or running at once: beyond that new jobs are rejected immediately
+        with a 503, so a login storm cannot build an unbounded backlog.
+
+        :param workers: Number of worker processes, defaults to the number of CPU cores.
+        :param max_pending: Maximum number of jobs queued or running at once.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.pending = 0
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    async def _submit(self, operation: str, func, *args):
+        if self.pending >= self.max_pending:
+            REJECTED.labels(operation).inc()
+            raise ServiceOverloadedError(
+                "Too many login requests, try again shortly."
+            )
+
+        # The pool is started on first use so importing this module spawns nothing
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        self.pending += 1
+        submitted_at = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            started_at, duration, result = await loop.run_in_executor(
+                self.executor, _run, func, *args
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. killed by the OOM killer): start a fresh pool next time
+            self.executor = None
+            raise
+        finally:
+            self.pending -= 1
+
+        QUEUE_WAIT.labels(operation).observe(max(started_at - submitted_at, 0))
+        DURATION.labels(operation).observe(duration)
+        return result
+
+    async def hash(self, password: str) -> str:
+        """
+        Hashes a password in a worker process.
+
+        :param password: The plain password.
+        :return: The bcrypt hash of the password.
+        :raises ServiceOverloadedError: If too many jobs are already pending.
+        """
+        return await self._submit("hash", get_password_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """
+        Checks a password against its hash in a worker process.
+
+        :param password: The plain password.
+        :param hashed_password: The stored bcrypt hash.
+        :return: Whether the password matches the hash.
+        :raises ServiceOverloadedError: If too many jobs are already pending.
+        """
+        return await self._submit("verify", verify_password, password, hashed_password)
+
+    def shutdown(self):
+        """
+        Stops the worker processes.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+
+# Password hasher shared by every request of this worker
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
@@ -7,6 +7,7 @@ from app.adapters.repositories.book_repo import BookRepository
 from app.adapters.repositories.customer_repo import CustomerRepository
 from app.reservation.service_layer.event_handler import (
     send_reservation_reminder_handler,
+    send_reservation_reminders_handler,
 )
 from app.reservation.service_layer.reservation_services import ReservationService
 
@@ -17,8 +18,8 @@ async def consume_event():
 
     This function connects to RabbitMQ, listens for events related to reservations,
     and processes them accordingly. It handles different event types such as
-    "reservation_cancelled" and "reservation_ending_soon", executing the respective
-    business logic.
+    "reservation_cancelled", "reservation_ending_soon" and "reservation_reminders_due",
+    executing the respective business logic.
     """
 
     async def callback(message: aio_pika.IncomingMessage):
@@ -59,11 +60,16 @@ async def consume_event():
                         )
 
                     # Process the reservation cancellation queue
-                    await ReservationService.process_queue(customer, book, days=7)
+                    await ReservationService(uow).process_queue(customer, book, days=7)
+                    await uow.commit()
 
             # Handle the "reservation_ending_soon" event
             elif event_type == "reservation_ending_soon":
                 await send_reservation_reminder_handler(event_data)
+
+            # Handle a window of due reminders popped from the timer wheel
+            elif event_type == "reservation_reminders_due":
+                await send_reservation_reminders_handler(event_data.get("reminders"))
             else:
                 print(f"Unknown event type: {event_type}")
 
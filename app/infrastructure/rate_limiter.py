@@ -0,0 +1,219 @@
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Sequence
+import redis.asyncio as redis
+
+# Sliding-window log evaluated atomically over several windows. KEYS holds one sorted
+# set per window; ARGV holds now (ms), a unique member, the cost, then a
+# (limit, period in ms) pair per window. The request is recorded in every window only
+# if all of them have room for it. Returns {allowed, remaining, retry_after_ms}.
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local member = ARGV[2]
+local cost = tonumber(ARGV[3])
+local allowed = 1
+local remaining = -1
+local retry_after = 0
+
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[2 + i * 2])
+    local period = tonumber(ARGV[3 + i * 2])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - period)
+    local count = redis.call('ZCARD', key)
+    if count + cost > limit then
+        allowed = 0
+        -- Time until enough of the oldest entries leave the window
+        local index = math.max(count + cost - limit - 1, 0)
+        local oldest = redis.call('ZRANGE', key, index, index, 'WITHSCORES')
+        if oldest[2] then
+            retry_after = math.max(retry_after, tonumber(oldest[2]) + period - now)
+        else
+            retry_after = math.max(retry_after, period)
+        end
+    end
+    local left = limit - count
+    if remaining < 0 or left < remaining then
+        remaining = left
+    end
+end
+
+if allowed == 1 then
+    for i, key in ipairs(KEYS) do
+        local period = tonumber(ARGV[3 + i * 2])
+        for n = 1, cost do
+            redis.call('ZADD', key, now, member .. ':' .. n)
+        end
+        redis.call('PEXPIRE', key, period)
+    end
+    remaining = remaining - cost
+end
+
+return {allowed, math.max(remaining, 0), retry_after}
+"""
+
+# Token bucket stored in a hash. ARGV holds now (ms), the refill rate (tokens per
+# second), the capacity, the cost of this request and a debt of requests already
+# served from an in-process lease, which is charged unconditionally first.
+# Returns {allowed, remaining, retry_after_ms, reset_after_ms}.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2]) / 1000
+local capacity = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local debt = tonumber(ARGV[5])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(now - updated_at, 0) * rate)
+-- Settling the lease may overdraw the bucket, but never by more than a full bucket
+tokens = math.max(tokens - debt, -capacity)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    allowed = 1
+    tokens = tokens - cost
+else
+    retry_after = math.ceil((cost - tokens) / rate)
+end
+
+local reset_after = math.ceil((capacity - tokens) / rate)
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', now)
+redis.call('PEXPIRE', KEYS[1], math.max(reset_after, 1))
+
+return {allowed, math.max(math.floor(tokens), 0), retry_after, reset_after}
+"""
+
+
+@dataclass(frozen=True)
+class RateLimitWindow:
+    """A limit of `limit` requests within any `period` seconds."""
+
+    limit: int
+    period: int
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    """
+    Outcome of a rate limit check.
+
+    :param allowed: Whether the request fits in every window.
+    :param remaining: Requests left in the most constrained window.
+    :param retry_after: Seconds until the request would be allowed (0 when allowed).
+    :param reset_after: Seconds until the quota is fully restored.
+    """
+
+    allowed: bool
+    remaining: int
+    retry_after: float
+    reset_after: float = 0.0
+
+
+class SlidingWindowRateLimiter:
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        key_prefix: str,
+        windows: Sequence[RateLimitWindow],
+    ):
+        """
+        Sliding-window rate limiter evaluating several windows in one Redis round-trip.
+
+        Each window keeps a log of request timestamps in a sorted set, so limits are
+        exact over any period rather than per fixed bucket. All windows are checked
+        and updated by a single Lua script, which makes concurrent checks race-free.
+
+        :param redis_client: Async Redis client instance.
+        :param key_prefix: Prefix to use for Redis keys to uniquely identify each limit.
+        :param windows: The windows a request must fit in to be allowed.
+        """
+        self.redis = redis_client
+        self.key_prefix = key_prefix
+        self.windows = list(windows)
+        self._script = self.redis.register_script(SLIDING_WINDOW_SCRIPT)
+
+    def _keys(self, identifier) -> list[str]:
+        return [
+            f"{self.key_prefix}:{identifier}:{window.period}s"
+            for window in self.windows
+        ]
+
+    async def hit(self, identifier, cost: int = 1) -> RateLimitResult:
+        """
+        Records a request for the identifier if every window allows it.
+
+        :param identifier: The entity being limited (user ID, IP address, ...).
+        :param cost: Number of requests to record.
+        :return: The outcome of the check, with the remaining quota and retry-after.
+        """
+        args = [int(time.time() * 1000), secrets.token_hex(8), cost]
+        for window in self.windows:
+            args += [window.limit, window.period * 1000]
+        allowed, remaining, retry_after = await self._script(
+            keys=self._keys(identifier), args=args
+        )
+        return RateLimitResult(
+            allowed=bool(allowed), remaining=remaining, retry_after=retry_after / 1000
+        )
+
+    async def reset(self, identifier):
+        """
+        Clears every window of the identifier.
+
+        :param identifier: The entity whose limits should be reset.
+        """
+        await self.redis.delete(*self._keys(identifier))
+
+
+class TokenBucketRateLimiter:
+    def __init__(
+        self, redis_client: redis.Redis, key_prefix: str, rate: float, burst: int
+    ):
+        """
+        Token bucket rate limiter evaluated in one Redis round-trip.
+
+        The bucket holds up to `burst` tokens and refills at `rate` tokens per second,
+        so clients may burst briefly but are held to the sustained rate.
+
+        :param redis_client: Async Redis client instance.
+        :param key_prefix: Prefix to use for Redis keys to uniquely identify each bucket.
+        :param rate: Number of tokens added per second.
+        :param burst: Maximum number of tokens the bucket holds.
+        """
+        self.redis = redis_client
+        self.key_prefix = key_prefix
+        self.rate = rate
+        self.burst = burst
+        self._script = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def hit(self, identifier, cost: int = 1, debt: int = 0) -> RateLimitResult:
+        """
+        Takes `cost` tokens from the bucket of the identifier if it has enough.
+
+        :param identifier: The entity being limited (user ID, IP address, ...).
+        :param cost: Number of tokens the request needs.
+        :param debt: Tokens already spent without asking Redis, charged before the check.
+        :return: The outcome of the check, with the remaining tokens and retry-after.
+        """
+        allowed, remaining, retry_after, reset_after = await self._script(
+            keys=[f"{self.key_prefix}:{identifier}"],
+            args=[int(time.time() * 1000), self.rate, self.burst, cost, debt],
+        )
+        return RateLimitResult(
+            allowed=bool(allowed),
+            remaining=remaining,
+            retry_after=retry_after / 1000,
+            reset_after=reset_after / 1000,
+        )
+
+    async def reset(self, identifier):
+        """
+        Refills the bucket of the identifier.
+
+        :param identifier: The entity whose limit should be reset.
+        """
+        await self.redis.delete(f"{self.key_prefix}:{identifier}")
@@ -0,0 +1,146 @@
+from typing import Dict, Iterable
+import redis.asyncio as redis
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import REGISTRY
+from app.settings import settings
+
+# Logical Redis databases, each served by its own connection pool
+OTP = "otp"  # OTPs, rate limits, token revocation, principals and circuit breakers
+RESERVATION = "reservation"  # Reservation queues and the reminder timer wheel
+CACHE = "cache"  # Cached book data
+
+
+class RedisRegistry:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        databases: Dict[str, int],
+        max_connections: int = 50,
+        pool_timeout: float = 5.0,
+        health_check_interval: int = 30,
+        socket_timeout: float = 5.0,
+        binary: Iterable[str] = (),
+    ):
+        """
+        Owns one async Redis connection pool per logical database.
+
+        Every component asks the registry for the client of its purpose instead of
+        creating its own, so connections are reused across requests and the number of
+        open connections is bounded per database. A command finding its pool full waits
+        for a connection to be released rather than failing.
+
+        :param host: The Redis server host.
+        :param port: The Redis server port.
+        :param databases: The Redis database number of each purpose.
+        :param max_connections: Maximum number of connections of each pool.
+        :param pool_timeout: Seconds to wait for a free connection before a command fails.
+        :param health_check_interval: Seconds a connection may stay idle before it is pinged on reuse.
+        :param socket_timeout: Seconds to wait for Redis before a command fails.
+        :param binary: Purposes whose replies are bytes instead of decoded strings.
+        """
+        self.databases = databases
+        self.max_connections = max_connections
+        self.pools: Dict[str, redis.BlockingConnectionPool] = {
+            purpose: redis.BlockingConnectionPool(
+                host=host,
+                port=port,
+                db=db,
+                max_connections=max_connections,
+                timeout=pool_timeout,
+                health_check_interval=health_check_interval,
+                socket_timeout=socket_timeout,
+                socket_connect_timeout=socket_timeout,
+                decode_responses=purpose not in binary,
+            )
+            for purpose, db in databases.items()
+        }
+        self.clients: Dict[str, redis.Redis] = {
+            purpose: redis.Redis(connection_pool=pool)
+            for purpose, pool in self.pools.items()
+        }
+
+    def client(self, purpose: str) -> redis.Redis:
+        """
+        Returns the client of a purpose, backed by the shared pool of its database.
+
+        :param purpose: One of OTP, RESERVATION or CACHE.
+        """
+        return self.clients[purpose]
+
+    async def health_check(self) -> Dict[str, bool]:
+        """
+        Pings every database.
+
+        :return: Whether each purpose's database answered.
+        """
+        health = {}
+        for purpose, client in self.clients.items():
+            try:
+                health[purpose] = await client.ping()
+            except redis.RedisError as e:
+                print(f"Redis {purpose} database is unavailable: {e}")
+                health[purpose] = False
+        return health
+
+    async def close(self):
+        """
+        Closes every connection of every pool.
+        """
+        for pool in self.pools.values():
+            await pool.disconnect()
+
+    def collect(self):
+        # Prometheus collector reporting the state of each pool when metrics are scraped
+        in_use = GaugeMetricFamily(
+            "redis_pool_connections_in_use",
+            "Connections of each Redis pool currently checked out.",
+            labels=["purpose"],
+        )
+        idle = GaugeMetricFamily(
+            "redis_pool_connections_idle",
+            "Open connections of each Redis pool waiting to be reused.",
+            labels=["purpose"],
+        )
+        limit = GaugeMetricFamily(
+            "redis_pool_max_connections",
+            "Maximum number of connections of each Redis pool.",
+            labels=["purpose"],
+        )
+        for purpose, pool in self.pools.items():
+            in_use.add_metric([purpose], len(pool._in_use_connections))
+            idle.add_metric([purpose], len(pool._available_connections))
+            limit.add_metric([purpose], pool.max_connections)
+        return [in_use, idle, limit]
+
+
+# Registry shared by the whole application
+redis_registry = RedisRegistry(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    databases={
+        OTP: settings.REDIS_DB0,
+        RESERVATION: settings.REDIS_DB1,
+        CACHE: settings.REDIS_DB2,
+    },
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    pool_timeout=settings.REDIS_POOL_TIMEOUT,
+    health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    # Cached responses are kept as bytes, the compressed ones included
+    binary=(CACHE,),
+)
+REGISTRY.register(redis_registry)
+
+
+# FastAPI dependencies providing the client of each purpose
+def get_otp_redis() -> redis.Redis:
+    return redis_registry.client(OTP)
+
+
+def get_reservation_redis() -> redis.Redis:
+    return redis_registry.client(RESERVATION)
+
+
+def get_cache_redis() -> redis.Redis:
+    return redis_registry.client(CACHE)
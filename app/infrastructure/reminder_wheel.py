@@ -0,0 +1,85 @@
+import json
+from datetime import datetime
+from typing import List, Optional
+import redis.asyncio as redis
+from app.infrastructure.redis_registry import RESERVATION, redis_registry
+
+# Atomically pops up to ARGV[2] members whose score (due time) is <= ARGV[1]
+# together with their payloads, so concurrent pollers never see the same entry twice.
+POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #due == 0 then
+    return {}
+end
+redis.call('ZREM', KEYS[1], unpack(due))
+local payloads = redis.call('HMGET', KEYS[2], unpack(due))
+redis.call('HDEL', KEYS[2], unpack(due))
+return payloads
+"""
+
+
+class ReminderWheel:
+    def __init__(self, redis_client: redis.Redis, key_prefix: str):
+        """
+        Timer wheel for reservation reminders backed by a Redis sorted set.
+
+        Each reminder is stored as a member of the sorted set scored by its due
+        timestamp, and its payload is kept in a companion hash so it can be
+        cancelled by reservation ID.
+
+        :param redis_client: Async Redis client instance.
+        :param key_prefix: Prefix used for the sorted set and payload hash keys.
+        """
+        self.redis = redis_client
+        self.schedule_key = f"{key_prefix}:schedule"
+        self.payload_key = f"{key_prefix}:payloads"
+        self._pop_due = self.redis.register_script(POP_DUE_SCRIPT)
+
+    async def schedule(self, reservation_id: int, due_at: datetime, payload: dict):
+        """
+        Schedules (or reschedules) the reminder of a reservation.
+
+        :param reservation_id: The ID of the reservation the reminder belongs to.
+        :param due_at: The time at which the reminder becomes due.
+        :param payload: The event data to hand to the poller once the reminder is due.
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.payload_key, reservation_id, json.dumps(payload))
+            pipe.zadd(self.schedule_key, {reservation_id: due_at.timestamp()})
+            await pipe.execute()
+
+    async def cancel(self, *reservation_ids: int):
+        """
+        Cancels the reminders of reservations, those that are scheduled.
+
+        :param reservation_ids: The IDs of the reservations whose reminders are dropped.
+        """
+        if not reservation_ids:
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.schedule_key, *reservation_ids)
+            pipe.hdel(self.payload_key, *reservation_ids)
+            await pipe.execute()
+
+    async def pop_due(
+        self, batch_size: int, now: Optional[datetime] = None
+    ) -> List[dict]:
+        """
+        Removes and returns up to `batch_size` reminders that are due.
+
+        :param batch_size: Maximum number of reminders to pop.
+        :param now: Reference time, defaults to the current time.
+        :return: The payloads of the popped reminders, ordered by due time.
+        """
+        now = now or datetime.now()
+        payloads = await self._pop_due(
+            keys=[self.schedule_key, self.payload_key],
+            args=[now.timestamp(), batch_size],
+        )
+        return [json.loads(payload) for payload in payloads if payload]
+
+
+# Reminders share the Redis database used for the reservation queue
+reminder_wheel = ReminderWheel(
+    redis_registry.client(RESERVATION), "reservation_reminders"
+)
@@ -0,0 +1,325 @@
+import math
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+import redis.asyncio as redis
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.infrastructure.rate_limiter import RateLimitResult, TokenBucketRateLimiter
+from app.permissions import decode_token
+from app.settings import settings
+from app.utils.compression import StreamCompressor, compress, is_compressible, negotiate
+from app.utils.ttl_cache import TTLCache
+
+# Paths that are never rate limited (monitoring and API docs)
+EXEMPT_PATHS = ("/metrics", "/docs", "/redoc", "/openapi.json")
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """
+    Token bucket limit applied to a group of routes.
+
+    :param name: Name of the route group, also used in the Redis keys.
+    :param rate: Sustained number of requests per second allowed per client.
+    :param burst: Number of requests a client can make at once.
+    :param path: Regular expression matched against the request path (None matches every path).
+    :param methods: HTTP methods the policy applies to (None matches every method).
+    """
+
+    name: str
+    rate: float
+    burst: int
+    path: Optional[str] = None
+    methods: Optional[frozenset] = None
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods is not None and method not in self.methods:
+            return False
+        return self.path is None or re.fullmatch(self.path, path) is not None
+
+
+@dataclass
+class _Lease:
+    # Tokens granted to this worker for local use and how many were used so far
+    granted: int
+    used: int
+    # Quota reported by Redis when the lease was granted
+    remaining: int
+    reset_after: float
+    expires_at: float
+
+
+def default_rate_limit_policies() -> List[RateLimitPolicy]:
+    """
+    Builds the route-group policies from the settings. The first matching policy applies,
+    so the list ends with a catch-all default.
+    """
+    return [
+        RateLimitPolicy(
+            "search",
+            settings.RATE_LIMIT_SEARCH_PER_SECOND,
+            settings.RATE_LIMIT_SEARCH_BURST,
+            path=r"/books/search/?",
+            methods=frozenset({"GET"}),
+        ),
+        RateLimitPolicy(
+            "catalog",
+            settings.RATE_LIMIT_CATALOG_PER_SECOND,
+            settings.RATE_LIMIT_CATALOG_BURST,
+            path=r"/books(/.*)?",
+            methods=frozenset({"GET"}),
+        ),
+        RateLimitPolicy(
+            "reserve",
+            settings.RATE_LIMIT_RESERVE_PER_SECOND,
+            settings.RATE_LIMIT_RESERVE_BURST,
+            path=r"/reservations/reserve/?",
+        ),
+        RateLimitPolicy(
+            "default",
+            settings.RATE_LIMIT_DEFAULT_PER_SECOND,
+            settings.RATE_LIMIT_DEFAULT_BURST,
+        ),
+    ]
+
+
+class RateLimitMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        redis_client: redis.Redis,
+        policies: List[RateLimitPolicy],
+        lease_fraction: float = 0.1,
+        lease_ttl: float = 1.0,
+        max_clients: int = 10000,
+    ):
+        """
+        ASGI middleware applying per-client token bucket limits to every HTTP request.
+
+        Clients are identified by the user ID in their JWT, or by IP address when the
+        request is anonymous. The bucket of each (route group, client) pair lives in
+        Redis so limits hold across workers.
+
+        To avoid a Redis call for clients that are clearly under their limit, each
+        check that leaves plenty of quota grants this worker a small lease: a fraction
+        of the remaining tokens it may hand out locally for a short time. Requests
+        served from the lease are charged to the Redis bucket on the next check, so
+        the overshoot is bounded by the lease size per worker.
+
+        If Redis is unavailable requests are let through, so an outage of the limiter
+        does not take the API down with it.
+
+        :param app: The ASGI application to protect.
+        :param redis_client: Async Redis client holding the token buckets.
+        :param policies: Route-group policies, the first matching one applies.
+        :param lease_fraction: Fraction of the remaining tokens granted as a local lease.
+        :param lease_ttl: Number of seconds a local lease stays valid.
+        :param max_clients: Maximum number of clients whose leases are kept in memory.
+        """
+        self.app = app
+        self.policies = policies
+        self.limiters = {
+            policy.name: TokenBucketRateLimiter(
+                redis_client, f"rate_limit:{policy.name}", policy.rate, policy.burst
+            )
+            for policy in policies
+        }
+        self.lease_fraction = lease_fraction
+        self.lease_ttl = lease_ttl
+        # Leases outlive their validity so the requests they served can still be charged
+        self.leases: TTLCache[_Lease] = TTLCache(max_clients, ttl=max(lease_ttl, 60))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        policy = self._policy_for(scope["method"], scope["path"])
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        result = await self._check(policy, self._identify(scope))
+        if result is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {
+            "RateLimit-Limit": str(policy.burst),
+            "RateLimit-Remaining": str(result.remaining),
+            "RateLimit-Reset": str(math.ceil(result.reset_after)),
+        }
+
+        # Rejecting the request before it reaches the routes and the database
+        if not result.allowed:
+            headers["Retry-After"] = str(math.ceil(result.retry_after))
+            response = JSONResponse(
+                {"detail": "Too many requests"}, status_code=429, headers=headers
+            )
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    def _policy_for(self, method: str, path: str) -> Optional[RateLimitPolicy]:
+        return next(
+            (policy for policy in self.policies if policy.matches(method, path)), None
+        )
+
+    def _identify(self, scope: Scope) -> str:
+        # Authenticated clients are limited per user, anonymous ones per IP address
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value.decode("latin-1")
+                if authorization.startswith("Bearer "):
+                    try:
+                        token_data = decode_token(authorization.split(" ")[1])
+                    except HTTPException:
+                        break
+                    if token_data.id is not None:
+                        return f"user:{token_data.id}"
+                break
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def _check(
+        self, policy: RateLimitPolicy, identity: str
+    ) -> Optional[RateLimitResult]:
+        key = (policy.name, identity)
+        now = time.monotonic()
+
+        # Serving the request from the local lease while it lasts
+        lease = self.leases.get(key)
+        if lease is not None and lease.expires_at > now and lease.used < lease.granted:
+            lease.used += 1
+            return RateLimitResult(
+                allowed=True,
+                remaining=max(lease.remaining - lease.used, 0),
+                retry_after=0.0,
+                reset_after=lease.reset_after,
+            )
+
+        # Detaching the lease before awaiting, so concurrent requests don't charge it twice
+        debt = 0
+        if lease is not None:
+            debt = lease.used
+            self.leases.pop(key)
+
+        try:
+            result = await self.limiters[policy.name].hit(identity, debt=debt)
+        except redis.RedisError as e:
+            print(f"Rate limiter unavailable, letting the request through: {e}")
+            return None
+
+        # Granting a lease only when the client is clearly under its limit
+        granted = int(result.remaining * self.lease_fraction) if result.allowed else 0
+        if granted > 0:
+            self.leases.set(
+                key,
+                _Lease(
+                    granted=granted,
+                    used=0,
+                    remaining=result.remaining,
+                    reset_after=result.reset_after,
+                    expires_at=now + self.lease_ttl,
+                ),
+            )
+        return result
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        """
+        ASGI middleware compressing JSON, NDJSON and text responses with brotli or
+        gzip, as negotiated from the Accept-Encoding header of the request.
+
+        A response sent in one message is compressed whole, when it is at least
+        `minimum_size` bytes. A streamed response (e.g. an NDJSON export) is
+        compressed chunk by chunk as it is sent. Responses already encoded, such as
+        the pre-compressed catalog pages, are passed through.
+
+        :param app: The ASGI application whose responses are compressed.
+        :param minimum_size: Smallest body, in bytes, worth compressing.
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor: Optional[StreamCompressor] = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                passthrough = "content-encoding" in headers or not is_compressible(
+                    headers.get("content-type", "")
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    # Held back until the body shows whether it is worth compressing
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is not None:
+                # The next chunks of a streamed response
+                chunk = compressor.compress(body)
+                if not more_body:
+                    chunk += compressor.finish()
+                await send({**message, "body": chunk})
+                return
+
+            headers = MutableHeaders(scope=start)
+            if not more_body:
+                # The whole body at once
+                if len(body) >= self.minimum_size:
+                    body = compress(body, encoding)
+                    self._encoded(headers, encoding)
+                    headers["Content-Length"] = str(len(body))
+                await send(start)
+                await send({**message, "body": body})
+                return
+
+            # The first chunk of a streamed response
+            compressor = StreamCompressor(encoding)
+            self._encoded(headers, encoding)
+            del headers["Content-Length"]
+            await send(start)
+            await send({**message, "body": compressor.compress(body)})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _encoded(headers: MutableHeaders, encoding: str):
+        headers["Content-Encoding"] = encoding
+        if "accept-encoding" not in headers.get("vary", "").lower():
+            headers.add_vary_header("Accept-Encoding")
+        # The compressed bytes differ from those a strong ETag identifies
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
@@ -1,11 +1,20 @@
+import hashlib
+import time
 from fastapi import status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
+from redis.exceptions import RedisError
 from starlette.requests import Request
 from functools import wraps
 from jose import jwt
 from jose.exceptions import JWTError
+from app.adapters.repositories.principal_repo_redis import principal_repo
+from app.adapters.repositories.user_repo import AuthRepository
+from app.db.unit_of_work import UnitOfWork
+from app.infrastructure.redis_registry import OTP, redis_registry
 from app.settings import settings
-from app.user.domain.entities import TokenData
+from app.user.domain.entities import Principal, TokenData
+from app.user.service_layer.utils import ACCESS_TOKEN_LIFETIME
+from app.utils.ttl_cache import TTLCache
 
 # Get the secret key and algorithm from the settings
 SECRET_KEY = settings.SECRET_KEY
@@ -14,16 +23,32 @@ ALGORITHM = settings.ALGORITHM
 # OAuth2PasswordBearer is used to extract the token from the Authorization header
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Redis client holding revoked tokens, shared by all workers
+redis_client = redis_registry.client(OTP)
+
+# Claims of tokens whose signature was already verified by this worker, keyed by token hash.
+# Each entry holds the claims and when the token was last checked against the revocation list.
+token_cache: TTLCache[list] = TTLCache(
+    settings.TOKEN_CACHE_SIZE, ttl=ACCESS_TOKEN_LIFETIME.total_seconds()
+)
+
+
+# Function to hash a token so raw tokens are never used as cache or Redis keys
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
 
 # Function to decode the JWT token and return the associated data
 def decode_token(token: str):
+    # Verifying the signature only the first time this worker sees the token
+    key = token_hash(token)
+    entry = token_cache.get(key)
+    if entry is not None:
+        return entry[0]
+
     try:
         # Decode the token using the SECRET_KEY and ALGORITHM
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        # Return the TokenData object with the necessary information
-        return TokenData(
-            id=payload.get("id"), username=payload.get("sub"), role=payload.get("role")
-        )
     except JWTError:
         # If decoding fails, raise an unauthorized exception
         raise HTTPException(
@@ -31,6 +56,115 @@ def decode_token(token: str):
             detail="Invalid token",
         )
 
+    # Return the TokenData object with the necessary information
+    token_data = TokenData(
+        id=payload.get("id"),
+        username=payload.get("sub"),
+        role=payload.get("role"),
+        customer_id=payload.get("customer_id"),
+        subscription_model=payload.get("subscription_model"),
+        issued_at=payload.get("iat"),
+        expires_at=payload.get("exp"),
+    )
+
+    # Caching the claims until the token expires
+    if token_data.expires_at is not None:
+        token_cache.set(
+            key, [token_data, 0.0], ttl=token_data.expires_at - time.time()
+        )
+    return token_data
+
+
+# Function to verify a token and make sure it has not been revoked
+async def verify_token(token: str) -> TokenData:
+    token_data = decode_token(token)
+    key = token_hash(token)
+
+    # Tokens are checked against the revocation list at most once per interval per worker
+    entry = token_cache.get(key)
+    now = time.time()
+    interval = settings.TOKEN_REVOCATION_CHECK_INTERVAL_MS / 1000
+    if entry is not None and now - entry[1] < interval:
+        return token_data
+
+    # A single round-trip covers both the token itself and every token of the user
+    try:
+        revoked, revoked_before = await redis_client.mget(
+            f"revoked_token:{key}", f"tokens_revoked_before:{token_data.id}"
+        )
+    except RedisError as e:
+        print(f"Token revocation list unavailable: {e}")
+        return token_data
+
+    if revoked or (
+        revoked_before and (token_data.issued_at or 0) < float(revoked_before)
+    ):
+        token_cache.pop(key)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+        )
+
+    if entry is not None:
+        entry[1] = now
+    return token_data
+
+
+# Function to resolve the user behind a verified token, rejecting deleted and deactivated users
+async def resolve_principal(
+    token_data: TokenData, uow: UnitOfWork | None = None
+) -> Principal:
+    if not token_data.id or not token_data.username:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+        )
+
+    # Resolving the principal from the cache, falling back to the database
+    principal = await principal_repo.get(token_data.id)
+    if principal is None:
+        async with uow or UnitOfWork() as uow:
+            repo = uow.get_repository(AuthRepository)
+            user = await repo.get_by_id(token_data.id)
+            if not user:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Could not validate credentials",
+                )
+            principal = Principal(
+                id=user.id,
+                username=user.username,
+                role=user.role,
+                is_active=user.is_active,
+            )
+        await principal_repo.add(principal)
+
+    if principal.is_active is False:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Inactive user"
+        )
+    return principal
+
+
+# Function to revoke a single token until it expires (e.g. on logout)
+async def revoke_token(token: str):
+    token_data = decode_token(token)
+    key = token_hash(token)
+    token_cache.pop(key)
+    ttl = int((token_data.expires_at or time.time()) - time.time())
+    if ttl > 0:
+        await redis_client.set(f"revoked_token:{key}", 1, ex=ttl)
+
+
+# Function to revoke every token issued to a user so far (e.g. after a role change)
+async def revoke_user_tokens(user_id: int):
+    # Tokens issued before now are rejected until the longest-lived of them expires
+    await redis_client.set(
+        f"tokens_revoked_before:{user_id}",
+        time.time(),
+        ex=int(ACCESS_TOKEN_LIFETIME.total_seconds()),
+    )
+
 
 # Permission check decorator that verifies the user's role or if they are the current user
 def permission_required(allowed_roles=None, allow_current_user=False):
@@ -46,15 +180,22 @@ def permission_required(allowed_roles=None, allow_current_user=False):
             # Extract the actual token from the header
             token = token.split(" ")[1]
             # Decode the token to get user information
-            token_data = decode_token(token)
+            token_data = await verify_token(token)
 
             if not token_data:
                 # If the token data is invalid, raise an error
                 raise HTTPException(status_code=401, detail="Invalid token")
 
-            # If the `allow_current_user` flag is set, assign the user ID to the request state
+            # The user must still exist and be active (served from the principal cache,
+            # which is invalidated when the user is updated or deleted)
+            await resolve_principal(token_data)
+
+            # If the `allow_current_user` flag is set, assign the user ID (and the customer
+            # claims, None if the token doesn't carry them) to the request state
             if allow_current_user:
                 request.state.user_id = token_data.id
+                request.state.customer_id = token_data.customer_id
+                request.state.subscription_model = token_data.subscription_model
 
             # If `allowed_roles` is provided, ensure that the user's role matches one of the allowed roles
             if allowed_roles and token_data.role not in allowed_roles:
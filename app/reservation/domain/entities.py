@@ -1,4 +1,3 @@
-from fastapi import HTTPException
 from pydantic import BaseModel, Field
 from datetime import datetime, timedelta
 import pytz
@@ -18,6 +17,7 @@ class Customer:
     subscription_model: str
     subscription_end_time: datetime
     wallet_money_amount: int
+    version: int
 
     def __init__(
         self,
@@ -73,44 +73,62 @@ class Customer:
             self.id, self.user_id, self.subscription_model, self.wallet_money_amount
         )
 
-    def charge_wallet(self, amount: int):
-        """Increases the wallet balance by the given amount."""
-        self.wallet_money_amount += amount
-
-    def upgrade_subscription(self, new_model: str):
-        """Handles upgrading the customer's subscription model."""
-        pre_wallet_amount = self.wallet_money_amount
-        pre_subscription_model = self.subscription_model
-        iran_timezone = pytz.timezone("Asia/Tehran")
-        now = datetime.now(iran_timezone)
-
+    def subscription_upgrade_cost(self, new_model: str) -> int:
+        """Returns the cost of upgrading to the given subscription model."""
         cost_mapping = {
             ("free", "plus"): 50000,
             ("plus", "premium"): 150000,
             ("free", "premium"): 200000,
         }
-        duration = timedelta(days=30)
 
-        cost = cost_mapping.get((pre_subscription_model, new_model))
+        cost = cost_mapping.get((self.subscription_model, new_model))
         if cost is None:
             raise ValueError("Invalid subscription upgrade path")
+        return cost
 
-        if pre_wallet_amount < cost:
-            raise HTTPException(status_code=400, detail="Insufficient wallet balance")
+    def apply_subscription_upgrade(self, new_model: str):
+        """Switches to the given subscription model for the next 30 days (once paid for)."""
+        iran_timezone = pytz.timezone("Asia/Tehran")
+        now = datetime.now(iran_timezone)
+        duration = timedelta(days=30)
 
-        self.wallet_money_amount -= cost
         self.subscription_model = new_model
         self.subscription_end_time = now + duration
 
-    def deduct_from_wallet(self, amount):
-        """Deducts a specified amount from the wallet balance."""
-        self.wallet_money_amount -= amount
+
+class WalletEntry:
+    """
+    Represents a movement of a customer's wallet. Entries are only ever appended, the
+    balance is the customer's wallet_money_amount plus the entries not yet compacted.
+    """
+
+    id: int
+    customer_id: int
+    amount: int
+    reason: str
+    compacted: bool
+    created_at: datetime
+
+    def __init__(self, customer_id: int, amount: int, reason: str):
+        self.customer_id = customer_id
+        self.amount = amount
+        self.reason = reason
+        self.compacted = False
 
 
 from typing import Optional
 from enum import Enum
 
 
+class CustomerContext(BaseModel):
+    """Customer fields needed by reservations, taken from the access token when it carries them."""
+
+    id: int = Field(..., description="Customer ID", example=1)
+    subscription_model: str = Field(
+        ..., description="Customer's subscription model", example="plus"
+    )
+
+
 class CustomerBase(BaseModel):
     """Base schema for customer data."""
 
@@ -1,39 +1,80 @@
 from datetime import datetime, timedelta
+from typing import List
 from app.adapters.repositories.reservation_repo import ReservationRepository
 from app.db.unit_of_work import UnitOfWork
 from app.infrastructure.rabbitmq.publish_rabbitmq import publish_event
+from app.infrastructure.reminder_wheel import reminder_wheel
+from app.settings import settings
 
+# How long before the end of a reservation the customer gets reminded
+REMINDER_LEAD_TIME = timedelta(days=1)
 
-# Asynchronous function to check if any active reservation is ending soon
-async def check_reservations_ending_soon():
 
-    # Using UnitOfWork to ensure all database operations are executed within a transaction
-    async with UnitOfWork() as uow:
+# Function to build the "ending soon" reminder of a reservation
+def reservation_reminder(reservation) -> dict:
 
-        # Getting the ReservationRepository to interact with reservation data
-        repo = uow.get_repository(ReservationRepository)
+    # Preparing the event to notify the customer about the reservation ending soon
+    return {
+        "event_type": "reservation_ending_soon",  # Event type
+        "reservation_id": reservation.id,  # Reservation ID
+        "customer_id": reservation.customer_id,  # Customer ID
+        "book_id": reservation.book_id,  # Book ID
+        "end_of_reservation": reservation.end_of_reservation.isoformat(),  # End date in ISO format
+    }
+
+
+# Asynchronous function to schedule a reminder built by reservation_reminder
+async def schedule_reminder(event: dict):
+
+    # The reminder becomes due one day before the reservation ends
+    end_of_reservation = datetime.fromisoformat(event["end_of_reservation"])
+    await reminder_wheel.schedule(
+        event["reservation_id"], end_of_reservation - REMINDER_LEAD_TIME, event
+    )
+
+
+# Asynchronous function to schedule the "ending soon" reminder of a reservation
+async def schedule_reservation_reminder(reservation):
+    await schedule_reminder(reservation_reminder(reservation))
+
+
+# Asynchronous function to drop the reminder of a cancelled reservation
+async def cancel_reservation_reminder(reservation_id: int):
+    await reminder_wheel.cancel(reservation_id)
 
-        # Fetching all active reservations from the repository
-        reservations = await repo.get_all_active_reservations()
 
-        # Iterating through each reservation
-        for reservation in reservations:
+# Asynchronous function to drop the reminders of reservations deleted together
+async def cancel_reservation_reminders(reservation_ids: List[int]):
+    await reminder_wheel.cancel(*reservation_ids)
 
-            # Extracting the end date of the current reservation
-            end_of_reservation = reservation.end_of_reservation
 
-            # Checking if the reservation is ending within the next day
-            if end_of_reservation - timedelta(days=1) <= datetime.now():
+# Asynchronous function to publish every reminder that is due by now
+async def dispatch_due_reminders():
 
-                # Preparing the event to notify the customer about the reservation ending soon
-                event = {
-                    "event_type": "reservation_ending_soon",  # Event type
-                    "reservation": {
-                        "customer_id": reservation.customer_id,  # Customer ID
-                        "book_id": reservation.book_id,  # Book ID
-                        "end_of_reservation": end_of_reservation.isoformat(),  # End date in ISO format
-                    },
-                }
+    # Popping due reminders in batches so the work is proportional to what is due now
+    while True:
+        events = await reminder_wheel.pop_due(settings.REMINDER_BATCH_SIZE)
+        if not events:
+            break
+
+        # Publishing the whole window as a single event so it is handled in bulk
+        await publish_event(
+            {"event_type": "reservation_reminders_due", "reminders": events}
+        )
+
+        if len(events) < settings.REMINDER_BATCH_SIZE:
+            break
+
+
+# One-off helper to schedule reminders for reservations created before the timer wheel existed
+async def backfill_reservation_reminders():
+
+    # Using UnitOfWork to ensure all database operations are executed within a transaction
+    async with UnitOfWork() as uow:
+
+        # Getting the ReservationRepository to interact with reservation data
+        repo = uow.get_repository(ReservationRepository)
 
-                # Publishing the event to RabbitMQ to notify the customer
-                publish_event(event)
+        # Scheduling a reminder for every active reservation (rescheduling is idempotent)
+        for reservation in await repo.get_all_active_reservations():
+            await schedule_reservation_reminder(reservation)
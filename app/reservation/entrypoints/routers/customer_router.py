@@ -5,7 +5,9 @@ from starlette.status import HTTP_204_NO_CONTENT
 from app.db.unit_of_work import UnitOfWork, get_uow
 from app.permissions import permission_required
 from app.reservation.domain.entities import CustomerCreate, CustomerOut, CustomerUpdate
+from app.user.domain.entities import Token
 from app.reservation.service_layer.customer_service import CustomerService
+from app.utils.ndjson import ndjson_response
 
 router = APIRouter()
 
@@ -26,6 +28,21 @@ async def create_customers(
     )  # Calling the service to create the customer
 
 
+# Endpoint to download every customer as newline-delimited JSON
+@router.get("/export")
+@permission_required(allowed_roles=["admin"])
+async def export_customers(
+    request: Request,  # Request to access user data
+    customer_service: CustomerService = Depends(
+        CustomerService
+    ),  # Injecting the CustomerService
+    uow: UnitOfWork = Depends(
+        get_uow
+    ),  # Injecting the UnitOfWork, used while the response is streamed
+):
+    return ndjson_response(customer_service.export_items(uow), "customers.ndjson")
+
+
 # Endpoint to get customer details by their ID
 @router.get("/{id}", response_model=CustomerOut)
 async def get_customer(
@@ -73,15 +90,14 @@ async def charge_wallet(
     ),  # Injecting the UnitOfWork for database transaction
 ):
     user_id = request.state.user_id  # Getting the current user's ID from the request
+    customer_id = request.state.customer_id  # Customer ID from the token, if it carries it
     return await customer_service.charge_wallet(
-        user_id, amount, uow
+        user_id, amount, uow, customer_id
     )  # Calling the service to charge the wallet
 
 
-# Endpoint to upgrade a customer's subscription
-@router.patch(
-    "/upgrade-subscription/{subscription_model}", status_code=status.HTTP_204_NO_CONTENT
-)
+# Endpoint to upgrade a customer's subscription, returning a new access token with the new tier
+@router.patch("/upgrade-subscription/{subscription_model}", response_model=Token)
 @permission_required(
     allow_current_user=True
 )  # Ensuring that the current user has permission to perform the action
@@ -96,8 +112,9 @@ async def upgrade_subscription(
     ),  # Injecting the UnitOfWork for database transaction
 ):
     user_id = request.state.user_id  # Getting the current user's ID from the request
+    token = request.headers["Authorization"].split(" ")[1]  # The token to replace
     return await customer_service.upgrade_subscription(
-        user_id, subscription_model, uow
+        user_id, subscription_model, uow, token
     )  # Calling the service to upgrade subscription
 
 
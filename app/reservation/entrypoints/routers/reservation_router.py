@@ -5,12 +5,23 @@ from typing import List
 from starlette.requests import Request
 from app.db.unit_of_work import UnitOfWork, get_uow
 from app.permissions import permission_required
-from app.reservation.domain.entities import ReservationCreateSchema
+from app.reservation.domain.entities import CustomerContext, ReservationCreateSchema
 from app.reservation.service_layer.reservation_services import ReservationService
+from app.utils.ndjson import ndjson_response
 
 router = APIRouter()
 
 
+# Function to build the customer context from the claims of the access token, if it carries them
+def get_customer_context(request: Request) -> CustomerContext | None:
+    if request.state.customer_id is None or request.state.subscription_model is None:
+        return None
+    return CustomerContext(
+        id=request.state.customer_id,
+        subscription_model=request.state.subscription_model,
+    )
+
+
 # Endpoint to reserve a book for a user
 @router.post("/reserve", status_code=status.HTTP_201_CREATED)
 @permission_required(
@@ -31,7 +42,7 @@ async def reserve_book(
             request.state.user_id
         )  # Getting the current user's ID from the request
         result = await reservation_service.reserve(
-            user_id, reservation_data
+            user_id, reservation_data, get_customer_context(request)
         )  # Calling the service to reserve the book
         await uow.commit()  # Committing the transaction to save changes
         return result  # Returning the result of the reservation process
@@ -57,12 +68,25 @@ async def cancel_reservation(
             uow
         )  # Creating an instance of ReservationService
         result = await reservation_service.cancel_reservation(
-            user_id, reservation_id, uow
+            user_id, reservation_id, uow, get_customer_context(request)
         )  # Calling the service to cancel the reservation
         await uow.commit()  # Committing the transaction to save changes
         return result  # Returning the result of the cancellation process
 
 
+# Endpoint to download every reservation as newline-delimited JSON
+@router.get("/export")
+@permission_required(allowed_roles=["admin"])
+async def export_reservations(
+    request: Request,  # Request to access user data
+    uow: UnitOfWork = Depends(
+        get_uow
+    ),  # Injecting the UnitOfWork, used while the response is streamed
+):
+    reservation_service = ReservationService(uow)
+    return ndjson_response(reservation_service.export_items(), "reservations.ndjson")
+
+
 # Placeholder for future endpoint to get the reservation queue position for a specific book
 # @router.get("/queue/{book_id}", response_model=ReservationQueueSchema)
 # async def get_reservation_queue_position(book_id: int, user_id: int = Depends(get_current_user)):
@@ -1,31 +1,46 @@
-from typing import List
+from typing import AsyncIterator, List
 from fastapi import HTTPException
-from redis import Redis
 from app.adapters.repositories.customer_repo import CustomerRepository
+from app.adapters.repositories.reservation_repo import ReservationRepository
+from app.adapters.repositories.wallet_repo import WalletRepository
 from app.db.unit_of_work import UnitOfWork
 from app.infrastructure.otp_limiter import RateLimiter
-from app.reservation.domain.entities import Customer, CustomerCreate, CustomerUpdate
+from app.infrastructure.redis_registry import OTP, redis_registry
+from app.permissions import decode_token, revoke_token, revoke_user_tokens
+from app.reservation.domain.events import cancel_reservation_reminders
+from app.reservation.domain.entities import (
+    Customer,
+    CustomerCreate,
+    CustomerOut,
+    CustomerUpdate,
+)
 from app.settings import settings
-from app.utils.message_interface.sms_service import KaveNegar, Signal, SmsIR, SmsService
+from app.user.service_layer.utils import access_token_claims, create_access_token
+from app.utils.ndjson import from_entity
+from app.utils.message_interface.sms_service import (
+    CircuitBreaker,
+    KaveNegar,
+    Signal,
+    SmsIR,
+    SmsService,
+)
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
-# Setting up Redis client to manage OTP rate limiting
-redis_client = Redis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    db=settings.REDIS_DB0,
-    decode_responses=True,
-)
+# Redis client holding the OTP rate limits and the circuit breaker state shared by all workers
+redis_client = redis_registry.client(OTP)
 
 rate_limiter = RateLimiter(
     redis_client, "otp_requests"
 )  # Rate limiter instance to control OTP request rate
 
 # SMS service setup with multiple providers for sending messages
-sms_service = SmsService([SmsIR(), KaveNegar(), Signal()])
+sms_service = SmsService(
+    [SmsIR(), KaveNegar(), Signal()],
+    CircuitBreaker(redis_client, failure_threshold=3, reset_time=60),
+)
 
 
 class CustomerService:
@@ -38,14 +53,26 @@ class CustomerService:
             new_customer = await repo.create_item(
                 customer_data
             )  # Creating new customer
+            # Built from the returned row, before the commit expires it
+            new_customer = from_entity(CustomerOut, new_customer)
             await uow.commit()  # Committing changes
-            await uow.refresh(
-                new_customer
-            )  # Refreshing the customer data to get the latest state
             return new_customer
 
+    # Method to build the output of customers with their wallet balances from the ledger
+    async def _with_balances(
+        self, customers: List[Customer], uow: UnitOfWork
+    ) -> List[CustomerOut]:
+        wallet_repo = uow.get_repository(WalletRepository)
+        balances = await wallet_repo.get_balances(customer.id for customer in customers)
+        return [
+            from_entity(
+                CustomerOut, customer, wallet_money_amount=balances[customer.id]
+            )
+            for customer in customers
+        ]
+
     # Method to retrieve a single customer by ID
-    async def get_item(self, id: int, uow: UnitOfWork) -> Customer:
+    async def get_item(self, id: int, uow: UnitOfWork) -> CustomerOut:
         async with uow:
             repo = uow.get_repository(
                 CustomerRepository
@@ -55,15 +82,24 @@ class CustomerService:
                 raise HTTPException(
                     status_code=404, detail="Customer not found"
                 )  # If customer not found, raise error
-            return result
+            return (await self._with_balances([result], uow))[0]
 
     # Method to get a list of all customers
-    async def get_items(self, uow: UnitOfWork) -> List[Customer]:
+    async def get_items(self, uow: UnitOfWork) -> List[CustomerOut]:
         async with uow:
             repo = uow.get_repository(
                 CustomerRepository
             )  # Getting repository for customer
-            return await repo.list()  # Fetching all customers
+            customers = await repo.list()  # Fetching all customers
+            return await self._with_balances(customers, uow)
+
+    # Method to stream every customer, batch by batch, for a bulk export
+    async def export_items(self, uow: UnitOfWork) -> AsyncIterator[CustomerOut]:
+        async with uow:
+            repo = uow.get_repository(CustomerRepository)
+            async for customers in repo.stream(settings.EXPORT_BATCH_SIZE):
+                for customer in await self._with_balances(customers, uow):
+                    yield customer
 
     # Method to update customer details
     async def update_item(
@@ -74,11 +110,23 @@ class CustomerService:
                 CustomerRepository
             )  # Getting repository for customer
             updated_customer = await repo.update_item(
-                id, customer_data
-            )  # Updating customer data
+                id, customer_data.model_copy(update={"wallet_money_amount": None})
+            )  # Updating customer data, except the wallet which is kept by the ledger
+
+            # Setting the balance by appending the difference to the wallet ledger
+            wallet_repo = uow.get_repository(WalletRepository)
+            if customer_data.wallet_money_amount is not None:
+                await wallet_repo.set_balance(
+                    id, customer_data.wallet_money_amount, "adjustment"
+                )
+            # Built from the returned row, before the commit expires it
+            updated_customer = (await self._with_balances([updated_customer], uow))[0]
             await uow.commit()  # Committing the changes
-            await uow.refresh(updated_customer)  # Refreshing the updated customer data
-            return updated_customer
+
+        # Tokens carrying the old subscription tier must not be used anymore
+        if customer_data.subscription_model is not None:
+            await revoke_user_tokens(updated_customer.user_id)
+        return updated_customer
 
     # Method to delete a customer
     async def delete_item(self, id: int, uow: UnitOfWork):
@@ -86,33 +134,49 @@ class CustomerService:
             repo = uow.get_repository(
                 CustomerRepository
             )  # Getting repository for customer
+            # Active reservations deleted with the customer, whose reminders are
+            # dropped once the deletion is committed
+            reservation_ids = await uow.get_repository(
+                ReservationRepository
+            ).get_active_ids_by_customer(id)
             deleted_customer = await repo.delete_item(id)  # Deleting the customer
+            user_id = deleted_customer.user_id if deleted_customer else None
+            uow.on_commit(lambda: cancel_reservation_reminders(reservation_ids))
             await uow.commit()  # Committing the changes
-            return deleted_customer
 
-    # Method to charge the wallet of a customer
+        # Tokens carrying the deleted customer ID must not be used anymore
+        if deleted_customer:
+            await revoke_user_tokens(user_id)
+        return deleted_customer is not None
+
+    # Method to charge the wallet of a customer (by the customer ID from the token, if it carries it)
     async def charge_wallet(
-        self, user_id: int, amount: int, uow: UnitOfWork
-    ) -> Customer:
+        self, user_id: int, amount: int, uow: UnitOfWork, customer_id: int = None
+    ):
         async with uow:
             repo = uow.get_repository(
                 CustomerRepository
             )  # Getting repository for customer
-            customer = await repo.get_by_user_id(
-                user_id
-            )  # Fetching customer by user ID
-            if not customer:
-                raise HTTPException(
-                    status_code=404, detail="Customer not found"
-                )  # If customer not found, raise error
-            customer.charge_wallet(amount)  # Charging the customer's wallet
+            if customer_id is None:
+                customer = await repo.get_by_user_id(
+                    user_id
+                )  # Fetching customer by user ID
+                if not customer:
+                    raise HTTPException(
+                        status_code=404, detail="Customer not found"
+                    )  # If customer not found, raise error
+                customer_id = customer.id
+
+            # Appending the charge to the customer's wallet ledger
+            wallet_repo = uow.get_repository(WalletRepository)
+            if not await wallet_repo.credit(customer_id, amount, "charge"):
+                raise HTTPException(status_code=404, detail="Customer not found")
             await uow.commit()  # Committing the changes
-            return customer
 
-    # Method to upgrade the subscription model of a customer
+    # Method to upgrade the subscription model of a customer, re-issuing the access token with the new tier
     async def upgrade_subscription(
-        self, user_id: int, subscription_model: str, uow: UnitOfWork
-    ) -> Customer:
+        self, user_id: int, subscription_model: str, uow: UnitOfWork, token: str
+    ) -> dict:
         async with uow:
             try:
                 repo = uow.get_repository(
@@ -127,12 +191,32 @@ class CustomerService:
                         status_code=404, detail="Customer not found"
                     )  # If customer not found, raise error
 
-                customer.upgrade_subscription(
-                    subscription_model
-                )  # Upgrading the subscription model
+                # Paying from the wallet, then switching the subscription model
+                cost = customer.subscription_upgrade_cost(subscription_model)
+                wallet_repo = uow.get_repository(WalletRepository)
+                if await wallet_repo.debit(customer.id, cost, "subscription") is None:
+                    raise HTTPException(
+                        status_code=400, detail="Insufficient wallet balance"
+                    )
+                customer.apply_subscription_upgrade(subscription_model)
+                claims = access_token_claims(decode_token(token), customer)
                 await uow.commit()  # Committing the changes
-                return customer
             except (
                 ValueError
             ) as e:  # If there is a ValueError (e.g., invalid subscription model), raise error
                 raise HTTPException(status_code=400, detail=str(e))
+
+        # Replacing the access token, whose claims still carry the old subscription tier
+        access_token = create_access_token(claims)
+        await revoke_token(token)
+        return {"access_token": access_token, "token_type": "bearer"}
+
+
+# Scheduled job folding the wallet ledger into the balance snapshot of each customer,
+# so reading a balance only sums the entries since the last run
+async def compact_wallets():
+    async with UnitOfWork() as uow:
+        repo = uow.get_repository(WalletRepository)
+        compacted = await repo.compact()
+        await uow.commit()
+    print(f"Compacted the wallet ledger of {compacted} customers")
@@ -1,48 +1,41 @@
-from datetime import datetime, timedelta
-from fastapi import HTTPException
 from app.adapters.repositories.book_repo import BookRepository
 from app.adapters.repositories.customer_repo import CustomerRepository
 from app.db.unit_of_work import UnitOfWork
-from app.infrastructure.messaging.sms_provider import send_sms
+from app.infrastructure.messaging.sms_provider import send_bulk_sms
 
 
 # Event handler to send a reminder SMS before the reservation ends
 async def send_reservation_reminder_handler(event):
-    async with UnitOfWork() as uow:
-        book_id = event.get("book_id")  # Getting the book ID from the event
-        customer_id = event.get("customer_id")  # Getting the customer ID from the event
+    await send_reservation_reminders_handler([event])
+
 
-        # Fetching the book details using the BookRepository
+# Event handler to send the reminder SMS of a whole window of due reservations
+async def send_reservation_reminders_handler(events):
+    async with UnitOfWork() as uow:
+        # Loading every referenced book title in one query
         repo = uow.get_repository(BookRepository)
-        book = await repo.get(book_id)
-        if not book:
-            raise HTTPException(
-                status_code=404, detail="Book not found"
-            )  # Raise an error if the book doesn't exist
+        titles = await repo.get_titles_by_ids(event.get("book_id") for event in events)
 
-        # Fetching the customer details using the CustomerRepository
+        # Loading every referenced customer phone number (through the user) in one query
         customer_repo = uow.get_repository(CustomerRepository)
-        customer = await customer_repo.get(customer_id)
-        if not customer:
-            raise HTTPException(
-                status_code=404, detail="Customer not found"
-            )  # Raise an error if the customer doesn't exist
+        phone_numbers = await customer_repo.get_phone_numbers_by_ids(
+            event.get("customer_id") for event in events
+        )
 
-    # Event payload contains the reservation info
-    reservation_end_date = datetime.strptime(
-        event.get("end_of_reservation"), "%Y-%m-%dT%H:%M:%S"
-    )  # Parsing the reservation end date
-    reminder_date = reservation_end_date - timedelta(
-        days=1
-    )  # Calculating the reminder date (1 day before the reservation ends)
+    # Rendering the messages, skipping reminders whose book or customer no longer exists
+    messages = []
+    for event in events:
+        title = titles.get(event.get("book_id"))
+        phone_number = phone_numbers.get(event.get("customer_id"))
+        if title is None or phone_number is None:
+            print(
+                f"Skipped reminder for reservation {event.get('reservation_id')}: book or customer not found"
+            )
+            continue
+        message = f"Reminder: Your reservation for the book '{title}' is ending tomorrow."  # SMS message content
+        messages.append((phone_number, message))
 
-    # If today's date is 1 day before the reservation ends, send the SMS
-    if datetime.now() >= reminder_date:
-        message = f"Reminder: Your reservation for the book '{book.title}' is ending tomorrow."  # SMS message content
-        # Send SMS via external service
-        send_sms(
-            customer.phone_number, message
-        )  # Sending the SMS to the customer's phone number
-        print(
-            f"Sent reminder SMS to customer {customer_id}"
-        )  # Log the reminder SMS has been sent
+    # Handing the whole batch to the SMS layer
+    if messages:
+        await send_bulk_sms(messages)
+        print(f"Sent {len(messages)} reminder SMS")  # Log the reminder SMS that have been sent
@@ -1,18 +1,29 @@
 from fastapi import HTTPException
 from datetime import datetime, timedelta
-import redis, pytz
+import pytz
 from app.infrastructure.rabbitmq.publish_rabbitmq import publish_event
-from app.reservation.domain.entities import QueueResponseSchema, Reservation
-from app.settings import settings
+from app.infrastructure.redis_registry import RESERVATION, redis_registry
+from app.reservation.domain.events import (
+    cancel_reservation_reminder,
+    reservation_reminder,
+    schedule_reminder,
+)
+from app.reservation.domain.entities import (
+    CustomerContext,
+    QueueResponseSchema,
+    Reservation,
+    ReservationResponseSchema,
+)
 from app.db.unit_of_work import UnitOfWork
 from app.adapters.repositories.book_repo import BookRepository
 from app.adapters.repositories.customer_repo import CustomerRepository
 from app.adapters.repositories.reservation_repo import ReservationRepository
+from app.adapters.repositories.wallet_repo import WalletRepository
+from app.settings import settings
+from app.utils.ndjson import from_entity
 
-# Setting up Redis client
-redis_client = redis.Redis(
-    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB1
-)
+# Redis client holding the reservation queues
+redis_client = redis_registry.client(RESERVATION)
 
 # Set the timezone to Iran Standard Time
 iran_timezone = pytz.timezone("Asia/Tehran")
@@ -24,13 +35,28 @@ class ReservationService:
     def __init__(self, uow: UnitOfWork):
         self.uow = uow  # Unit of Work pattern to manage database transactions
 
-    # Method to get the customer by user ID
-    async def _get_customer(self, user_id):
+    # Method to get the customer by user ID, unless the access token already carried it
+    async def _get_customer(self, user_id, customer_context=None) -> CustomerContext:
+        if customer_context is not None:
+            return customer_context
+
         repo = self.uow.get_repository(CustomerRepository)
         customer = await repo.get_by_user_id(user_id)
         if not customer:
             raise HTTPException(status_code=404, detail="Customer not found")
-        return customer
+        return CustomerContext(
+            id=customer.id, subscription_model=customer.subscription_model
+        )
+
+    # Method to get a customer by its ID, as kept in the reservation queues
+    async def _get_customer_by_id(self, customer_id) -> CustomerContext | None:
+        repo = self.uow.get_repository(CustomerRepository)
+        customer = await repo.get(customer_id)
+        if not customer:
+            return None
+        return CustomerContext(
+            id=customer.id, subscription_model=customer.subscription_model
+        )
 
     # Method to get the book by book ID
     async def _get_book(self, book_id):
@@ -52,27 +78,35 @@ class ReservationService:
         result = await repo.has_paid_more_than_300k(customer_id)
         return result
 
-    # Check if the customer has enough funds to reserve the book
-    async def check_funds(self, customer, days):
+    # Calculate the price of a reservation, including the discounts of the customer
+    async def reservation_cost(self, customer_id, days):
         daily_rate = 1000
         total_cost = days * daily_rate
 
         # Apply discount if customer spent over 300,000 Toman in the last 60 days
-        if await self.has_paid_more_than_300k(customer.id):
+        if await self.has_paid_more_than_300k(customer_id):
             total_cost = 0
 
         # Apply 30% discount if customer read more than 3 books in the last 30 days
-        if await self.has_read_more_than_3_books(customer.id):
+        if await self.has_read_more_than_3_books(customer_id):
             total_cost = int(total_cost * 0.7)
 
-        # Check if the customer has sufficient wallet balance
-        if customer.wallet_money_amount < total_cost:
-            remaining_amount = total_cost - customer.wallet_money_amount
-            charge_wallet_url = f"/charge-wallet?amount={remaining_amount}"
-            raise HTTPException(
-                status_code=402,
-                detail=f"Not enough balance. Please recharge. Redirect to: {charge_wallet_url}",
-            )
+        return total_cost
+
+    # Take the price of a reservation from the customer's wallet if the balance covers it
+    async def charge_for_reservation(self, customer_id, total_cost):
+        repo = self.uow.get_repository(WalletRepository)
+        if await repo.debit(customer_id, total_cost, "reservation") is not None:
+            return
+
+        # Reading the balance only to tell the customer how much is missing
+        balance = await repo.get_balance(customer_id) or 0
+        remaining_amount = total_cost - balance
+        charge_wallet_url = f"/charge-wallet?amount={remaining_amount}"
+        raise HTTPException(
+            status_code=402,
+            detail=f"Not enough balance. Please recharge. Redirect to: {charge_wallet_url}",
+        )
 
     # Count active reservations of a customer
     async def count_active_reservations(self, customer_id):
@@ -95,18 +129,16 @@ class ReservationService:
             )
 
         max_units = 10 if customer.subscription_model == "premium" else 5
-        active_reservations = await self.has_paid_more_than_300k(customer.id)
+        active_reservations = await self.count_active_reservations(customer.id)
         if active_reservations >= max_units:
             raise HTTPException(status_code=403, detail="Reservation limit exceeded")
 
-        await self.check_funds(customer, days)
-
     # Reserve a book for the customer (either instantly or via the queue)
-    async def reserve(self, user_id, reservation_data):
+    async def reserve(self, user_id, reservation_data, customer_context=None):
         book_id = reservation_data.book_id
         days = reservation_data.days
 
-        customer = await self._get_customer(user_id)
+        customer = await self._get_customer(user_id, customer_context)
         book = await self._get_book(book_id)
 
         # If book has available units, reserve it instantly
@@ -122,10 +154,10 @@ class ReservationService:
     async def instant_reserve(self, customer, book, days):
         await self.validate_reservation(customer, days)
 
-        daily_rate = 1000
-        total_cost = days * daily_rate
-        customer.deduct_from_wallet(total_cost)
+        total_cost = await self.reservation_cost(customer.id, days)
+        await self.charge_for_reservation(customer.id, total_cost)
 
+        now = datetime.now(iran_timezone)
         reservation = Reservation(
             customer_id=customer.id,
             book_id=book.id,
@@ -137,6 +169,11 @@ class ReservationService:
         repo = self.uow.get_repository(ReservationRepository)
         await repo.add(reservation)
 
+        # Schedule the "ending soon" reminder in the timer wheel once the reservation
+        # is committed, so a rolled back one gets no reminder
+        reminder = reservation_reminder(reservation)
+        self.uow.on_commit(lambda: schedule_reminder(reminder))
+
     # Add the reservation request to a Redis queue if the book is unavailable
     async def queue_reserve(self, customer, book, days):
         queue_key = f"reservation_queue:{book.id}"
@@ -145,8 +182,8 @@ class ReservationService:
             if customer.subscription_model == "premium"
             else (1 if customer.subscription_model == "plus" else 3)
         )
-        redis_client.zadd(queue_key, {customer.id: priority})
-        queue_position = redis_client.zrank(queue_key, customer.id)
+        await redis_client.zadd(queue_key, {customer.id: priority})
+        queue_position = await redis_client.zrank(queue_key, customer.id)
         return QueueResponseSchema(
             customer_id=customer.id,
             book_id=book.id,
@@ -156,24 +193,40 @@ class ReservationService:
     # Process the reservation queue, checking if the next customer has sufficient funds to reserve the book
     async def process_queue(self, customer, book, days):
         queue_key = f"reservation_queue:{book.id}"
-        next_customer_id = redis_client.zrange(queue_key, 0, 0, withscores=True)
+        next_customer_id = await redis_client.zrange(
+            queue_key, 0, 0, withscores=True
+        )
         if next_customer_id:
             next_customer_id = int(next_customer_id[0][0])
-            next_customer = self._get_customer(next_customer_id)
+            # The queues hold customer IDs, not user IDs
+            next_customer = await self._get_customer_by_id(next_customer_id)
+            if not next_customer:
+                # Remove customer from queue if it was deleted meanwhile
+                await redis_client.zrem(queue_key, next_customer_id)
+                return await self.process_queue(customer, book, days)
 
             # Validate reservation and check if the next customer has sufficient funds
-            await self.validate_reservation(customer, days)
+            await self.validate_reservation(next_customer, days)
             daily_rate = 1000
             total_cost = days * daily_rate
-            if next_customer.wallet_money_amount >= total_cost:
-                redis_client.zrem(queue_key, next_customer_id)
-                return self.instant_reserve(next_customer, book, days)
+            wallet_repo = self.uow.get_repository(WalletRepository)
+            if await wallet_repo.get_balance(next_customer_id) >= total_cost:
+                await redis_client.zrem(queue_key, next_customer_id)
+                return await self.instant_reserve(next_customer, book, days)
             else:
                 # Remove customer from queue if they don't have enough funds
-                redis_client.zrem(queue_key, next_customer_id)
-                return self.process_queue(customer, book, days)
+                await redis_client.zrem(queue_key, next_customer_id)
+                return await self.process_queue(customer, book, days)
         return {"message": "No customers in the queue"}
 
+    # Stream every reservation, batch by batch, for a bulk export
+    async def export_items(self):
+        async with self.uow:
+            repo = self.uow.get_repository(ReservationRepository)
+            async for reservations in repo.stream(settings.EXPORT_BATCH_SIZE):
+                for reservation in reservations:
+                    yield from_entity(ReservationResponseSchema, reservation)
+
     # Get reservation by ID and customer ID
     async def get_reservation_by_id_and_customer(
         self, reservation_id, customer_id, uow
@@ -190,45 +243,44 @@ class ReservationService:
         return result
 
     # Cancel a reservation and refund if applicable
-    async def cancel_reservation(self, user_id, reservation_id: int, uow: UnitOfWork):
-        customer = await self._get_customer(user_id)
+    async def cancel_reservation(
+        self, user_id, reservation_id: int, uow: UnitOfWork, customer_context=None
+    ):
+        customer = await self._get_customer(user_id, customer_context)
         customer_id = customer.id
         repo = uow.get_repository(ReservationRepository)
-        reservation_value = await repo.get(reservation_id)
-
-        if not reservation_value:
-            raise HTTPException(status_code=404, detail="Reservation not found")
-
         reservation = await repo.get_reservation_by_id_and_customer(
             reservation_id, customer_id
         )
         if not reservation:
             raise HTTPException(status_code=404, detail="Reservation not found")
 
-        # Refund the wallet if the reservation is active
+        # Refund what was paid for the reservation if it is active
         if reservation.status == "active":
-            refund_amount = (
-                reservation.end_of_reservation - reservation.start_of_reservation
-            ).days * 1000
-            customer.charge_wallet(refund_amount)
+            wallet_repo = uow.get_repository(WalletRepository)
+            await wallet_repo.credit(customer_id, reservation.price, "refund")
 
-        # Cancel the reservation and update book reserved units
+        # Cancel the reservation and update book reserved units, retried if a
+        # concurrent reservation or cancellation changed the book meanwhile
         book_id = reservation.book_id
-        book = await self._get_book(book_id)
-        book.cancel_reservation()
+        book_repo = uow.get_repository(BookRepository)
+        if not await book_repo.cancel_reservation(book_id):
+            raise HTTPException(status_code=404, detail="Book not found")
 
-        repo = uow.get_repository(ReservationRepository)
-        await repo.remove(reservation_value)
-
-        # Publish an event to RabbitMQ to notify about reservation cancellation
-        publish_event(
-            {
-                "event_type": "reservation_cancelled",
-                "book_id": book_id,
-                "customer_id": customer_id,
-            }
-        )
+        await repo.remove(reservation)
+
+        # Drop the pending "ending soon" reminder once the cancellation is committed,
+        # so a reservation that is still there keeps its reminder
+        uow.on_commit(lambda: cancel_reservation_reminder(reservation_id))
+
+        # Publish an event to RabbitMQ to notify about reservation cancellation, once
+        # it is committed, so a cancellation that was rolled back isn't announced
+        event = {
+            "event_type": "reservation_cancelled",
+            "book_id": book_id,
+            "customer_id": customer_id,
+        }
+        uow.on_commit(lambda: publish_event(event))
 
         await uow.flush()
-        await uow.refresh(customer)
         return {"message": "Reservation cancelled successfully"}
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 
@@ -14,12 +15,19 @@ class Settings(BaseSettings):
     # The expiration time for the access token in minutes
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
+    # Whether access tokens carry the customer ID and subscription tier of the user
+    ACCESS_TOKEN_CUSTOMER_CLAIMS: bool = True
+
     # Redis configuration settings
     REDIS_HOST: str = "localhost"  # The Redis server host
     REDIS_PORT: int = 6379  # The port to connect to the Redis server
     REDIS_DB0: int = 0  # Redis database 0 (for storing OTPs or caching)
     REDIS_DB1: int = 1  # Redis database 1 (another database for different use cases)
     REDIS_DB2: int = 2  # Redis database 2 (for different use cases)
+    REDIS_MAX_CONNECTIONS: int = 50  # Maximum connections of each Redis pool
+    REDIS_POOL_TIMEOUT: float = 5.0  # Seconds to wait for a free connection of a full pool
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30  # Seconds idle before a pooled connection is pinged on reuse
+    REDIS_SOCKET_TIMEOUT: float = 5.0  # Seconds to wait for Redis before a command fails
 
     # PostgreSQL database configuration
     POSTGRES_USER: str = "raya"  # Username for PostgreSQL
@@ -34,6 +42,75 @@ class Settings(BaseSettings):
     RABBITMQ_USER: str = "guest"  # RabbitMQ username
     RABBITMQ_PASSWORD: str = "guest"  # RabbitMQ password
 
+    # SMS provider configuration (sending is disabled while SMS_API_URL is not set)
+    SMS_API_URL: Optional[str] = None  # Endpoint for sending a single SMS
+    SMS_BULK_API_URL: Optional[str] = None  # Endpoint of the provider bulk-send API
+    SMS_API_KEY: str = ""  # API key of the SMS provider
+    SMS_MAX_CONCURRENCY: int = 10  # Maximum in-flight requests to the provider
+    SMS_RATE_LIMIT_PER_SECOND: float = 50.0  # Messages per second accepted by the provider
+    SMS_RATE_LIMIT_BURST: int = 100  # Messages that can be sent at once before throttling
+    SMS_BULK_SIZE: int = 100  # Maximum number of messages per bulk request
+    SMS_QUEUE_SIZE: int = 10000  # Maximum number of messages waiting to be sent
+
+    # Milliseconds to wait for the best SMS provider before hedging an OTP with the next one (unset disables hedging)
+    SMS_OTP_HEDGE_AFTER_MS: Optional[int] = None
+
+    # Maximum number of due reservation reminders popped from the timer wheel at once
+    REMINDER_BATCH_SIZE: int = 500
+
+    # API rate limits per client, as a sustained rate (requests per second) and a burst size
+    RATE_LIMIT_ENABLED: bool = True  # Whether the rate limiting middleware is installed
+    RATE_LIMIT_CATALOG_PER_SECOND: float = 10.0  # Browsing books (GET /books/...)
+    RATE_LIMIT_CATALOG_BURST: int = 50
+    RATE_LIMIT_SEARCH_PER_SECOND: float = 2.0  # Searching books (GET /books/search)
+    RATE_LIMIT_SEARCH_BURST: int = 10
+    RATE_LIMIT_RESERVE_PER_SECOND: float = 0.2  # Reserving books (POST /reservations/reserve)
+    RATE_LIMIT_RESERVE_BURST: int = 5
+    RATE_LIMIT_DEFAULT_PER_SECOND: float = 5.0  # Every other route
+    RATE_LIMIT_DEFAULT_BURST: int = 20
+    RATE_LIMIT_LEASE_FRACTION: float = 0.1  # Share of the remaining quota a worker may grant without Redis
+    RATE_LIMIT_LEASE_TTL_MS: int = 1000  # How long a worker-local lease stays valid
+
+    # Password hashing pool (bcrypt runs in worker processes to keep the event loop free)
+    PASSWORD_HASH_WORKERS: Optional[int] = None  # Worker processes, defaults to the CPU cores
+    PASSWORD_HASH_MAX_PENDING: int = 64  # Jobs queued or running before new ones get a 503
+
+    # Verified JWT cache (signatures are checked once per token per worker)
+    TOKEN_CACHE_SIZE: int = 10000  # Maximum number of verified tokens cached per worker
+    TOKEN_REVOCATION_CHECK_INTERVAL_MS: int = 5000  # How often a cached token is rechecked for revocation
+
+    # Principal cache (user identity resolved from a token without querying the database)
+    PRINCIPAL_CACHE_SIZE: int = 10000  # Maximum number of principals cached per worker
+    PRINCIPAL_CACHE_LOCAL_TTL_MS: int = 5000  # How long a worker keeps a principal in memory
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 300  # How long a principal stays in Redis
+
+    # Optimistic concurrency control
+    OPTIMISTIC_LOCK_RETRIES: int = 3  # Re-runs of an update whose row version changed meanwhile
+
+    # Wallet ledger
+    WALLET_COMPACTION_INTERVAL_MINUTES: int = 10  # How often ledger entries are folded into balances
+
+    # Bulk exports
+    EXPORT_BATCH_SIZE: int = 1000  # Rows fetched from the database cursor per batch
+
+    # Bulk book imports
+    BOOK_IMPORT_BATCH_SIZE: int = 2000  # Rows validated, inserted and committed together
+    BOOK_IMPORT_MAX_ERRORS: int = 100  # Rejected rows reported in detail
+
+    # Catalog HTTP caching (responses are tagged with surrogate keys and purged on book events)
+    CATALOG_CACHE_MAX_AGE: int = 60  # Seconds browsers keep a catalog response
+    CATALOG_EDGE_MAX_AGE: int = 86400  # Seconds the reverse proxy keeps a catalog response
+    CATALOG_SEARCH_EDGE_MAX_AGE: int = 60  # Seconds it keeps search results (the catalog is updated asynchronously)
+    EDGE_CACHE_PURGE_URL: Optional[str] = None  # Purge endpoint of the reverse proxy (unset disables purging)
+    EDGE_CACHE_PURGE_HEADER: str = "Surrogate-Key"  # Header carrying the keys of a purge
+
+    # Response compression (brotli is only offered when the package is installed)
+    COMPRESSION_ENABLED: bool = True  # Whether the compression middleware is installed
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # Smallest body, in bytes, worth compressing
+    COMPRESSION_GZIP_LEVEL: int = 6  # gzip level of responses compressed per request
+    COMPRESSION_BROTLI_QUALITY: int = 4  # Brotli quality of responses compressed per request
+    COMPRESSION_CACHED_BROTLI_QUALITY: int = 9  # Brotli quality of cached responses, compressed once per cache fill
+
     # Debugging mode (usually set to False in production)
     DEBUG: bool = False
 
@@ -29,6 +29,14 @@ class User:
         self.username = username  # Method to update the user's username
 
 
+# Principal holding the user fields needed to authorize requests, cached between requests
+class Principal(BaseModel):
+    id: int  # User's unique ID
+    username: str  # User's username
+    role: str  # User's role (e.g., 'admin', 'customer')
+    is_active: bool | None = None  # Whether the user account is active
+
+
 # City entity representing a city in the system
 class City:
     id: int  # Unique identifier for the city
@@ -140,3 +148,7 @@ class TokenData(BaseModel):
     role: str | None = (
         None  # User's role (e.g., 'admin', 'customer'), or None if not available
     )
+    customer_id: int | None = None  # Customer ID of the user, if the token carries it
+    subscription_model: str | None = None  # Customer's subscription tier, if the token carries it
+    issued_at: float | None = None  # When the token was issued (Unix timestamp)
+    expires_at: int | None = None  # When the token expires (Unix timestamp)
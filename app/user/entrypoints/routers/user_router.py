@@ -1,7 +1,7 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from app.db.unit_of_work import UnitOfWork, get_uow
-from app.permissions import permission_required
+from app.permissions import permission_required, revoke_token
 from app.user.domain.entities import (
     LoginStep1Request,
     LoginStep2Request,
@@ -11,6 +11,7 @@ from app.user.domain.entities import (
     UserUpdate,
 )
 from app.user.service_layer.services import AuthService
+from app.utils.ndjson import ndjson_response
 
 router = APIRouter()
 
@@ -45,17 +46,31 @@ async def login_step2(
     return await auth_service.login_step2(otp_data, uow)
 
 
-# Endpoint to log out and remove the access token cookie
+# Endpoint to log out, revoking the access token and removing its cookie
 @router.post("/logout")
 @permission_required(allowed_roles=["admin"])
 async def logout(response: Response, request: Request):
     if "access_token" not in request.cookies:
         raise HTTPException(status_code=400, detail="No token in cookies")
 
+    # Revoking the token so it can't be reused until it expires
+    await revoke_token(request.headers["Authorization"].split(" ")[1])
+
     response.delete_cookie("access_token")
     return {"message": "Token removed from cookies"}
 
 
+# Endpoint to download every user as newline-delimited JSON
+@router.get("/export")
+@permission_required(allowed_roles=["admin"])
+async def export_users(
+    request: Request,
+    auth_service: AuthService = Depends(AuthService),
+    uow: UnitOfWork = Depends(get_uow),
+):
+    return ndjson_response(auth_service.export_items(uow), "users.ndjson")
+
+
 # Endpoint to get a user by their ID
 @router.get("/{id}", response_model=UserOut | None)
 async def get_user(
@@ -1,43 +1,56 @@
-from typing import List
-from jose import jwt
+from typing import AsyncIterator, List
 from fastapi import HTTPException
-from redis import Redis
 from app.db.unit_of_work import UnitOfWork
 from app.infrastructure.otp_limiter import RateLimiter
+from app.infrastructure.redis_registry import OTP, redis_registry
+from app.infrastructure.password_hasher import password_hasher
+from app.adapters.repositories.customer_repo import CustomerRepository
+from app.adapters.repositories.principal_repo_redis import principal_repo
+from app.adapters.repositories.reservation_repo import ReservationRepository
 from app.adapters.repositories.user_repo import AuthRepository
 from app.adapters.repositories.user_repo_redis import AuthRepositoryRedis
+from app.permissions import resolve_principal, revoke_user_tokens, verify_token
+from app.reservation.domain.events import cancel_reservation_reminders
 from app.settings import settings
 from app.user.domain.entities import (
     LoginStep1Request,
     LoginStep2Request,
+    Principal,
     User,
     UserCreate,
+    UserOut,
     UserUpdate,
 )
-from app.user.service_layer.utils import (
-    create_access_token,
-    get_password_hash,
-    verify_password,
+from app.user.service_layer.utils import access_token_claims, create_access_token
+from app.utils.ndjson import from_entity
+from app.utils.message_interface.sms_service import (
+    CircuitBreaker,
+    KaveNegar,
+    Signal,
+    SmsIR,
+    SmsService,
 )
-from app.utils.message_interface.sms_service import KaveNegar, Signal, SmsIR, SmsService
 
 SECRET_KEY = settings.SECRET_KEY  # Secret key for JWT encoding and decoding
 ALGORITHM = settings.ALGORITHM  # Algorithm used for JWT encoding and decoding
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES  # Token expiry time
 
-# Redis client setup for managing OTP rate limits
-redis_client = Redis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    db=settings.REDIS_DB0,
-    decode_responses=True,
-)
+# Redis client holding the OTP rate limits and the circuit breaker state shared by all workers
+redis_client = redis_registry.client(OTP)
 
 # RateLimiter instance to manage OTP requests per user
 rate_limiter = RateLimiter(redis_client, "otp_requests")
 
 # SMS service instance using multiple SMS providers for OTP delivery
-sms_service = SmsService([SmsIR(), KaveNegar(), Signal()])
+sms_service = SmsService(
+    [SmsIR(), KaveNegar(), Signal()],
+    CircuitBreaker(redis_client, failure_threshold=3, reset_time=60),
+    hedge_after=(
+        settings.SMS_OTP_HEDGE_AFTER_MS / 1000
+        if settings.SMS_OTP_HEDGE_AFTER_MS is not None
+        else None
+    ),
+)
 
 
 class AuthService:
@@ -62,8 +75,8 @@ class AuthService:
                         status_code=400, detail="Email already registered"
                     )
 
-            # Hash the user's password before storing it
-            hashed_password = get_password_hash(user_data.password)
+            # Hash the user's password before storing it (in a worker process)
+            hashed_password = await password_hasher.hash(user_data.password)
             new_user = await repo.create_item(
                 user_data, hashed_password
             )  # Create the user
@@ -81,10 +94,10 @@ class AuthService:
             )  # Get the repository for user management
             user = await repo.get_by_username(username)  # Fetch the user by username
 
-            # Validate the user and password
-            if not user or not verify_password(password, user.password):
-                raise HTTPException(status_code=404, detail="User not found")
-            return user
+        # Validate the user and password (after releasing the database connection)
+        if not user or not await password_hasher.verify(password, user.password):
+            raise HTTPException(status_code=404, detail="User not found")
+        return user
 
     # Method for handling the first step of login (username/password and OTP generation)
     async def login_step1(self, credentials: LoginStep1Request, uow: UnitOfWork):
@@ -126,36 +139,24 @@ class AuthService:
             if not user:
                 raise HTTPException(status_code=404, detail="User not found")
 
+            # Carrying the customer context in the token saves a lookup on customer routes
+            customer = None
+            if settings.ACCESS_TOKEN_CUSTOMER_CLAIMS:
+                customer_repo = uow.get_repository(CustomerRepository)
+                customer = await customer_repo.get_by_user_id(user.id)
+
             # Create a JWT token for the authenticated user
-            access_token = create_access_token(
-                {"id": user.id, "sub": user.username, "role": user.role}
-            )
+            access_token = create_access_token(access_token_claims(user, customer))
 
             # Reset the rate limiter for the user after successful login
             await rate_limiter.reset(user_id)
             return {"access_token": access_token, "token_type": "bearer"}
 
     # Method to get the current authenticated user based on the token
-    async def get_current_user(self, token: str, uow: UnitOfWork):
-        payload = jwt.decode(
-            token, SECRET_KEY, algorithms=[ALGORITHM]
-        )  # Decode the JWT token
-        id = payload.get("id")
-        username = payload.get("sub")
-
-        if not id or not username:
-            raise HTTPException(
-                status_code=401, detail="Could not validate credentials"
-            )
-
-        async with uow:
-            repo = uow.get_repository(AuthRepository)
-            user = await repo.get_by_id(id)
-            if not user:
-                raise HTTPException(
-                    status_code=401, detail="Could not validate credentials"
-                )
-            return user
+    async def get_current_user(self, token: str, uow: UnitOfWork) -> Principal:
+        token_data = await verify_token(token)  # Verify the token (cached per worker)
+        # Resolve the user from the principal cache, or the database on a miss
+        return await resolve_principal(token_data, uow)
 
     # Method to fetch a user by their ID
     async def get_by_id(self, id: int, uow: UnitOfWork) -> User | dict:
@@ -174,22 +175,43 @@ class AuthService:
             repo = uow.get_repository(AuthRepository)
             return await repo.get_all()
 
+    # Method to stream every user, batch by batch, for a bulk export
+    async def export_items(self, uow: UnitOfWork) -> AsyncIterator[UserOut]:
+        async with uow:
+            repo = uow.get_repository(AuthRepository)
+            async for users in repo.stream(settings.EXPORT_BATCH_SIZE):
+                for user in users:
+                    yield from_entity(UserOut, user)
+
     # Method to update user data
     async def update_item(self, id: int, user_data: UserUpdate, uow: UnitOfWork):
         async with uow:
             repo = uow.get_repository(AuthRepository)
             updated_user = await repo.update_item(id, user_data)  # Update user
+            # Built from the returned row, before the commit expires it
+            updated_user = from_entity(UserOut, updated_user)
             await uow.commit()
-            await uow.refresh(updated_user)
-            return updated_user
+
+        # Dropping the cached principal, and the tokens carrying the old role if it was changed
+        await principal_repo.invalidate(id)
+        if user_data.role is not None:
+            await revoke_user_tokens(id)
+        return updated_user
 
     # Method to delete a user by their ID
     async def delete_item(self, id: int, uow: UnitOfWork):
         async with uow:
             repo = uow.get_repository(AuthRepository)
+            # Active reservations deleted with the customer, whose reminders are
+            # dropped once the deletion is committed
+            reservation_ids = await uow.get_repository(
+                ReservationRepository
+            ).get_active_ids_by_user(id)
             deleted_user = await repo.delete_item(id)  # Delete user
             if deleted_user:
+                uow.on_commit(lambda: cancel_reservation_reminders(reservation_ids))
                 await uow.commit()
+                await principal_repo.invalidate(id)  # Drop the cached principal
                 return {"User delete successfully"}
             else:
                 raise HTTPException(
@@ -13,6 +13,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 SECRET_KEY =  settings.SECRET_KEY
 ALGORITHM =  settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
+ACCESS_TOKEN_LIFETIME = timedelta(ACCESS_TOKEN_EXPIRE_MINUTES)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -20,13 +21,26 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def access_token_claims(user, customer=None) -> dict:
+    """
+    Builds the claims of an access token for a user (or the TokenData of a previous token).
+    The customer ID and subscription tier are added when a customer is given, so
+    customer routes don't have to look them up on every request.
+    """
+    claims = {"id": user.id, "sub": user.username, "role": user.role}
+    if customer is not None and settings.ACCESS_TOKEN_CUSTOMER_CLAIMS:
+        claims["customer_id"] = customer.id
+        claims["subscription_model"] = customer.subscription_model
+    return claims
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     iran_timezone = timezone('Asia/Tehran')
     to_encode = data.copy()
+    issued_at = datetime.now(iran_timezone)
     if expires_delta:
-        expire = datetime.now(iran_timezone) + expires_delta
+        expire = issued_at + expires_delta
     else:
-        expire = datetime.now(iran_timezone) + timedelta(ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+        expire = issued_at + ACCESS_TOKEN_LIFETIME
+    to_encode.update({"exp": expire, "iat": issued_at.timestamp()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
\ No newline at end of file
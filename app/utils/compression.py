@@ -0,0 +1,102 @@
+import gzip
+import zlib
+from typing import Dict, Optional
+from app.settings import settings
+
+# Brotli is optional: without the package, responses are only compressed with gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content codings offered to clients, the preferred one first
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Media types worth compressing (JSON responses, NDJSON exports, text)
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Picks the content coding of a response from the Accept-Encoding header of the
+    request, preferring brotli when the client accepts it as much as gzip.
+
+    :param accept_encoding: The value of the Accept-Encoding header.
+    :return: The chosen coding, or None to send the response uncompressed.
+    """
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        if params.strip().startswith("q="):
+            try:
+                weight = float(params.strip()[2:])
+            except ValueError:
+                continue
+        weights[coding.strip()] = weight
+    best, best_weight = None, 0.0
+    for coding in ENCODINGS:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(body: bytes, encoding: str, cached: bool = False) -> bytes:
+    """
+    Compresses a whole response body.
+
+    Bodies that are cached are compressed once and served many times, so they
+    get the highest levels; the others are compressed on every request.
+
+    :param body: The body to compress.
+    :param encoding: "br" or "gzip".
+    :param cached: Whether the compressed body is cached.
+    """
+    if encoding == "br":
+        quality = (
+            settings.COMPRESSION_CACHED_BROTLI_QUALITY
+            if cached
+            else settings.COMPRESSION_BROTLI_QUALITY
+        )
+        return brotli.compress(body, quality=quality)
+    level = 9 if cached else settings.COMPRESSION_GZIP_LEVEL
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class StreamCompressor:
+    def __init__(self, encoding: str):
+        """
+        Compresses a response body sent in chunks, flushing every chunk so the
+        client can decode what it received so far.
+
+        :param encoding: "br" or "gzip".
+        """
+        if encoding == "br":
+            self._compressor = brotli.Compressor(
+                quality=settings.COMPRESSION_BROTLI_QUALITY
+            )
+        else:
+            # A gzip header and trailer around a deflate stream
+            self._compressor = zlib.compressobj(
+                settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31
+            )
+        self.encoding = encoding
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
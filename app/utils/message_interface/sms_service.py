@@ -1,6 +1,9 @@
+import asyncio
 import random
 import time
-from typing import List, Dict
+from typing import List, Dict, Optional
+import redis.asyncio as redis
+from prometheus_client import Counter, Gauge
 
 
 class SmsProvider:
@@ -104,28 +107,155 @@ class Signal(SmsProvider):
         return result
 
 
+# Evaluates one circuit breaker operation atomically and returns
+# {allowed, previous state, new state}. ARGV: operation, now (ms), failure threshold,
+# reset time (ms), half-open probe limit, successes needed to close.
+CIRCUIT_BREAKER_SCRIPT = """
+local key = KEYS[1]
+local operation = ARGV[1]
+local now = tonumber(ARGV[2])
+local failure_threshold = tonumber(ARGV[3])
+local reset_ms = tonumber(ARGV[4])
+local max_probes = tonumber(ARGV[5])
+local success_threshold = tonumber(ARGV[6])
+
+local state = redis.call('HGET', key, 'state') or 'closed'
+local previous = state
+local allowed = 1
+
+-- An open circuit becomes half-open once the reset time has elapsed
+if state == 'open' and now - tonumber(redis.call('HGET', key, 'changed_at')) >= reset_ms then
+    state = 'half_open'
+    redis.call('HSET', key, 'state', state, 'changed_at', now, 'probes', 0, 'successes', 0)
+end
+
+if operation == 'allow' then
+    if state == 'open' then
+        allowed = 0
+    elseif state == 'half_open' then
+        local probes = tonumber(redis.call('HGET', key, 'probes'))
+        -- Probes that never reported back release their slots after the reset time
+        if probes >= max_probes and now - tonumber(redis.call('HGET', key, 'changed_at')) >= reset_ms then
+            redis.call('HSET', key, 'changed_at', now, 'probes', 0)
+            probes = 0
+        end
+        if probes < max_probes then
+            redis.call('HINCRBY', key, 'probes', 1)
+        else
+            allowed = 0
+        end
+    end
+elseif operation == 'success' then
+    if state == 'half_open' then
+        if redis.call('HINCRBY', key, 'successes', 1) >= success_threshold then
+            state = 'closed'
+            redis.call('HSET', key, 'state', state, 'changed_at', now, 'failures', 0)
+        end
+    elseif state == 'closed' then
+        redis.call('HSET', key, 'failures', 0)
+    end
+elseif operation == 'failure' then
+    if state == 'half_open' then
+        state = 'open'
+        redis.call('HSET', key, 'state', state, 'changed_at', now)
+    elseif state == 'closed' then
+        if redis.call('HINCRBY', key, 'failures', 1) >= failure_threshold then
+            state = 'open'
+            redis.call('HSET', key, 'state', state, 'changed_at', now)
+        end
+    end
+end
+
+return {allowed, previous, state}
+"""
+
+# Numeric value of each circuit state, as exported by the state gauge
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+CIRCUIT_STATE = Gauge(
+    "sms_circuit_breaker_state",
+    "Circuit breaker state of each SMS provider (0 closed, 1 half-open, 2 open).",
+    ["provider"],
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "sms_circuit_breaker_transitions_total",
+    "Circuit breaker state changes of each SMS provider.",
+    ["provider", "from_state", "to_state"],
+)
+
+
 class CircuitBreaker:
     """
     Circuit Breaker pattern to prevent repeated failures from a service provider.
-    Tracks failures and provides a mechanism to prevent further attempts for a certain time.
+    The state of every provider is shared by all workers through Redis and moves through
+    closed, open and half-open states: consecutive failures open the circuit, and once the
+    reset time has elapsed a limited number of probe requests decide whether it closes again.
     """
 
-    def __init__(self, failure_threshold: int, reset_time: int):
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        failure_threshold: int,
+        reset_time: int,
+        half_open_max_probes: int = 1,
+        success_threshold: int = 1,
+        key_prefix: str = "circuit_breaker",
+    ):
         """
         Initializes the CircuitBreaker with given failure threshold and reset time.
 
         Args:
-            failure_threshold (int): Maximum number of failures before a provider is 'blocked'.
-            reset_time (int): Time (in seconds) before the failure count is reset for a provider.
+            redis_client (redis.Redis): Async Redis client holding the shared circuit states.
+            failure_threshold (int): Consecutive failures (across all workers) that open the circuit.
+            reset_time (int): Time (in seconds) an open circuit waits before letting probes through.
+            half_open_max_probes (int): Maximum number of concurrent probe requests in half-open state.
+            success_threshold (int): Successful probes needed to close the circuit again.
+            key_prefix (str): Prefix of the Redis keys holding the circuit states.
         """
+        self.redis = redis_client
         self.failure_threshold = failure_threshold
         self.reset_time = reset_time
-        self.failures: Dict[str, int] = {}
-        self.last_failure_time: Dict[str, float] = {}
+        self.half_open_max_probes = half_open_max_probes
+        self.success_threshold = success_threshold
+        self.key_prefix = key_prefix
+        self._script = self.redis.register_script(CIRCUIT_BREAKER_SCRIPT)
+
+    async def _apply(self, operation: str, provider_name: str) -> bool:
+        """
+        Runs one operation of the state machine and publishes the resulting state as metrics.
+
+        If Redis is unavailable the circuit is treated as closed, so OTP delivery does not
+        depend on the breaker storage.
+
+        Returns:
+            bool: Whether the operation allows a request to the provider.
+        """
+        try:
+            allowed, previous, state = await self._script(
+                keys=[f"{self.key_prefix}:{provider_name}"],
+                args=[
+                    operation,
+                    int(time.time() * 1000),
+                    self.failure_threshold,
+                    self.reset_time * 1000,
+                    self.half_open_max_probes,
+                    self.success_threshold,
+                ],
+            )
+        except redis.RedisError as e:
+            print(f"Circuit breaker unavailable for {provider_name}: {e}")
+            return True
 
-    def can_attempt(self, provider_name: str) -> bool:
+        previous, state = _decode(previous), _decode(state)
+        CIRCUIT_STATE.labels(provider_name).set(CIRCUIT_STATES[state])
+        if previous != state:
+            CIRCUIT_TRANSITIONS.labels(provider_name, previous, state).inc()
+        return bool(allowed)
+
+    async def can_attempt(self, provider_name: str) -> bool:
         """
-        Checks if a provider can be used for sending OTP based on failure history.
+        Checks if a provider can be used for sending OTP based on its circuit state.
+        In half-open state, a successful check takes one of the probe slots.
 
         Args:
             provider_name (str): The name of the provider to check.
@@ -133,48 +263,172 @@ class CircuitBreaker:
         Returns:
             bool: `True` if the provider can be used, `False` otherwise.
         """
-        if provider_name not in self.failures:
-            return True
-        if self.failures[provider_name] < self.failure_threshold:
-            return True
-        if time.time() - self.last_failure_time[provider_name] > self.reset_time:
-            self.failures[provider_name] = 0
-            return True
-        return False
+        return await self._apply("allow", provider_name)
 
-    def record_failure(self, provider_name: str):
+    async def record_success(self, provider_name: str):
         """
-        Records a failure for a provider and logs the time of failure.
+        Records a success for a provider, closing its circuit after enough successful probes.
+
+        Args:
+            provider_name (str): The provider for which the success is recorded.
+        """
+        await self._apply("success", provider_name)
+
+    async def record_failure(self, provider_name: str):
+        """
+        Records a failure for a provider, opening its circuit once the threshold is reached.
 
         Args:
             provider_name (str): The provider for which the failure is recorded.
         """
-        self.failures[provider_name] = self.failures.get(provider_name, 0) + 1
-        self.last_failure_time[provider_name] = time.time()
+        await self._apply("failure", provider_name)
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class ProviderStats:
+    """
+    Tracks the exponentially weighted moving average (EWMA) of a provider's
+    latency and success rate, and turns them into a routing score.
+    """
+
+    def __init__(self, alpha: float = 0.2, failure_penalty: float = 1.0):
+        """
+        Initializes the statistics of a provider that has not been used yet.
+
+        A new provider starts with no latency and a perfect success rate, so it is
+        tried before its score is based on real observations.
+
+        Args:
+            alpha (float): Weight of the newest observation in the moving averages.
+            failure_penalty (float): Seconds added to the score for a provider that always fails,
+                so providers failing fast are not mistaken for fast ones.
+        """
+        self.alpha = alpha
+        self.failure_penalty = failure_penalty
+        self.latency = 0.0
+        self.success_rate = 1.0
+
+    def record(self, latency: float, success: bool):
+        """
+        Folds the outcome of one attempt into the moving averages.
+
+        Args:
+            latency (float): Duration of the attempt in seconds.
+            success (bool): Whether the provider sent the OTP.
+        """
+        self.latency += self.alpha * (latency - self.latency)
+        self.success_rate += self.alpha * (float(success) - self.success_rate)
+
+    @property
+    def score(self) -> float:
+        """
+        Expected cost of routing a message to the provider; lower is better.
+
+        Returns:
+            float: The average latency weighted by the inverse of the success rate,
+                plus the failure penalty scaled by the failure rate.
+        """
+        return (
+            self.latency / max(self.success_rate, 0.01)
+            + (1 - self.success_rate) * self.failure_penalty
+        )
 
 
 class SmsService:
     """
     Service that manages multiple SMS providers for sending OTPs.
-    Uses the Circuit Breaker to handle provider failures and rotates providers if necessary.
+    Routes each OTP to the provider with the best latency and success rate, optionally
+    hedges slow sends with a second provider, and uses the Circuit Breaker to skip
+    failing providers.
     """
 
-    def __init__(self, providers: List[SmsProvider]):
+    def __init__(
+        self,
+        providers: List[SmsProvider],
+        circuit_breaker: CircuitBreaker,
+        hedge_after: Optional[float] = None,
+        exploration_rate: float = 0.05,
+    ):
         """
         Initializes the SmsService with a list of SMS providers and a CircuitBreaker.
 
         Args:
             providers (List[SmsProvider]): List of SMS providers to be used.
+            circuit_breaker (CircuitBreaker): Circuit breaker shared by all workers.
+            hedge_after (Optional[float]): Seconds to wait for the best provider before
+                also sending through the next-best one. `None` disables hedging.
+            exploration_rate (float): Probability of trying a random healthy provider first,
+                so the statistics of providers that are not the best keep being refreshed.
         """
         self.providers = providers
-        self.circuit_breaker = CircuitBreaker(failure_threshold=3, reset_time=60)
-        self.current_index = 0
+        self.circuit_breaker = circuit_breaker
+        self.stats: Dict[str, ProviderStats] = {
+            provider.__class__.__name__: ProviderStats() for provider in providers
+        }
+        self.hedge_after = hedge_after
+        self.exploration_rate = exploration_rate
+
+    def _ranked_providers(self) -> List[SmsProvider]:
+        """
+        Orders the providers by routing score.
+
+        Returns:
+            List[SmsProvider]: The providers, best first.
+        """
+        ranked = sorted(
+            self.providers,
+            key=lambda provider: self.stats[provider.__class__.__name__].score,
+        )
+        if len(ranked) > 1 and random.random() < self.exploration_rate:
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        return ranked
+
+    async def _next_provider(self, ranked: List[SmsProvider]) -> Optional[SmsProvider]:
+        """
+        Pops providers from the ranking until one is allowed by the Circuit Breaker.
+
+        Returns:
+            Optional[SmsProvider]: The best remaining usable provider, if any.
+        """
+        while ranked:
+            provider = ranked.pop(0)
+            if await self.circuit_breaker.can_attempt(provider.__class__.__name__):
+                return provider
+        return None
+
+    async def _attempt(
+        self, provider: SmsProvider, phone_number: str, otp_code: str
+    ) -> str:
+        """
+        Sends the OTP through one provider and records the outcome.
+
+        Raises:
+            Exception: If the provider fails to send the OTP.
+        """
+        provider_name = provider.__class__.__name__
+        started = time.perf_counter()
+        try:
+            otp_sent = await provider.send_otp(phone_number, otp_code)
+        except Exception:
+            self.stats[provider_name].record(time.perf_counter() - started, False)
+            await self.circuit_breaker.record_failure(provider_name)
+            raise
+        self.stats[provider_name].record(time.perf_counter() - started, bool(otp_sent))
+        if not otp_sent:
+            await self.circuit_breaker.record_failure(provider_name)
+            raise Exception(f"{provider_name} did not send the OTP")
+        await self.circuit_breaker.record_success(provider_name)
+        return otp_sent
 
     async def send_otp(self, phone_number: str, otp_code: str) -> str:
         """
-        Attempts to send OTP through each provider in the list, rotating through them.
-        If one provider fails, it moves to the next, and uses the CircuitBreaker to prevent
-        repeated failures.
+        Sends the OTP through the best-scoring provider. If hedging is enabled and the
+        provider has not answered after `hedge_after` seconds, the next-best provider is
+        tried in parallel and whichever succeeds first wins. When the attempted providers
+        fail, the next ones in the ranking are used.
 
         Args:
             phone_number (str): The phone number to which the OTP should be sent.
@@ -186,19 +440,31 @@ class SmsService:
         Raises:
             Exception: If all providers fail.
         """
-        for _ in range(len(self.providers)):
-            provider = self.providers[self.current_index]
-            provider_name = provider.__class__.__name__
-
-            if self.circuit_breaker.can_attempt(provider_name):
-                try:
-                    otp_sent = await provider.send_otp(phone_number, otp_code)
-                    if otp_sent:
-                        return otp_sent
-                except Exception:
-                    self.circuit_breaker.record_failure(provider_name)
-
-            # Rotate to the next provider
-            self.current_index = (self.current_index + 1) % len(self.providers)
+        ranked = self._ranked_providers()
+        while provider := await self._next_provider(ranked):
+            pending = {
+                asyncio.create_task(self._attempt(provider, phone_number, otp_code))
+            }
+
+            # Hedge with the next-best provider if the best one is slow to answer
+            if self.hedge_after is not None and ranked:
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_after)
+                if not done and (hedge := await self._next_provider(ranked)):
+                    pending.add(
+                        asyncio.create_task(
+                            self._attempt(hedge, phone_number, otp_code)
+                        )
+                    )
+
+            # Keep whichever attempt succeeds first and cancel the other one
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        for other in pending:
+                            other.cancel()
+                        return task.result()
 
         raise Exception("All providers failed")
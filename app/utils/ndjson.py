@@ -0,0 +1,64 @@
+from typing import Any, AsyncIterator, Type, TypeVar
+from pydantic import BaseModel
+from starlette.responses import StreamingResponse
+
+M = TypeVar("M", bound=BaseModel)
+
+# NDJSON lines are sent in chunks of about this many bytes
+CHUNK_SIZE = 64 * 1024
+
+
+def from_entity(model: Type[M], entity: Any, **values) -> M:
+    """
+    Builds an output schema from an entity loaded from the database without validating it,
+    since the data was validated when it was written.
+
+    :param model: The output schema.
+    :param entity: The entity to read the fields from.
+    :param values: Fields that are not attributes of the entity (e.g. related IDs).
+    """
+    fields = {
+        name: getattr(entity, name)
+        for name in model.model_fields
+        if name not in values and hasattr(entity, name)
+    }
+    return model.model_construct(**fields, **values)
+
+
+async def ndjson_chunks(
+    items: AsyncIterator[BaseModel], chunk_size: int = CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Serializes items as newline-delimited JSON, grouping lines into chunks.
+
+    The next item is only pulled once the previous chunk was handed to the server,
+    so a slow client slows down the database read instead of filling memory.
+
+    :param items: The items to serialize.
+    :param chunk_size: Approximate number of bytes per chunk.
+    """
+    buffer = bytearray()
+    async for item in items:
+        # Items built by from_entity may hold plain values for enum fields (e.g. a role
+        # read as a string), which serialize the same, so the type warnings are muted
+        buffer += item.model_dump_json(warnings=False).encode()
+        buffer += b"\n"
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def ndjson_response(items: AsyncIterator[BaseModel], filename: str) -> StreamingResponse:
+    """
+    Streams items to the client as an NDJSON download.
+
+    :param items: The items to stream.
+    :param filename: Name of the downloaded file.
+    """
+    return StreamingResponse(
+        ndjson_chunks(items),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,61 @@
+import hashlib
+from typing import Any
+import orjson
+from pydantic_core import to_jsonable_python
+from starlette.responses import JSONResponse
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serializes content to JSON with orjson. Pydantic models, which orjson doesn't
+    know, are converted by pydantic's own serializer, without validating them again.
+
+    :param content: The content to serialize.
+    """
+    return orjson.dumps(content, default=to_jsonable_python)
+
+
+def loads(data: bytes | str) -> Any:
+    """
+    Parses JSON with orjson.
+
+    :param data: The JSON to parse.
+    """
+    return orjson.loads(data)
+
+
+def make_etag(body: bytes) -> str:
+    """
+    Returns the ETag of a response body, a hash of its content. The ETag is weak,
+    as it identifies the body in every content coding it is sent with.
+
+    :param body: The response body.
+    """
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Checks an If-None-Match header against the current ETag of a resource.
+    Weak comparison is used, as a GET is allowed to.
+
+    :param if_none_match: The value of the If-None-Match header.
+    :param etag: The current ETag of the resource.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag.removeprefix("W/") in candidates
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response serialized with orjson.
+
+    Routes return it directly, so FastAPI neither validates the content against the
+    response_model again nor runs it through its own encoder, the response_model
+    only documents the route.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,72 @@
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    def __init__(self, max_size: int, ttl: float):
+        """
+        Bounded in-process LRU cache whose entries expire after a time-to-live.
+
+        It is meant for small per-worker caches in front of Redis: lookups never
+        block, the least recently used entry is evicted once `max_size` is reached,
+        and expired entries are dropped lazily when they are read.
+
+        :param max_size: Maximum number of entries kept in the cache.
+        :param ttl: Default number of seconds an entry stays valid.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple[float, V]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Optional[V]:
+        """
+        Returns the value stored under the key, or `default` if it is missing or expired.
+
+        :param key: The cache key.
+        :param default: Value returned when there is no valid entry.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None):
+        """
+        Stores a value, evicting the least recently used entry if the cache is full.
+
+        :param key: The cache key.
+        :param value: The value to store.
+        :param ttl: Seconds the entry stays valid, defaults to the cache TTL.
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Optional[V]:
+        """
+        Removes the entry stored under the key and returns its value if it was still valid.
+
+        :param key: The cache key.
+        :param default: Value returned when there is no valid entry.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def clear(self):
+        """Removes every entry."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
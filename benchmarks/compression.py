@@ -0,0 +1,79 @@
+import argparse
+import gzip
+import random
+import time
+from app.book.domain.entities import BookOut
+from app.utils.compression import brotli
+from app.utils.responses import dumps
+
+# Words the descriptions are drawn from, so they compress like prose rather than
+# like a repeated string
+WORDS = (
+    "the a of and to in novel story author reader history world life war love city "
+    "family journey time secret night house first last new old young great small "
+    "finds discovers returns must between through after before during against "
+    "classic modern award winning bestselling edition translated illustrated"
+).split()
+
+
+def catalog_page(books: int, description_length: int) -> bytes:
+    # A page of books as GET /books returns it
+    rng = random.Random(0)
+    page = []
+    for i in range(books):
+        words = []
+        while sum(len(word) + 1 for word in words) < description_length:
+            words.append(rng.choice(WORDS))
+        page.append(
+            BookOut.model_construct(
+                id=i,
+                title=f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}",
+                isbn=f"{rng.randrange(10**12, 10**13)}",
+                price=rng.randrange(10_000, 500_000),
+                genre_id=rng.randrange(1, 20),
+                description=" ".join(words)[:description_length],
+                units=rng.randrange(0, 50),
+                author_ids=[rng.randrange(1, 500)],
+            )
+        )
+    return dumps(page)
+
+
+def timed(compress, body: bytes, repeat: int):
+    # Size of the compressed body and milliseconds to compress it
+    started = time.perf_counter()
+    for _ in range(repeat):
+        compressed = compress(body)
+    return len(compressed), (time.perf_counter() - started) / repeat * 1000
+
+
+def main(args):
+    body = catalog_page(args.books, args.description_length)
+    codecs = [
+        (f"gzip {level}", lambda data, level=level: gzip.compress(data, level, mtime=0))
+        for level in (1, 6, 9)
+    ]
+    if brotli is not None:
+        codecs += [
+            (f"br {quality}", lambda data, q=quality: brotli.compress(data, quality=q))
+            for quality in (4, 9, 11)
+        ]
+    else:
+        print("brotli is not installed, only gzip is measured")
+
+    print(f"{'coding':<8} {'bytes':>9} {'ratio':>7} {'ms/page':>8}")
+    print(f"{'identity':<8} {len(body):>9,} {1:>6.1f}x {0:>8.2f}")
+    for name, compress in codecs:
+        size, ms = timed(compress, body, args.repeat)
+        print(f"{name:<8} {size:>9,} {len(body) / size:>6.1f}x {ms:>8.2f}")
+
+
+# Run with: python -m benchmarks.compression
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Size and cost of compressed pages")
+    parser.add_argument("--books", type=int, default=100, help="Books per page")
+    parser.add_argument(
+        "--description-length", type=int, default=1000, help="Characters per description"
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="Compressions timed")
+    main(parser.parse_args())
@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Optional
+import httpx
+from sqlalchemy.engine import make_url
+from benchmarks.load_test.stand_ins import boot
+
+# Scenarios the virtual users can run (their weights are in scenarios.WEIGHTS)
+SCENARIOS = ("browse", "search", "reserve", "login")
+
+
+def revision() -> Optional[str]:
+    # Commit of the measured tree, to tell the result files apart
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: dict):
+    print(
+        f"{'route':<46} {'requests':>8} {'errors':>7} {'rps':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    for route, row in [*report["routes"].items(), ("total", report["total"])]:
+        print(
+            f"{route:<46} {row['requests']:>8} {row['errors']:>7} {row['rps']:>8} "
+            f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}"
+        )
+
+
+def print_comparison(report: dict, baseline: dict):
+    # Change of the throughput and tail latency of each route since the baseline
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\nChange since {baseline.get('revision') or 'the baseline'}:")
+    print(f"{'route':<46} {'rps':>8} {'p95':>8} {'p99':>8}")
+    for route, row in [*report["routes"].items(), ("total", report["total"])]:
+        old = baseline["total"] if route == "total" else baseline["routes"].get(route)
+        if not old:
+            continue
+        print(
+            f"{route:<46} {change(row['rps'], old['rps']):>8} "
+            f"{change(row['p95_ms'], old['p95_ms']):>8} "
+            f"{change(row['p99_ms'], old['p99_ms']):>8}"
+        )
+
+
+async def main(args):
+    app, stand_ins = boot(args.database_url)
+    # Imported once the application is wired to the stand-ins
+    from app.infrastructure.password_hasher import password_hasher
+    from benchmarks.load_test.scenarios import (
+        WEIGHTS,
+        Recorder,
+        VirtualUser,
+        seed,
+    )
+
+    scenarios = {name: WEIGHTS[name] for name in args.scenarios}
+    catalog = await seed(stand_ins.collection, args.books, args.users)
+    recorder = Recorder()
+
+    # Exceptions of the application become 500 responses, as behind a server
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    try:
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://load-test", timeout=30
+        ) as client:
+            users = [
+                VirtualUser(client, recorder, catalog, customer, seed=i)
+                for i, customer in enumerate(catalog.customers)
+            ]
+            # Every user logs in before the warm-up, its requests not measured
+            await asyncio.gather(*(user.login() for user in users))
+
+            recorder.reset()
+            deadline = time.monotonic() + args.warmup + args.duration
+            asyncio.get_running_loop().call_later(args.warmup, recorder.reset)
+            await asyncio.gather(*(user.run(scenarios, deadline) for user in users))
+    finally:
+        password_hasher.shutdown()
+
+    report = {
+        "revision": revision(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {
+            "database": make_url(args.database_url).render_as_string(
+                hide_password=True
+            ),
+            "users": args.users,
+            "books": args.books,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "scenarios": scenarios,
+        },
+        **recorder.report(),
+        "events_published": dict(stand_ins.broker.published),
+    }
+    print_report(report)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+        file.write("\n")
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            print_comparison(report, json.load(file))
+
+
+# Run with: python -m benchmarks.load_test --users 20 --duration 30
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Throughput and latency of the API against local stand-ins"
+    )
+    parser.add_argument(
+        "--database-url",
+        default="sqlite+aiosqlite:///"
+        + os.path.join(tempfile.gettempdir(), "bookstore_load_test.db"),
+        help="Database to run against, its tables are dropped and recreated",
+    )
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--books", type=int, default=1000, help="Books in the catalog")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds measured")
+    parser.add_argument(
+        "--warmup", type=float, default=5, help="Seconds run before measuring"
+    )
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        choices=SCENARIOS,
+        default=list(SCENARIOS),
+        help="Scenarios the virtual users pick from",
+    )
+    parser.add_argument("--output", default="load_test.json", help="JSON results file")
+    parser.add_argument("--baseline", help="Results file of an earlier run to compare")
+    asyncio.run(main(parser.parse_args()))
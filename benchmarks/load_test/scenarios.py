@@ -0,0 +1,335 @@
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional
+import httpx
+from sqlalchemy import func, insert, select
+from app.adapters.data_models import (
+    author_table,
+    book_author_table,
+    book_table,
+    city_table,
+    customer_table,
+    genre_table,
+    metadata,
+    reservation_table,
+    user_table,
+)
+from app.db import database
+from app.infrastructure.password_hasher import password_hasher
+from benchmarks.compression import WORDS
+from benchmarks.stubs.mongo_collection import InMemoryCollection
+
+# Password of every seeded user, hashed once
+PASSWORD = "load-test-password"
+
+# Books per page of the catalog browsed and searched
+PAGE_SIZE = 20
+
+# How often a virtual user picks each scenario
+WEIGHTS = {"browse": 60, "search": 25, "reserve": 10, "login": 5}
+
+
+class Customer(NamedTuple):
+    username: str
+    customer_id: int
+
+
+class Catalog(NamedTuple):
+    book_ids: List[int]
+    customers: List[Customer]
+
+
+async def seed(collection: InMemoryCollection, books: int, customers: int) -> Catalog:
+    """
+    Recreates the tables and fills them with a catalog of books and premium
+    customers with enough money to reserve for the whole run, and puts the books
+    in the MongoDB catalog as its consumer of book events would.
+
+    :param collection: The stand-in of the MongoDB catalog.
+    :param books: Number of books.
+    :param customers: Number of customers, one per virtual user.
+    """
+    rng = random.Random(0)
+    async with database.engine.begin() as conn:
+        await conn.run_sync(metadata.drop_all)
+        await conn.run_sync(metadata.create_all)
+
+    hashed_password = await password_hasher.hash(PASSWORD)
+    authors = max(books // 10, 1)
+    genres = 10
+
+    def user(id: int, username: str, role: str) -> dict:
+        return {
+            "id": id,
+            "username": username,
+            "first_name": "Load",
+            "last_name": "Test",
+            "phone": "09120000000",
+            "email": f"{username}@example.com",
+            "password": hashed_password,
+            "role": role,
+            "is_active": True,
+        }
+
+    def description() -> str:
+        words = [rng.choice(WORDS) for _ in range(rng.randrange(30, 120))]
+        return " ".join(words)[:1000]
+
+    book_rows = [
+        {
+            "id": id,
+            "title": f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {id}",
+            "isbn": f"{9780000000000 + id}",
+            "price": rng.randrange(10_000, 500_000),
+            "genre_id": rng.randrange(1, genres + 1),
+            "description": description(),
+            "units": rng.randrange(1, 50),
+            "reserved_units": 0,
+        }
+        for id in range(1, books + 1)
+    ]
+    book_authors = [
+        {"book_id": book["id"], "author_id": rng.randrange(1, authors + 1)}
+        for book in book_rows
+    ]
+
+    async with database.engine.begin() as conn:
+        await conn.execute(insert(city_table), [{"id": 1, "name": "Tehran"}])
+        await conn.execute(
+            insert(genre_table),
+            [{"id": id, "name": f"Genre {id}"} for id in range(1, genres + 1)],
+        )
+        await conn.execute(
+            insert(user_table),
+            [user(id, f"author{id}", "author") for id in range(1, authors + 1)]
+            + [
+                user(authors + id, f"customer{id}", "customer")
+                for id in range(1, customers + 1)
+            ],
+        )
+        await conn.execute(
+            insert(author_table),
+            [
+                {
+                    "id": id,
+                    "user_id": id,
+                    "city_id": 1,
+                    "bank_account_number": f"{id:016d}",
+                }
+                for id in range(1, authors + 1)
+            ],
+        )
+        await conn.execute(
+            insert(customer_table),
+            [
+                {
+                    "id": id,
+                    "user_id": authors + id,
+                    "subscription_model": "premium",
+                    "subscription_end_time": datetime.now(timezone.utc)
+                    + timedelta(days=365),
+                    "wallet_money_amount": 10**9,
+                }
+                for id in range(1, customers + 1)
+            ],
+        )
+        await conn.execute(insert(book_table), book_rows)
+        await conn.execute(insert(book_author_table), book_authors)
+
+    await collection.insert_many(
+        [
+            {
+                "_id": book["id"],
+                **{name: value for name, value in book.items() if name != "id"},
+                "author_ids": [author["author_id"]],
+            }
+            for book, author in zip(book_rows, book_authors)
+        ]
+    )
+    return Catalog(
+        book_ids=[book["id"] for book in book_rows],
+        customers=[
+            Customer(f"customer{id}", id) for id in range(1, customers + 1)
+        ],
+    )
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    # Nearest-rank percentile of sorted latencies, in milliseconds
+    index = max(int(round(fraction * len(latencies))) - 1, 0)
+    return round(latencies[index] * 1000, 2)
+
+
+class Recorder:
+    def __init__(self):
+        """
+        Records the latency and status of every request by route, the route
+        being its method and path template (e.g. "GET /books/{book_id}").
+        """
+        self.reset()
+
+    def reset(self):
+        # Drops what was recorded so far, at the end of the warm-up
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.started = time.monotonic()
+
+    async def request(
+        self, client: httpx.AsyncClient, method: str, route: str, url: str, **kwargs
+    ) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError:
+            response, status = None, 0
+        self.latencies[route].append(time.perf_counter() - started)
+        self.statuses[route][status] += 1
+        return response if response is not None and status < 400 else None
+
+    def report(self) -> dict:
+        """
+        Returns the requests, errors (no response or a 4xx/5xx status), requests per
+        second and p50/p95/p99 latencies of each route and of all of them, since
+        the recorder was last reset.
+        """
+        elapsed = time.monotonic() - self.started
+
+        def summary(latencies: List[float], statuses: Counter) -> dict:
+            latencies = sorted(latencies)
+            return {
+                "requests": len(latencies),
+                "errors": sum(n for status, n in statuses.items() if not 0 < status < 400),
+                "rps": round(len(latencies) / elapsed, 1),
+                "p50_ms": percentile(latencies, 0.50),
+                "p95_ms": percentile(latencies, 0.95),
+                "p99_ms": percentile(latencies, 0.99),
+                "statuses": {str(status): n for status, n in sorted(statuses.items())},
+            }
+
+        routes = {
+            route: summary(self.latencies[route], self.statuses[route])
+            for route in sorted(self.latencies)
+        }
+        every = [latency for latencies in self.latencies.values() for latency in latencies]
+        statuses = sum(self.statuses.values(), Counter())
+        return {
+            "duration_s": round(elapsed, 1),
+            "total": summary(every, statuses) if every else {},
+            "routes": routes,
+        }
+
+
+class VirtualUser:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        recorder: Recorder,
+        catalog: Catalog,
+        customer: Customer,
+        seed: int,
+    ):
+        """
+        A customer using the API, one scenario after another.
+
+        :param client: The HTTP client of the application.
+        :param recorder: Where the requests are recorded.
+        :param catalog: The seeded books and customers.
+        :param customer: The customer the user logs in as.
+        :param seed: Seed of the user's random choices, for repeatable runs.
+        """
+        self.client = client
+        self.recorder = recorder
+        self.catalog = catalog
+        self.customer = customer
+        self.rng = random.Random(seed)
+        self.token: Optional[str] = None
+
+    async def run(self, scenarios: Dict[str, int], deadline: float):
+        names, weights = list(scenarios), list(scenarios.values())
+        while time.monotonic() < deadline:
+            await getattr(self, self.rng.choices(names, weights)[0])()
+
+    async def browse(self):
+        # A page of the catalog, then a few of its books
+        pages = max(len(self.catalog.book_ids) // PAGE_SIZE, 1)
+        skip = self.rng.randrange(pages) * PAGE_SIZE
+        await self.recorder.request(
+            self.client, "GET", "GET /books/", f"/books/?skip={skip}&limit={PAGE_SIZE}"
+        )
+        for book_id in self.rng.sample(
+            self.catalog.book_ids[skip : skip + PAGE_SIZE], 3
+        ):
+            await self.recorder.request(
+                self.client, "GET", "GET /books/{book_id}", f"/books/{book_id}"
+            )
+
+    async def search(self):
+        query = " ".join(self.rng.sample(WORDS, 2))
+        await self.recorder.request(
+            self.client,
+            "GET",
+            "GET /books/search",
+            "/books/search",
+            params={"query": query, "limit": PAGE_SIZE},
+        )
+
+    async def login(self):
+        # The OTP is read from the response, as the SMS providers are simulated
+        response = await self.recorder.request(
+            self.client,
+            "POST",
+            "POST /users/login/step1",
+            "/users/login/step1",
+            json={"username": self.customer.username, "password": PASSWORD},
+        )
+        if response is None:
+            return
+        response = await self.recorder.request(
+            self.client,
+            "POST",
+            "POST /users/login/step2",
+            "/users/login/step2",
+            json={"otp": response.json()["otp"][-6:]},
+        )
+        if response is not None:
+            self.token = response.json()["access_token"]
+
+    async def reserve(self):
+        # Reserves a book and cancels the reservation, so the customer stays under
+        # the reservation limit of their subscription
+        if self.token is None:
+            await self.login()
+            if self.token is None:
+                return
+        headers = {"Authorization": f"Bearer {self.token}"}
+        response = await self.recorder.request(
+            self.client,
+            "POST",
+            "POST /reservations/reserve",
+            "/reservations/reserve",
+            json={"book_id": self.rng.choice(self.catalog.book_ids), "days": 7},
+            headers=headers,
+        )
+        if response is None:
+            return
+
+        # The route doesn't return the reservation, its ID is read from the
+        # database (outside of the measured requests)
+        async with database.engine.connect() as conn:
+            reservation_id = await conn.scalar(
+                select(func.max(reservation_table.c.id)).where(
+                    reservation_table.c.customer_id == self.customer.customer_id
+                )
+            )
+        if reservation_id is None:
+            return
+        await self.recorder.request(
+            self.client,
+            "DELETE",
+            "DELETE /reservations/cancel/{reservation_id}",
+            f"/reservations/cancel/{reservation_id}",
+            headers=headers,
+        )
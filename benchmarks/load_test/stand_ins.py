@@ -0,0 +1,96 @@
+import os
+from typing import Any, NamedTuple, Tuple
+from app.utils.message_interface.sms_service import SmsProvider
+from benchmarks.stubs.amqp_broker import InMemoryBroker
+from benchmarks.stubs.mongo_collection import InMemoryCollection
+
+# Settings without a default, given a value unless the environment has one
+ENVIRONMENT = {
+    "SECRET_KEY": "load-test",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+    # Every virtual user sends its requests from the same client address
+    "RATE_LIMIT_ENABLED": "false",
+}
+
+
+class LocalSms(SmsProvider):
+    """
+    SMS provider sending every OTP at once. The providers of the application are
+    simulated and fail half of the time at random, tripping their circuit breakers,
+    which would make the login throughput a matter of luck.
+    """
+
+    async def send_otp(self, phone_number: str, otp_code: str) -> str:
+        return f"LocalSms used for OTP: {otp_code}"
+
+
+class StandIns(NamedTuple):
+    broker: InMemoryBroker  # RabbitMQ
+    collection: InMemoryCollection  # The MongoDB book catalog
+    redis_server: Any  # The fakeredis server behind every Redis database
+
+
+def install(database_url: str) -> StandIns:
+    """
+    Replaces the backing services of the application by local stand-ins:
+    fakeredis for every Redis database, an in-memory collection for the MongoDB
+    catalog, an in-memory broker for RabbitMQ and an SMS provider that never
+    fails. Only the database is real, at `database_url` (SQLite or a local
+    PostgreSQL).
+
+    The application modules create their clients when they are imported, so they
+    are imported here, once the stand-ins are in place, and this must be called
+    before anything imports `app`.
+
+    :param database_url: The SQLAlchemy URL of the database, with an async driver.
+    """
+    os.environ["DATABASE_URL"] = database_url
+    for name, value in ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+
+    import fakeredis
+    from app.db import database
+    from app.infrastructure.mongodb import mongodb
+    from app.infrastructure.redis_registry import redis_registry
+
+    database.engine.echo = False
+
+    # One server for every database, each client keeping the reply decoding of the
+    # pool it replaces (the cache is binary)
+    redis_server = fakeredis.FakeServer()
+    for purpose, pool in redis_registry.pools.items():
+        redis_registry.clients[purpose] = fakeredis.FakeAsyncRedis(
+            server=redis_server,
+            db=redis_registry.databases[purpose],
+            decode_responses=pool.connection_kwargs["decode_responses"],
+        )
+
+    collection = InMemoryCollection()
+    mongodb.books_collection = collection
+
+    broker = InMemoryBroker()
+    broker.install()
+
+    from app.user.service_layer import services
+    from app.utils.message_interface.sms_service import SmsService
+
+    services.sms_service = SmsService(
+        [LocalSms()], services.sms_service.circuit_breaker
+    )
+
+    return StandIns(broker, collection, redis_server)
+
+
+def boot(database_url: str) -> Tuple[Any, StandIns]:
+    """
+    Imports the application of main.py with its backing services replaced by local
+    stand-ins (see install).
+
+    :param database_url: The SQLAlchemy URL of the database, with an async driver.
+    :return: The FastAPI application and its stand-ins.
+    """
+    stand_ins = install(database_url)
+    import main
+
+    return main.app, stand_ins
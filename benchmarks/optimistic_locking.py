@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from sqlalchemy import delete, insert, select
+from app.adapters.data_models import book_table, genre_table
+from app.adapters.mappers import start_mappers
+from app.adapters.repositories.book_repo import BookRepository
+from app.db import database
+from app.db.base import mapper_registry
+from app.db.unit_of_work import UnitOfWork
+from app.exceptions import ConcurrencyConflictError
+
+# ISBN prefix of the books created by the benchmark, removed when it ends
+ISBN_PREFIX = "999"
+
+
+async def seed(rows: int) -> list:
+    # Creates the books the workers compete for, in a genre of their own
+    async with database.engine.begin() as conn:
+        await conn.execute(
+            delete(book_table).where(book_table.c.isbn.like(f"{ISBN_PREFIX}%"))
+        )
+        genre_id = await conn.scalar(
+            select(genre_table.c.id).where(genre_table.c.name == "benchmark")
+        )
+        if genre_id is None:
+            genre_id = await conn.scalar(
+                insert(genre_table).values(name="benchmark").returning(genre_table.c.id)
+            )
+        result = await conn.execute(
+            insert(book_table).returning(book_table.c.id),
+            [
+                {
+                    "title": f"Benchmark book {i}",
+                    "isbn": f"{ISBN_PREFIX}{i:010d}",
+                    "price": 1000,
+                    "genre_id": genre_id,
+                    "description": "Book created by the locking benchmark",
+                    "units": 0,
+                    "reserved_units": 0,
+                }
+                for i in range(rows)
+            ],
+        )
+        return list(result.scalars())
+
+
+async def total_units(book_ids: list) -> int:
+    async with database.engine.connect() as conn:
+        result = await conn.execute(
+            select(book_table.c.units).where(book_table.c.id.in_(book_ids))
+        )
+        return sum(result.scalars())
+
+
+async def run_case(name: str, optimistic: bool, book_ids: list, args) -> None:
+    # Runs the mixed workload with one locking strategy and reports its throughput
+    stats = {"reads": 0, "writes": 0, "attempts": 0, "conflicts": 0}
+    write_latencies = []
+    deadline = time.perf_counter() + args.duration
+    units_before = await total_units(book_ids)
+
+    async def increment(repo: BookRepository, book_id: int):
+        # Read-modify-write of a book, the kind of update a lost update would corrupt
+        stats["attempts"] += 1
+        book = await repo.get_for_update(book_id)
+        book.units += 1
+        await repo.session.flush()
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            book_id = random.choice(book_ids)
+            async with UnitOfWork() as uow:
+                repo = uow.get_repository(BookRepository)
+                repo.optimistic_locking = optimistic
+                if random.random() >= args.write_ratio:
+                    await repo.get(book_id)
+                    stats["reads"] += 1
+                    continue
+
+                started = time.perf_counter()
+                try:
+                    if optimistic:
+                        await repo.retry_on_conflict(lambda: increment(repo, book_id))
+                    else:
+                        await increment(repo, book_id)
+                    await uow.commit()
+                except ConcurrencyConflictError:
+                    stats["conflicts"] += 1
+                    continue
+                write_latencies.append(time.perf_counter() - started)
+                stats["writes"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    lost_updates = stats["writes"] - (await total_units(book_ids) - units_before)
+    quantiles = [0.0] * 99
+    if len(write_latencies) > 1:
+        quantiles = statistics.quantiles(write_latencies, n=100)
+    retries = stats["attempts"] - stats["writes"] - stats["conflicts"]
+    print(
+        f"{name:<12} {(stats['reads'] + stats['writes']) / elapsed:8,.0f} ops/s  "
+        f"reads {stats['reads']:>7,}  writes {stats['writes']:>6,}  "
+        f"write p50 {quantiles[49] * 1000:6.1f}ms p99 {quantiles[98] * 1000:6.1f}ms  "
+        f"retries {retries:>5,}  "
+        f"409s {stats['conflicts']:>4,}  lost updates {lost_updates}"
+    )
+
+
+async def main(args):
+    database.engine.echo = False
+    book_ids = await seed(args.rows)
+    try:
+        await run_case("pessimistic", False, book_ids, args)
+        await run_case("optimistic", True, book_ids, args)
+    finally:
+        async with database.engine.begin() as conn:
+            await conn.execute(delete(book_table).where(book_table.c.id.in_(book_ids)))
+        await database.engine.dispose()
+
+
+# Run with: python -m benchmarks.optimistic_locking (PostgreSQL, from DATABASE_URL)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Row locks vs version checks")
+    parser.add_argument(
+        "--rows", type=int, default=20, help="Books competed for"
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per case")
+    start_mappers(mapper_registry)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import sys
+from contextlib import contextmanager
+from typing import List
+from pika import BlockingConnection, ConnectionParameters
+from sqlalchemy import delete, event, insert, select
+from app.adapters.data_models import (
+    author_table,
+    book_author_table,
+    book_table,
+    city_table,
+    genre_table,
+    reservation_table,
+    user_table,
+)
+from app.adapters.mappers import start_mappers
+from app.adapters.repositories.book_repo import BookRepository
+from app.adapters.repositories.user_repo import AuthRepository
+from app.book.domain.entities import BookUpdate
+from app.book.service_layer.service import BookService
+from app.db import database
+from app.db.base import mapper_registry
+from app.db.unit_of_work import UnitOfWork
+from app.infrastructure.rabbitmq.publish_rabbitmq import book_updates_channel
+from app.infrastructure.redis_registry import CACHE, redis_registry
+from app.reservation.domain.entities import (
+    CustomerCreate,
+    CustomerUpdate,
+    ReservationCreateSchema,
+)
+from app.reservation.service_layer.customer_service import CustomerService
+from app.reservation.service_layer.reservation_services import ReservationService
+from app.user.domain.entities import UserUpdate
+from app.user.service_layer.services import AuthService
+
+# ISBN and username prefix of the rows created by the script, removed when it ends
+PREFIX = "998"
+
+# Most statements each service method may send to the database before its commit
+# (PostgreSQL takes one more for the advisory lock of a wallet debit)
+BUDGETS = {
+    "BookService.get_item": 2,
+    "BookService.update_item": 2,
+    "BookService.update_item (authors)": 3,
+    "CustomerService.create_item": 1,
+    "CustomerService.get_item": 2,
+    "CustomerService.update_item": 4,
+    "CustomerService.charge_wallet": 1,
+    "AuthService.get_by_id": 1,
+    "AuthService.update_item": 1,
+    "ReservationService.reserve": 12,
+    "ReservationService.cancel_reservation": 6,
+    "BookService.delete_item": 2,
+    "CustomerService.delete_item": 3,
+    "AuthService.delete_item": 6,
+}
+
+
+class QueryCounter:
+    """Counts the statements sent to the database by the application engine."""
+
+    def __init__(self):
+        self.statements: List[str] = []
+        event.listen(database.engine.sync_engine, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @contextmanager
+    def measure(self, name: str, results: dict):
+        # Records the statements sent within the block under the given name
+        start = len(self.statements)
+        yield
+        results[name] = self.statements[start:]
+
+
+async def seed() -> dict:
+    # Creates a user and an author for each service to work on
+    await cleanup()
+    async with database.engine.begin() as conn:
+        city_id = await conn.scalar(
+            insert(city_table)
+            .values(name=f"{PREFIX} city")
+            .returning(city_table.c.id)
+        )
+        genre_id = await conn.scalar(
+            insert(genre_table)
+            .values(name=f"{PREFIX} genre")
+            .returning(genre_table.c.id)
+        )
+        user_ids = []
+        for name in ("customer", "author"):
+            user_ids.append(
+                await conn.scalar(
+                    insert(user_table)
+                    .values(
+                        username=f"{PREFIX}_{name}",
+                        first_name="Query",
+                        last_name="Counts",
+                        phone="09120000000",
+                        email=f"{PREFIX}_{name}@example.com",
+                        role=name,
+                        password="-",
+                        is_active=True,
+                    )
+                    .returning(user_table.c.id)
+                )
+            )
+        author_id = await conn.scalar(
+            insert(author_table)
+            .values(
+                user_id=user_ids[1],
+                city_id=city_id,
+                goodreads_link="https://www.goodreads.com",
+                bank_account_number="0",
+            )
+            .returning(author_table.c.id)
+        )
+        book_id = await conn.scalar(
+            insert(book_table)
+            .values(
+                title="Query counts",
+                isbn=f"{PREFIX}0000000000",
+                price=1000,
+                genre_id=genre_id,
+                description="Book created by the query count script",
+                units=5,
+                reserved_units=0,
+            )
+            .returning(book_table.c.id)
+        )
+        await conn.execute(
+            insert(book_author_table).values(book_id=book_id, author_id=author_id)
+        )
+    return {
+        "customer_user_id": user_ids[0],
+        "author_user_id": user_ids[1],
+        "author_id": author_id,
+        "book_id": book_id,
+    }
+
+
+async def cleanup():
+    # Removes the rows created by the script, including those left by a failed run
+    async with UnitOfWork() as uow:
+        users = await uow.session.scalars(
+            select(user_table.c.id).where(user_table.c.username.like(f"{PREFIX}_%"))
+        )
+        books = await uow.session.scalars(
+            select(book_table.c.id).where(book_table.c.isbn.like(f"{PREFIX}%"))
+        )
+        for user_id in users.all():
+            await uow.get_repository(AuthRepository).delete_item(user_id)
+        for book_id in books.all():
+            await uow.get_repository(BookRepository).delete_book_by_id(book_id)
+        await uow.session.execute(
+            delete(genre_table).where(genre_table.c.name == f"{PREFIX} genre")
+        )
+        await uow.session.execute(
+            delete(city_table).where(city_table.c.name == f"{PREFIX} city")
+        )
+        await uow.commit()
+
+
+async def run(ids: dict, counter: QueryCounter) -> dict:
+    results = {}
+    book_service = BookService(
+        cache=redis_registry.client(CACHE),
+        mq_channel=book_updates_channel(
+            BlockingConnection(ConnectionParameters("localhost"))
+        ),
+    )
+    customer_service = CustomerService()
+    auth_service = AuthService()
+    book_id = ids["book_id"]
+    await book_service.cache.delete(f"book:{book_id}")
+
+    async def in_transaction(service_call):
+        # Runs a service method the way the routes do, committing at the end
+        async with UnitOfWork() as uow:
+            result = await service_call(uow)
+            await uow.commit()
+            return result
+
+    with counter.measure("BookService.get_item", results):
+        await in_transaction(lambda uow: book_service.get_item(book_id, uow))
+    with counter.measure("BookService.update_item", results):
+        await in_transaction(
+            lambda uow: book_service.update_item(book_id, BookUpdate(price=2000), uow)
+        )
+    with counter.measure("BookService.update_item (authors)", results):
+        await in_transaction(
+            lambda uow: book_service.update_item(
+                book_id, BookUpdate(author_ids=[ids["author_id"]]), uow
+            )
+        )
+
+    with counter.measure("CustomerService.create_item", results):
+        customer = await customer_service.create_item(
+            CustomerCreate(
+                user_id=ids["customer_user_id"], subscription_model="premium"
+            ),
+            UnitOfWork(),
+        )
+    with counter.measure("CustomerService.get_item", results):
+        await customer_service.get_item(customer.id, UnitOfWork())
+    with counter.measure("CustomerService.update_item", results):
+        await customer_service.update_item(
+            customer.id, CustomerUpdate(wallet_money_amount=5000), UnitOfWork()
+        )
+    with counter.measure("CustomerService.charge_wallet", results):
+        await customer_service.charge_wallet(
+            ids["customer_user_id"], 1000, UnitOfWork(), customer_id=customer.id
+        )
+
+    with counter.measure("AuthService.get_by_id", results):
+        await auth_service.get_by_id(ids["author_user_id"], UnitOfWork())
+    with counter.measure("AuthService.update_item", results):
+        await auth_service.update_item(
+            ids["author_user_id"], UserUpdate(first_name="Counted"), UnitOfWork()
+        )
+
+    with counter.measure("ReservationService.reserve", results):
+        await in_transaction(
+            lambda uow: ReservationService(uow).reserve(
+                ids["customer_user_id"],
+                ReservationCreateSchema(book_id=book_id, days=3),
+            )
+        )
+    async with database.engine.connect() as conn:
+        reservation_id = await conn.scalar(
+            select(reservation_table.c.id).where(
+                reservation_table.c.customer_id == customer.id
+            )
+        )
+    with counter.measure("ReservationService.cancel_reservation", results):
+        await in_transaction(
+            lambda uow: ReservationService(uow).cancel_reservation(
+                ids["customer_user_id"], reservation_id, uow
+            )
+        )
+
+    with counter.measure("BookService.delete_item", results):
+        await in_transaction(lambda uow: book_service.delete_item(book_id, uow))
+    with counter.measure("CustomerService.delete_item", results):
+        await customer_service.delete_item(customer.id, UnitOfWork())
+    with counter.measure("AuthService.delete_item", results):
+        await auth_service.delete_item(ids["author_user_id"], UnitOfWork())
+    return results
+
+
+async def main(args) -> bool:
+    database.engine.echo = False
+    counter = QueryCounter()
+    ids = await seed()
+    try:
+        results = await run(ids, counter)
+    finally:
+        await cleanup()
+        await database.engine.dispose()
+
+    # PostgreSQL serializes the debits of a wallet with an extra statement
+    extra = 1 if database.engine.dialect.name == "postgresql" else 0
+    within_budget = True
+    for name, statements in results.items():
+        budget = BUDGETS[name] + (extra if name == "ReservationService.reserve" else 0)
+        over = len(statements) > budget
+        within_budget &= not over
+        print(
+            f"{name:<40} {len(statements):>3} statements "
+            f"(budget {budget}){'  OVER BUDGET' if over else ''}"
+        )
+        if args.verbose or over:
+            for statement in statements:
+                print("    " + " ".join(statement.split())[:150])
+    return within_budget
+
+
+# Run with: python -m benchmarks.query_counts (database of DATABASE_URL, Redis, RabbitMQ)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Statements sent per service method")
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Print every statement"
+    )
+    start_mappers(mapper_registry)
+    sys.exit(0 if asyncio.run(main(parser.parse_args())) else 1)
@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from benchmarks.load_test.stand_ins import install
+
+
+def revision() -> Optional[str]:
+    # Commit of the measured tree, to tell the result files apart
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, float], baseline: dict, threshold: float) -> bool:
+    """
+    Prints the change of every method since the baseline.
+
+    :param results: Microseconds per call of each method.
+    :param baseline: Results file of an earlier run.
+    :param threshold: Slowdown tolerated, in percent.
+    :return: Whether no method got slower than the threshold.
+    """
+    passed = True
+    print(f"\nChange since {baseline.get('revision') or 'the baseline'}:")
+    for method, us in results.items():
+        old = baseline["methods"].get(method)
+        if not old:
+            continue
+        change = (us - old) / old * 100
+        regressed = change > threshold
+        passed = passed and not regressed
+        print(f"{method:<58} {change:>+8.1f}%{'  REGRESSION' if regressed else ''}")
+    return passed
+
+
+async def measure(name: str, args, mq_connection) -> float:
+    """
+    Returns the microseconds per call of a case, in the fastest of its rounds.
+    Every round starts from the seeded state, with empty caches, built outside of
+    the timing (the calls of a case update the rows they read), and the garbage
+    collector is off while it is timed, as in timeit.
+
+    :param name: Name of the case.
+    :param args: The command line arguments.
+    :param mq_connection: The RabbitMQ connection of the book service.
+    """
+    from app.infrastructure.redis_registry import redis_registry
+    from benchmarks.service_layer.cases import DictCache, cases, seed
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        for client in redis_registry.clients.values():
+            await client.flushdb()
+        database = seed(args.books, args.customers)
+        case = cases(database, DictCache(), mq_connection)[name]
+        await case(0)  # Warms the caches and the lazy imports
+
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            for i in range(1, args.number + 1):
+                await case(i)
+            best = min(best, (time.perf_counter() - started) / args.number)
+        finally:
+            gc.enable()
+    return round(best * 1e6, 1)
+
+
+async def main(args) -> bool:
+    # The services take their Redis and RabbitMQ clients from the application
+    # modules, so those are wired to stand-ins before anything imports them. The
+    # database is never connected to: the units of work are in memory.
+    stand_ins = install("sqlite+aiosqlite://")
+    from benchmarks.service_layer.cases import DictCache, cases, seed
+
+    mq_connection = stand_ins.broker.blocking_connection()
+    names = list(cases(seed(args.books, args.customers), DictCache(), mq_connection))
+    results = {}
+    print(f"{'method':<58} {'us/call':>10}")
+    for name in names:
+        results[name] = await measure(name, args, mq_connection)
+        print(f"{name:<58} {results[name]:>10}")
+
+    report = {
+        "revision": revision(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {
+            "books": args.books,
+            "customers": args.customers,
+            "number": args.number,
+            "repeat": args.repeat,
+        },
+        "methods": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+        file.write("\n")
+    print(f"\nResults written to {args.output}")
+
+    if not args.baseline:
+        return True
+    with open(args.baseline) as file:
+        return compare(results, json.load(file), args.threshold)
+
+
+# Run with: python -m benchmarks.service_layer --baseline service_layer.json
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time per call of the service-layer methods, on an in-memory "
+        "unit of work"
+    )
+    parser.add_argument("--books", type=int, default=100, help="Books seeded")
+    parser.add_argument("--customers", type=int, default=100, help="Customers seeded")
+    parser.add_argument("--number", type=int, default=500, help="Calls per round")
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Rounds, the fastest being kept"
+    )
+    parser.add_argument(
+        "--output", default="service_layer.json", help="JSON results file"
+    )
+    parser.add_argument("--baseline", help="Results file of an earlier run to compare")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=20,
+        help="Slowdown since the baseline, in percent, failing the run",
+    )
+    sys.exit(0 if asyncio.run(main(parser.parse_args())) else 1)
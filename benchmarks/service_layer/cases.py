@@ -0,0 +1,322 @@
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+from app.book.domain.entities import Book, BookCreate, BookUpdate, Genre
+from app.book.service_layer.service import (
+    BookService,
+    book_cache_key,
+    invalidate_book_lists,
+)
+from app.infrastructure.rabbitmq.publish_rabbitmq import book_updates_channel
+from app.reservation.domain.entities import (
+    Customer,
+    CustomerContext,
+    CustomerUpdate,
+    Reservation,
+    ReservationCreateSchema,
+)
+from app.reservation.service_layer.customer_service import CustomerService
+from app.reservation.service_layer.reservation_services import ReservationService
+from app.user.domain.entities import Author, City, User, UserUpdate
+from app.user.service_layer.services import AuthService
+from app.user.service_layer.utils import access_token_claims, create_access_token
+from benchmarks.compression import WORDS
+from benchmarks.stubs.in_memory_uow import InMemoryDatabase, InMemoryUnitOfWork
+
+# Books per page of the catalog
+PAGE_SIZE = 20
+
+# Signature of a case: runs the measured call for the i-th time
+Case = Callable[[int], Awaitable]
+
+
+class DictCache:
+    def __init__(self):
+        """
+        Stand-in for the binary Redis cache of the book service: a dictionary of
+        hashes, with the commands the service sends, replying bytes as Redis does.
+        """
+        self.hashes: Dict[str, Dict[str, bytes]] = {}
+        self.values: Dict[str, bytes] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.values.get(key)
+
+    async def incr(self, key: str) -> int:
+        return self.incr_now(key)
+
+    def incr_now(self, key: str) -> int:
+        value = int(self.values.get(key, 0)) + 1
+        self.values[key] = str(value).encode()
+        return value
+
+    async def hmget(self, key: str, *fields: str) -> List[Optional[bytes]]:
+        values = self.hashes.get(key, {})
+        return [values.get(field) for field in fields]
+
+    async def hget(self, key: str, field: str) -> Optional[bytes]:
+        return self.hashes.get(key, {}).get(field)
+
+    async def delete(self, *keys: str) -> int:
+        return sum(
+            (self.hashes.pop(key, None) or self.values.pop(key, None)) is not None
+            for key in keys
+        )
+
+    def pipeline(self, transaction: bool = True) -> "DictPipeline":
+        return DictPipeline(self)
+
+    def register_script(self, script: str) -> "DictCacheResponseScript":
+        # The only script of the book service: CACHE_RESPONSE_SCRIPT
+        return DictCacheResponseScript(self)
+
+
+class DictCacheResponseScript:
+    def __init__(self, cache: DictCache):
+        self.cache = cache
+
+    async def __call__(self, keys: list, args: list) -> int:
+        cache_key, generation_key = keys
+        if int(self.cache.values.get(generation_key, 0)) != int(args[0]):
+            return 0
+        self.cache.hashes[cache_key] = {
+            field: value if isinstance(value, bytes) else str(value).encode()
+            for field, value in zip(args[2::2], args[3::2])
+        }
+        return 1
+
+
+class DictPipeline:
+    def __init__(self, cache: DictCache):
+        self.cache = cache
+        self.commands = []
+
+    def delete(self, key: str):
+        self.commands.append(lambda: self.cache.hashes.pop(key, None))
+
+    def incr(self, key: str):
+        self.commands.append(lambda: self.cache.incr_now(key))
+
+    async def execute(self):
+        return [command() for command in self.commands]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+def seed(books: int, customers: int) -> InMemoryDatabase:
+    """
+    Fills an in-memory database with books and their authors, and premium customers
+    with a few completed reservations each (read by the pricing rules).
+
+    :param books: Number of books.
+    :param customers: Number of customers.
+    """
+    rng = random.Random(0)
+    database = InMemoryDatabase()
+    authors = max(books // 10, 1)
+    now = datetime.now(timezone.utc)
+
+    def user(username: str, role: str) -> dict:
+        return {
+            "username": username,
+            "first_name": "Bench",
+            "last_name": "Mark",
+            "phone": "09120000000",
+            "email": f"{username}@example.com",
+            "password": "not-a-hash",
+            "role": role,
+            "is_active": True,
+        }
+
+    database.insert(City, {"name": "Tehran"})
+    for id in range(1, 11):
+        database.insert(Genre, {"name": f"Genre {id}"})
+    for id in range(1, authors + 1):
+        user_id = database.insert(User, user(f"author{id}", "author"))["id"]
+        database.insert(
+            Author,
+            {"user_id": user_id, "city_id": 1, "bank_account_number": f"{id:016d}"},
+        )
+    for id in range(1, books + 1):
+        words = [rng.choice(WORDS) for _ in range(rng.randrange(30, 120))]
+        database.insert(
+            Book,
+            {
+                "title": f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {id}",
+                "isbn": f"{9780000000000 + id}",
+                "price": rng.randrange(10_000, 500_000),
+                "genre_id": rng.randrange(1, 11),
+                "description": " ".join(words)[:1000],
+                "units": rng.randrange(1, 50),
+                "reserved_units": 0,
+            },
+        )
+        database.book_authors[id] = [rng.randrange(1, authors + 1)]
+    for id in range(1, customers + 1):
+        user_id = database.insert(User, user(f"customer{id}", "customer"))["id"]
+        database.insert(
+            Customer,
+            {
+                "user_id": user_id,
+                "subscription_model": "premium",
+                "subscription_end_time": now + timedelta(days=365),
+                "wallet_money_amount": 10**9,
+            },
+        )
+        for days_ago in (5, 15, 25):
+            database.insert(
+                Reservation,
+                {
+                    "customer_id": id,
+                    "book_id": rng.randrange(1, books + 1),
+                    "start_of_reservation": now - timedelta(days=days_ago + 7),
+                    "end_of_reservation": now - timedelta(days=days_ago),
+                    "price": 7000,
+                    "status": "completed",
+                },
+            )
+    return database
+
+
+def cases(
+    database: InMemoryDatabase, cache: DictCache, mq_connection
+) -> Dict[str, Case]:
+    """
+    Returns the measured service calls, each running in a unit of work of its own
+    as in a request, on the i-th book and customer in turn.
+
+    :param database: The seeded database.
+    :param cache: The cache of the book service.
+    :param mq_connection: The RabbitMQ connection of the book service.
+    """
+    book_service = BookService(
+        cache=cache, mq_channel=book_updates_channel(mq_connection)
+    )
+    customer_service = CustomerService()
+    auth_service = AuthService()
+    book_ids = list(database.rows[Book])
+    customer_ids = list(database.rows[Customer])
+
+    def book_id(i: int) -> int:
+        return book_ids[i % len(book_ids)]
+
+    def customer(i: int) -> dict:
+        return database.rows[Customer][customer_ids[i % len(customer_ids)]]
+
+    def uow() -> InMemoryUnitOfWork:
+        return InMemoryUnitOfWork(database)
+
+    async def get_item_cached(i: int):
+        # Always the book cached by the warm-up call
+        return await book_service.get_item(book_id(0), uow())
+
+    async def get_item_body(i: int):
+        await cache.delete(book_cache_key(book_id(i)))
+        return await book_service.get_item_body(book_id(i), uow(), "br")
+
+    async def get_items_body(i: int):
+        skip = i * PAGE_SIZE % len(book_ids)
+        await invalidate_book_lists(cache)
+        return await book_service.get_items_body(uow(), skip, PAGE_SIZE, "br")
+
+    async def create_item(i: int):
+        book = BookCreate(
+            title=f"New book {i}",
+            isbn=f"{9790000000000 + i}",
+            price=29000,
+            genre_id=1,
+            description="A book created to measure the cost of creating books.",
+            units=5,
+            author_ids=[1],
+        )
+        async with uow() as work:
+            await book_service.create_item(book, work)
+            await work.commit()
+
+    async def update_item(i: int):
+        async with uow() as work:
+            await book_service.update_item(
+                book_id(i), BookUpdate(price=10_000 + i), work
+            )
+            await work.commit()
+
+    async def export_items(i: int):
+        return [book async for book in book_service.export_items(uow())]
+
+    async def reservation_cost(i: int):
+        return await ReservationService(uow()).reservation_cost(customer(i)["id"], 7)
+
+    async def reserve_and_cancel(i: int):
+        # Cancelled right away, so the customers stay under their reservation limit
+        context = CustomerContext(id=customer(i)["id"], subscription_model="premium")
+        user_id = customer(i)["user_id"]
+        async with uow() as work:
+            await ReservationService(work).reserve(
+                user_id, ReservationCreateSchema(book_id=book_id(i), days=7), context
+            )
+            await work.commit()
+        reservation_id = database.last_ids[Reservation]
+        async with uow() as work:
+            await ReservationService(work).cancel_reservation(
+                user_id, reservation_id, work, context
+            )
+            await work.commit()
+
+    async def get_customer(i: int):
+        return await customer_service.get_item(customer(i)["id"], uow())
+
+    async def get_customers(i: int):
+        return await customer_service.get_items(uow())
+
+    async def update_customer(i: int):
+        return await customer_service.update_item(
+            customer(i)["id"], CustomerUpdate(wallet_money_amount=10**9 + i), uow()
+        )
+
+    async def charge_wallet(i: int):
+        row = customer(i)
+        await customer_service.charge_wallet(
+            row["user_id"], 1000, uow(), customer_id=row["id"]
+        )
+
+    async def get_user(i: int):
+        return await auth_service.get_by_id(customer(i)["user_id"], uow())
+
+    async def get_users(i: int):
+        return await auth_service.get_items(uow())
+
+    async def update_user(i: int):
+        return await auth_service.update_item(
+            customer(i)["user_id"], UserUpdate(first_name=f"Bench{i % 10}"), uow()
+        )
+
+    # The token of a request, its principal cached by the warm-up call
+    user = User.__new__(User)
+    user.__dict__.update(database.rows[User][customer(0)["user_id"]])
+    token = create_access_token(access_token_claims(user))
+
+    async def get_current_user(i: int):
+        return await auth_service.get_current_user(token, uow())
+
+    return {
+        "BookService.get_item (cached)": get_item_cached,
+        "BookService.get_item_body (not cached)": get_item_body,
+        f"BookService.get_items_body ({PAGE_SIZE} books, not cached)": get_items_body,
+        "BookService.create_item": create_item,
+        "BookService.update_item": update_item,
+        f"BookService.export_items ({len(book_ids)} books)": export_items,
+        "ReservationService.reservation_cost": reservation_cost,
+        "ReservationService.reserve + cancel_reservation": reserve_and_cancel,
+        "CustomerService.get_item": get_customer,
+        f"CustomerService.get_items ({min(len(customer_ids), 100)})": get_customers,
+        "CustomerService.update_item": update_customer,
+        "CustomerService.charge_wallet": charge_wallet,
+        "AuthService.get_by_id": get_user,
+        f"AuthService.get_items ({len(database.rows[User])})": get_users,
+        "AuthService.update_item": update_user,
+        "AuthService.get_current_user (cached)": get_current_user,
+    }
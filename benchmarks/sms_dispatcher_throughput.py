@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import time
+import uvicorn
+from app.infrastructure.messaging.dispatcher import ProviderConfig, SmsDispatcher
+from benchmarks.stubs.fake_sms_provider import create_app
+
+
+async def run_case(name: str, provider: ProviderConfig, messages: int):
+    # Sends `messages` SMS through a fresh dispatcher and reports the throughput
+    dispatcher = SmsDispatcher([provider], queue_size=1000)
+    await dispatcher.start()
+    started = time.perf_counter()
+    await dispatcher.submit_many(
+        (f"0912{i:07d}", f"benchmark message {i}") for i in range(messages)
+    )
+    await dispatcher.queue.join()
+    elapsed = time.perf_counter() - started
+    await dispatcher.stop()
+    print(
+        f"{name:<10} {messages} messages in {elapsed:.2f}s "
+        f"({messages / elapsed:,.0f} msg/s, {dispatcher.failed} failed)"
+    )
+
+
+async def main(args):
+    # Start the fake provider in the same event loop
+    server = uvicorn.Server(
+        uvicorn.Config(
+            create_app(args.latency_ms),
+            host="127.0.0.1",
+            port=args.port,
+            log_level="warning",
+        )
+    )
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    limits = dict(
+        max_concurrency=args.concurrency,
+        rate_per_second=args.rate,
+        burst=args.rate,
+    )
+    await run_case(
+        "single",
+        ProviderConfig(name="fake", url=f"{base_url}/send", **limits),
+        args.messages,
+    )
+    await run_case(
+        "bulk",
+        ProviderConfig(
+            name="fake",
+            url=f"{base_url}/send",
+            bulk_url=f"{base_url}/bulk",
+            bulk_size=args.bulk_size,
+            **limits,
+        ),
+        args.messages,
+    )
+
+    server.should_exit = True
+    await serve_task
+
+
+# Run with: python -m benchmarks.sms_dispatcher_throughput
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SMS dispatcher throughput")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=100000)
+    parser.add_argument("--bulk-size", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--port", type=int, default=8025)
+    asyncio.run(main(parser.parse_args()))
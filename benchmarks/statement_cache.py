@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from app.adapters.mappers import start_mappers
+from app.adapters.repositories.book_repo import BookRepository
+from app.adapters.repositories.customer_repo import CustomerRepository
+from app.adapters.repositories.reservation_repo import (
+    ReservationRepository,
+    iran_timezone,
+)
+from app.book.domain.entities import Book
+from app.db import database
+from app.db.base import mapper_registry
+from app.db.unit_of_work import UnitOfWork
+from app.reservation.domain.entities import Customer, Reservation
+
+
+def per_call_statements(entity_id: int) -> dict:
+    # Builders of the hot queries' statements, as they were built on every call before
+    return {
+        "get": lambda: select(Book).where(Book.id == entity_id),
+        "list": lambda: select(Book).limit(100).offset(0),
+        "customer by user": lambda: select(Customer).where(
+            Customer.user_id == entity_id
+        ),
+        "books read": lambda: select(func.count()).where(
+            Reservation.customer_id == entity_id,
+            Reservation.end_of_reservation
+            >= datetime.now(iran_timezone) - timedelta(days=30),
+            Reservation.status == "completed",
+        ),
+        "active reservations": lambda: select(Reservation).where(
+            Reservation.customer_id == entity_id, Reservation.status == "active"
+        ),
+    }
+
+
+def repository_calls(uow: UnitOfWork, entity_id: int) -> dict:
+    # The same queries through the repositories, which reuse their statements
+    books = uow.get_repository(BookRepository)
+    customers = uow.get_repository(CustomerRepository)
+    reservations = uow.get_repository(ReservationRepository)
+    return {
+        "get": lambda: books.get(entity_id),
+        "list": lambda: books.list(100, 0),
+        "customer by user": lambda: customers.get_by_user_id(entity_id),
+        "books read": lambda: reservations.has_read_more_than_3_books(entity_id),
+        "active reservations": lambda: reservations.count_active_reservations(
+            entity_id
+        ),
+    }
+
+
+async def timed(calls: int, run) -> float:
+    # Average microseconds per call
+    started = time.perf_counter()
+    for _ in range(calls):
+        await run()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+async def main(args):
+    database.engine.echo = False
+    print(f"{'query':<22} {'build':>9} {'per call':>10} {'reused':>10}")
+    async with UnitOfWork() as uow:
+        session = uow.session
+        statements = per_call_statements(args.id)
+        calls = repository_calls(uow, args.id)
+
+        async def build_only(name):
+            # Python time to build a statement and compute the key of its cached SQL
+            statements[name]()._generate_cache_key()
+
+        async def execute_per_call(name):
+            await session.execute(statements[name]())
+            session.expunge_all()
+
+        async def execute_reused(name):
+            await calls[name]()
+            # Nothing is served from the session, every call goes to the database
+            uow.get_repository(BookRepository).forget()
+            session.expunge_all()
+
+        for name in statements:
+            # Warming up the compiled SQL cache and the connection
+            await execute_per_call(name)
+            await execute_reused(name)
+            build = await timed(args.calls, lambda: build_only(name))
+            per_call = await timed(args.calls, lambda: execute_per_call(name))
+            reused = await timed(args.calls, lambda: execute_reused(name))
+            print(f"{name:<22} {build:7.1f}us {per_call:8.1f}us {reused:8.1f}us")
+    await database.engine.dispose()
+
+
+# Run with: python -m benchmarks.statement_cache (database of DATABASE_URL)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Per-call cost of statements built on every call vs reused ones"
+    )
+    parser.add_argument("--calls", type=int, default=2000, help="Calls per query")
+    parser.add_argument("--id", type=int, default=1, help="Book and customer ID used")
+    start_mappers(mapper_registry)
+    asyncio.run(main(parser.parse_args()))
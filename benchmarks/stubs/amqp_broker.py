@@ -0,0 +1,176 @@
+import asyncio
+from collections import Counter, defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set
+from unittest import mock
+
+# Messages kept per queue without a consumer, the oldest are dropped past it so a
+# long run doesn't grow without bound
+MAX_QUEUED = 10_000
+
+
+class InMemoryBroker:
+    def __init__(self):
+        """
+        In-process stand-in for RabbitMQ, reached through the two clients the
+        application uses: pika's BlockingConnection (book events) and aio_pika's
+        connect_robust (reservation events, the catalog and edge cache consumers).
+
+        Queues are bound to fanout exchanges, messages published to the default
+        exchange go to the queue named by their routing key. A queue with a
+        consumer hands it every message as a task of the running event loop, the
+        others keep them (up to MAX_QUEUED). Messages published are counted by
+        exchange, or by queue for the default exchange.
+        """
+        self.queues: Dict[str, Deque[bytes]] = defaultdict(
+            lambda: deque(maxlen=MAX_QUEUED)
+        )
+        self.bindings: Dict[str, Set[str]] = defaultdict(set)
+        self.consumers: Dict[str, Callable[["IncomingMessage"], Awaitable]] = {}
+        self.published: Counter = Counter()
+
+    def publish(self, exchange: str, routing_key: str, body: bytes):
+        self.published[exchange or routing_key] += 1
+        queues = self.bindings[exchange] if exchange else {routing_key}
+        for queue in queues:
+            consumer = self.consumers.get(queue)
+            if consumer is not None:
+                asyncio.get_running_loop().create_task(consumer(IncomingMessage(body)))
+            else:
+                self.queues[queue].append(body)
+
+    def consume(self, queue: str, callback: Callable[["IncomingMessage"], Awaitable]):
+        # Messages that arrived before the consumer are delivered first
+        self.consumers[queue] = callback
+        loop = asyncio.get_running_loop()
+        while self.queues[queue]:
+            loop.create_task(callback(IncomingMessage(self.queues[queue].popleft())))
+
+    def blocking_connection(self, *args, **kwargs) -> "BlockingConnection":
+        return BlockingConnection(self)
+
+    async def connect_robust(self, *args, **kwargs) -> "Connection":
+        return Connection(self)
+
+    def install(self):
+        """
+        Routes every pika and aio_pika connection opened from now on to the broker.
+        Must be called before the modules connecting at import (the book router)
+        are imported.
+        """
+        mock.patch("pika.BlockingConnection", self.blocking_connection).start()
+        mock.patch("aio_pika.connect_robust", self.connect_robust).start()
+
+
+# pika (blocking) client
+
+
+class BlockingConnection:
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+        self.is_open = True
+
+    def channel(self) -> "BlockingChannel":
+        return BlockingChannel(self.broker)
+
+    def close(self):
+        self.is_open = False
+
+
+class BlockingChannel:
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+
+    def exchange_declare(self, exchange: str, exchange_type: str = "direct", **kwargs):
+        self.broker.bindings.setdefault(exchange, set())
+
+    def queue_declare(self, queue: str, **kwargs):
+        self.broker.queues[queue]
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: str = "", **kwargs):
+        self.broker.bindings[exchange].add(queue)
+
+    def basic_publish(self, exchange: str, routing_key: str, body, properties=None):
+        self.broker.publish(
+            exchange, routing_key, body.encode() if isinstance(body, str) else body
+        )
+
+    def close(self):
+        pass
+
+
+# aio_pika client
+
+
+class IncomingMessage:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    @asynccontextmanager
+    async def process(self, requeue: bool = False, **kwargs):
+        # Failed messages are dropped rather than requeued, a broker that redelivers
+        # them at once would spin on a handler that keeps failing
+        yield
+
+
+class Exchange:
+    def __init__(self, broker: InMemoryBroker, name: str):
+        self.broker = broker
+        self.name = name
+
+    async def publish(self, message, routing_key: str = "", **kwargs):
+        self.broker.publish(self.name, routing_key, message.body)
+
+
+class Queue:
+    def __init__(self, broker: InMemoryBroker, name: str):
+        self.broker = broker
+        self.name = name
+
+    async def bind(self, exchange, routing_key: str = "", **kwargs):
+        name = exchange if isinstance(exchange, str) else exchange.name
+        self.broker.bindings[name].add(self.name)
+
+    async def consume(self, callback, **kwargs):
+        self.broker.consume(self.name, callback)
+
+    async def get(self, **kwargs) -> Optional[IncomingMessage]:
+        queued = self.broker.queues[self.name]
+        return IncomingMessage(queued.popleft()) if queued else None
+
+
+class Channel:
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+        self.default_exchange = Exchange(broker, "")
+
+    async def declare_exchange(self, name: str, *args, **kwargs) -> Exchange:
+        self.broker.bindings.setdefault(name, set())
+        return Exchange(self.broker, name)
+
+    async def declare_queue(self, name: str, **kwargs) -> Queue:
+        self.broker.queues[name]
+        return Queue(self.broker, name)
+
+    async def set_qos(self, **kwargs):
+        pass
+
+    async def close(self):
+        pass
+
+
+class Connection:
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+
+    async def channel(self, **kwargs) -> Channel:
+        return Channel(self.broker)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import random
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+def create_app(latency_ms: float = 20.0, failure_rate: float = 0.0) -> Starlette:
+    """
+    Builds a fake SMS provider exposing a single-send and a bulk-send endpoint.
+
+    Every request waits `latency_ms` to mimic the provider round-trip and fails
+    with a 503 with probability `failure_rate`. Received messages are counted
+    and reported by `GET /stats`.
+
+    :param latency_ms: Simulated processing time of each request in milliseconds.
+    :param failure_rate: Probability (0-1) of answering a request with an error.
+    """
+    stats = {"requests": 0, "messages": 0, "failures": 0}
+
+    async def respond(message_count: int):
+        stats["requests"] += 1
+        await asyncio.sleep(latency_ms / 1000)
+        if random.random() < failure_rate:
+            stats["failures"] += 1
+            return JSONResponse({"status": "unavailable"}, status_code=503)
+        stats["messages"] += message_count
+        return JSONResponse({"status": "queued", "count": message_count})
+
+    async def send(request: Request):
+        await request.json()
+        return await respond(1)
+
+    async def send_bulk(request: Request):
+        payload = await request.json()
+        return await respond(len(payload["messages"]))
+
+    async def get_stats(request: Request):
+        return JSONResponse(stats)
+
+    return Starlette(
+        routes=[
+            Route("/send", send, methods=["POST"]),
+            Route("/bulk", send_bulk, methods=["POST"]),
+            Route("/stats", get_stats, methods=["GET"]),
+        ]
+    )
+
+
+# Run with: python -m benchmarks.stubs.fake_sms_provider --port 8025
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake SMS provider")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.latency_ms, args.failure_rate),
+        host="127.0.0.1",
+        port=args.port,
+        log_level="warning",
+    )
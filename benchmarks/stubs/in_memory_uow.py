@@ -0,0 +1,708 @@
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+)
+from fastapi import HTTPException
+from sqlalchemy import Table
+from sqlalchemy.exc import NoResultFound
+from app.adapters.data_models import (
+    author_table,
+    book_table,
+    city_table,
+    customer_table,
+    genre_table,
+    reservation_table,
+    user_table,
+    wallet_entry_table,
+)
+from app.adapters.repositories.author_repo import AuthorRepository
+from app.adapters.repositories.book_repo import BookRepository
+from app.adapters.repositories.customer_repo import CustomerRepository
+from app.adapters.repositories.genre_repo import GenreRepository
+from app.adapters.repositories.reservation_repo import ReservationRepository
+from app.adapters.repositories.user_repo import AuthRepository
+from app.adapters.repositories.wallet_repo import WalletRepository
+from app.book.domain.entities import Book, Genre
+from app.db.unit_of_work import AbstractUnitOfWork
+from app.exceptions import DuplicateCustomerError, NotFoundException
+from app.reservation.domain.entities import (
+    Customer,
+    CustomerCreate,
+    CustomerUpdate,
+    Reservation,
+    WalletEntry,
+)
+from app.user.domain.entities import Author, City, User, UserCreate, UserUpdate
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Table of each entity, for its columns and their defaults
+TABLES: Dict[type, Table] = {
+    User: user_table,
+    City: city_table,
+    Genre: genre_table,
+    Author: author_table,
+    Customer: customer_table,
+    WalletEntry: wallet_entry_table,
+    Book: book_table,
+    Reservation: reservation_table,
+}
+
+
+def column_defaults(table: Table) -> Dict[str, Callable[[], Any]]:
+    # What the database puts in the columns an INSERT leaves out
+    defaults = {}
+    for column in table.columns:
+        if column.default is not None and column.default.is_scalar:
+            defaults[column.name] = lambda value=column.default.arg: value
+        elif column.server_default is not None:
+            arg = column.server_default.arg
+            if isinstance(arg, str):  # e.g. the version of a row
+                defaults[column.name] = lambda value=column.type.python_type(arg): value
+            else:  # now()
+                defaults[column.name] = lambda: datetime.now(timezone.utc)
+        else:
+            defaults[column.name] = lambda: None
+    return defaults
+
+
+DEFAULTS = {model: column_defaults(table) for model, table in TABLES.items()}
+
+
+class InMemoryDatabase:
+    def __init__(self):
+        """
+        Committed rows of every entity, as dictionaries keyed by ID, and the
+        book_author links as the author IDs of each book. Shared by the units of work.
+        """
+        self.rows: Dict[type, Dict[int, dict]] = {model: {} for model in TABLES}
+        self.book_authors: Dict[int, List[int]] = {}
+        self.last_ids: Dict[type, int] = {model: 0 for model in TABLES}
+
+    def insert(self, model: type, values: dict) -> dict:
+        """
+        Inserts a row, filling the columns left out with their defaults.
+
+        :param model: The entity of the table.
+        :param values: The columns of the row, the ID is assigned if left out.
+        :return: The inserted row.
+        """
+        row = {name: default() for name, default in DEFAULTS[model].items()}
+        row.update(values)
+        if row["id"] is None:
+            row["id"] = self.last_ids[model] + 1
+        self.last_ids[model] = max(self.last_ids[model], row["id"])
+        self.rows[model][row["id"]] = row
+        return row
+
+    def find(self, model: type, **values) -> Iterator[dict]:
+        # Rows whose columns have the given values (a scan, there are no indexes)
+        return (
+            row
+            for row in self.rows[model].values()
+            if all(row[name] == value for name, value in values.items())
+        )
+
+
+class InMemoryUnitOfWork(AbstractUnitOfWork):
+    def __init__(self, database: InMemoryDatabase):
+        """
+        Unit of work over an in-memory database, for running the service layer
+        without infrastructure.
+
+        Repositories are asked for by the class of their SQL implementation and
+        answered with its in-memory counterpart. Rows are hydrated into the domain
+        entities once per unit of work (its identity map), and the changes made to
+        the entities are written back on flush and commit. Repository writes are
+        applied at once, so a rollback only drops the changes not flushed yet.
+
+        The entities are the plain domain classes: they must not be mapped by
+        SQLAlchemy (start_mappers) in the process, the rows being copied into them
+        as the ORM does, without calling their constructor or setters.
+
+        :param database: The database to work on.
+        """
+        self.database = database
+        self.repositories = {}  # Cache of repository instances for reuse
+        self.identity_map: Dict[Tuple[type, int], Any] = {}
+        self.memo: dict = {}  # Entities already looked up, see AbstractRepository
+        self.commit_callbacks: List[Callable[[], Awaitable]] = []
+
+    def get_repository(self, repo_class):
+        # Retrieve the in-memory counterpart of a repository, creating it once
+        if repo_class not in self.repositories:
+            self.repositories[repo_class] = REPOSITORIES[repo_class](self)
+        return self.repositories[repo_class]
+
+    def load(self, model: Type[T], row: dict, refresh: bool = False) -> T:
+        """
+        Returns the entity of a row, hydrated on first use in the unit of work.
+
+        :param model: The entity class.
+        :param row: The row of the entity.
+        :param refresh: Whether an entity already loaded is overwritten by the row.
+        """
+        key = (model, row["id"])
+        entity = self.identity_map.get(key)
+        if entity is None:
+            entity = self.identity_map[key] = model.__new__(model)
+            entity.__dict__.update(row)
+        elif refresh:
+            entity.__dict__.update(row)
+        return entity
+
+    def on_commit(self, callback: Callable[[], Awaitable]):
+        # Run a callback once the unit of work is committed, see UnitOfWork.on_commit
+        self.commit_callbacks.append(callback)
+
+    async def commit(self):
+        # Write back the changes of the entities, which are reloaded afterwards
+        callbacks, self.commit_callbacks = self.commit_callbacks, []
+        await self.flush()
+        self.identity_map.clear()
+        self.memo.clear()
+        for callback in callbacks:
+            await callback()
+
+    async def flush(self):
+        # Copy the columns of every loaded entity back into its row
+        for (model, entity_id), entity in self.identity_map.items():
+            row = self.database.rows[model].get(entity_id)
+            if row is not None:
+                state = entity.__dict__
+                for name in DEFAULTS[model]:
+                    if name in state:
+                        row[name] = state[name]
+
+    async def rollback(self):
+        # Drop the changes of the entities not flushed yet, and their side effects
+        self.commit_callbacks.clear()
+        self.identity_map.clear()
+        self.memo.clear()
+
+    async def refresh(self, item):
+        # Overwrite an entity with its row
+        row = self.database.rows[type(item)].get(item.id)
+        if row is not None:
+            item.__dict__.update(row)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # Exit the context, performing rollback if an exception was raised
+        if exc_type is not None:
+            await self.rollback()
+
+
+class InMemoryRepository(Generic[T]):
+    def __init__(self, uow: InMemoryUnitOfWork, model: Type[T]):
+        """
+        In-memory counterpart of AbstractRepository, with the same methods.
+
+        There are no concurrent transactions, so nothing is locked and operations
+        run once, without conflicts to retry. Relations aren't loaded.
+
+        :param uow: The unit of work of the repository.
+        :param model: The entity of the repository.
+        """
+        self.uow = uow
+        self.model = model
+        self.database = uow.database
+
+    @property
+    def rows(self) -> Dict[int, dict]:
+        return self.database.rows[self.model]
+
+    @property
+    def memo(self) -> dict:
+        return self.uow.memo
+
+    async def memoized(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        memo = self.memo
+        if key not in memo:
+            memo[key] = await load()
+        return memo[key]
+
+    def forget(self) -> None:
+        self.memo.clear()
+
+    def _load(self, row: dict, refresh: bool = False) -> T:
+        return self.uow.load(self.model, row, refresh)
+
+    def _versioned(self, row: dict, values: dict) -> dict:
+        # Bumps the version of versioned entities, as their UPDATEs do
+        if "version" not in row:
+            return values
+        return {**values, "version": row["version"] + 1}
+
+    async def add(self, entity: T) -> None:
+        state = entity.__dict__
+        row = self.database.insert(
+            self.model,
+            {name: state[name] for name in DEFAULTS[self.model] if name in state},
+        )
+        state.update(row)
+        self.uow.identity_map[(self.model, row["id"])] = entity
+        self.forget()
+
+    async def remove(self, entity: T) -> None:
+        self.rows.pop(entity.id, None)
+        self.uow.identity_map.pop((self.model, entity.id), None)
+        self.forget()
+
+    async def get(
+        self, entity_id: int, with_relations: Optional[list] = None
+    ) -> Optional[T]:
+        return await self.memoized(
+            (self.model, entity_id), lambda: self._get_by_id(entity_id)
+        )
+
+    async def _get_by_id(self, entity_id: int) -> Optional[T]:
+        row = self.rows.get(entity_id)
+        return self._load(row) if row is not None else None
+
+    async def list(self, limit: int = 100, offset: int = 0) -> Sequence[T]:
+        return [
+            self._load(row) for row in islice(self.rows.values(), offset, offset + limit)
+        ]
+
+    async def get_existing_ids(self, entity_ids: Iterable[int]) -> Set[int]:
+        return set(entity_ids) & self.rows.keys()
+
+    async def stream(self, batch_size: int = 1000) -> AsyncIterator[Sequence[T]]:
+        rows = sorted(self.rows.values(), key=lambda row: row["id"])
+        for start in range(0, len(rows), batch_size):
+            yield [self._load(row) for row in rows[start : start + batch_size]]
+
+    async def update(self, entity_id: int, **kwargs) -> Optional[T]:
+        entity = await self.get_for_update(entity_id)
+        if entity:
+            for key, value in kwargs.items():
+                setattr(entity, key, value)
+            await self.uow.flush()
+        return entity
+
+    async def get_for_update(self, entity_id: int) -> Optional[T]:
+        row = self.rows.get(entity_id)
+        return self._load(row, refresh=True) if row is not None else None
+
+    async def retry_on_conflict(
+        self, operation: Callable[[], Awaitable[R]], retries: int = 0
+    ) -> R:
+        return await operation()
+
+    async def update_returning(self, entity_id: int, **values) -> Optional[T]:
+        if not values:
+            return await self.get(entity_id)
+        row = self.rows.get(entity_id)
+        if row is None:
+            return None
+        row.update(self._versioned(row, values))
+        self.forget()
+        return self._load(row, refresh=True)
+
+    async def delete_returning(self, entity_id: int) -> Optional[T]:
+        # The rows referencing the entity are deleted by the caller beforehand
+        row = self.rows.pop(entity_id, None)
+        self.forget()
+        if row is None:
+            return None
+        entity = self._load(row, refresh=True)
+        del self.uow.identity_map[(self.model, entity_id)]
+        return entity
+
+    async def upsert(
+        self,
+        values: dict,
+        conflict_columns: Sequence[str],
+        update_columns: Sequence[str] = (),
+    ) -> Optional[T]:
+        self.forget()
+        existing = next(
+            self.database.find(
+                self.model, **{name: values[name] for name in conflict_columns}
+            ),
+            None,
+        )
+        if existing is None:
+            return self._load(self.database.insert(self.model, values))
+        if not update_columns:
+            return None
+        existing.update(
+            self._versioned(
+                existing, {name: values[name] for name in update_columns}
+            )
+        )
+        return self._load(existing, refresh=True)
+
+    async def execute(self, stmt):
+        raise NotImplementedError("SQL statements can't run on the in-memory database")
+
+
+class InMemoryBookRepository(InMemoryRepository[Book]):
+    def __init__(self, uow: InMemoryUnitOfWork):
+        super().__init__(uow, Book)
+
+    async def add(self, book: Book) -> None:
+        # The authors of a new book are linked to it, as its relationship does
+        authors = book.__dict__.get("authors") or []
+        await super().add(book)
+        self.database.book_authors[book.id] = [author.id for author in authors]
+
+    async def get_book_list(self, skip: int, limit: int) -> List[Book]:
+        return await super().list(limit, skip)
+
+    async def cancel_reservation(self, book_id: int) -> Optional[Book]:
+        book = await self.get_for_update(book_id)
+        if book:
+            book.cancel_reservation()
+        return book
+
+    async def add_book(self, book: Book) -> None:
+        await self.add(book)
+
+    async def update_book(self, book_id: int, book_data: dict) -> Optional[Book]:
+        book = await self.update_returning(book_id, **book_data)
+        if not book:
+            raise NoResultFound("Book not found.")
+        return book
+
+    async def get_book_by_id(
+        self, book_id: int, with_relations: Optional[List[str]] = None
+    ) -> Optional[Book]:
+        return await super().get(book_id, with_relations)
+
+    async def delete_book_by_id(self, book_id: int) -> Optional[Book]:
+        self.database.book_authors.pop(book_id, None)
+        return await self.delete_returning(book_id)
+
+    async def set_author_ids(self, book_id: int, author_ids: Iterable[int]) -> None:
+        self.database.book_authors[book_id] = list(set(author_ids))
+
+    async def get_author_ids_from_books(self, book_id: int) -> List[int]:
+        author_ids = self.database.book_authors.get(book_id)
+        if not author_ids:
+            raise NotFoundException("No authors found for the provided book IDs.")
+        return list(author_ids)
+
+    async def get_titles_by_ids(self, book_ids: Iterable[int]) -> Dict[int, str]:
+        return {
+            book_id: self.rows[book_id]["title"]
+            for book_id in set(book_ids)
+            if book_id in self.rows
+        }
+
+    async def get_author_ids_by_book_ids(
+        self, book_ids: Iterable[int]
+    ) -> Dict[int, List[int]]:
+        links = self.database.book_authors
+        return {
+            book_id: list(links[book_id])
+            for book_id in set(book_ids)
+            if links.get(book_id)
+        }
+
+    async def add_many(self, books: List[dict]) -> Dict[str, int]:
+        isbns = {row["isbn"] for row in self.rows.values()}
+        added = {}
+        for book in books:
+            if book["isbn"] not in isbns:
+                isbns.add(book["isbn"])
+                added[book["isbn"]] = self.database.insert(Book, dict(book))["id"]
+        self.forget()
+        return added
+
+    async def add_author_links(self, links: List[dict]) -> None:
+        for link in links:
+            self.database.book_authors.setdefault(link["book_id"], []).append(
+                link["author_id"]
+            )
+
+
+class InMemoryAuthorRepository(InMemoryRepository[Author]):
+    def __init__(self, uow: InMemoryUnitOfWork):
+        super().__init__(uow, Author)
+
+    async def get_by_id(self, author_id: int) -> Author:
+        author = await super().get(author_id)
+        if author is None:
+            raise NotFoundException("Author not found.")
+        return author
+
+    async def get_by_ids(self, author_ids: List[int]) -> List[Author]:
+        authors = [
+            self._load(self.rows[author_id])
+            for author_id in dict.fromkeys(author_ids)
+            if author_id in self.rows
+        ]
+        if not authors:
+            raise NotFoundException("One or more authors not found.")
+        return authors
+
+
+class InMemoryCustomerRepository(InMemoryRepository[Customer]):
+    def __init__(self, uow: InMemoryUnitOfWork):
+        super().__init__(uow, Customer)
+
+    async def create_item(self, customer_data: CustomerCreate) -> Optional[Customer]:
+        new_customer = await self.upsert(
+            customer_data.model_dump(), conflict_columns=["user_id"]
+        )
+        if not new_customer:
+            raise DuplicateCustomerError(customer_data.user_id)
+        return new_customer
+
+    async def update_item(
+        self, id: int, customer_data: CustomerUpdate
+    ) -> Optional[Customer]:
+        updated_customer = await self.update_returning(
+            id, **customer_data.model_dump(exclude_none=True)
+        )
+        if not updated_customer:
+            raise NotFoundException("Customer not found")
+        return updated_customer
+
+    async def delete_item(self, id: int) -> Optional[Customer]:
+        delete_dependents(self.database, WalletEntry, customer_id=id)
+        delete_dependents(self.database, Reservation, customer_id=id)
+        return await self.delete_returning(id)
+
+    async def get_by_user_id(self, user_id: int) -> Optional[Customer]:
+        row = next(self.database.find(Customer, user_id=user_id), None)
+        return self._load(row) if row is not None else None
+
+    async def get_phone_numbers_by_ids(
+        self, customer_ids: Iterable[int]
+    ) -> Dict[int, str]:
+        users = self.database.rows[User]
+        return {
+            customer_id: users[self.rows[customer_id]["user_id"]]["phone"]
+            for customer_id in set(customer_ids)
+            if customer_id in self.rows
+        }
+
+
+class InMemoryReservationRepository(InMemoryRepository[Reservation]):
+    def __init__(self, uow: InMemoryUnitOfWork):
+        super().__init__(uow, Reservation)
+
+    async def add(self, reservation: Reservation):
+        # The availability is checked on the current state of the book
+        row = self.database.rows[Book].get(reservation.book_id)
+        if row is None:
+            raise HTTPException(status_code=404, detail="Book not found.")
+        book = self.uow.load(Book, row, refresh=True)
+
+        if book.units - book.reserved_units <= 0:
+            raise HTTPException(status_code=400, detail="Book is fully reserved.")
+
+        book.reserve_book()
+        await super().add(reservation)
+        await self.uow.flush()
+
+    def _since(self, days: int) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(days=days)
+
+    async def has_read_more_than_3_books(self, customer_id: int) -> bool:
+        since = self._since(30)
+        books_read = sum(
+            1
+            for row in self.database.find(
+                Reservation, customer_id=customer_id, status="completed"
+            )
+            if row["end_of_reservation"] >= since
+        )
+        return books_read > 3
+
+    async def has_paid_more_than_300k(self, customer_id: int) -> bool:
+        since = self._since(60)
+        total_paid = sum(
+            row["price"]
+            for row in self.database.find(
+                Reservation, customer_id=customer_id, status="completed"
+            )
+            if row["start_of_reservation"] >= since
+        )
+        return total_paid > 300000
+
+    async def count_active_reservations(self, customer_id: int) -> int:
+        return sum(
+            1
+            for _ in self.database.find(
+                Reservation, customer_id=customer_id, status="active"
+            )
+        )
+
+    async def get_reservation_by_id_and_customer(
+        self, reservation_id: int, customer_id: int
+    ) -> Reservation | None:
+        reservation = await self.get(reservation_id)
+        if reservation and reservation.customer_id == customer_id:
+            return reservation
+        return None
+
+    async def get_all_active_reservations(self) -> list[Reservation] | None:
+        return [
+            self._load(row) for row in self.database.find(Reservation, status="active")
+        ]
+
+
+class InMemoryWalletRepository(InMemoryRepository[WalletEntry]):
+    def __init__(self, uow: InMemoryUnitOfWork):
+        super().__init__(uow, WalletEntry)
+
+    def _pending_total(self, customer_id: int) -> int:
+        return sum(
+            row["amount"]
+            for row in self.database.find(
+                WalletEntry, customer_id=customer_id, compacted=False
+            )
+        )
+
+    async def get_balance(self, customer_id: int) -> Optional[int]:
+        customer = self.database.rows[Customer].get(customer_id)
+        if customer is None:
+            return None
+        return customer["wallet_money_amount"] + self._pending_total(customer_id)
+
+    async def get_balances(self, customer_ids: Iterable[int]) -> Dict[int, int]:
+        customers = self.database.rows[Customer]
+        return {
+            customer_id: customers[customer_id]["wallet_money_amount"]
+            + self._pending_total(customer_id)
+            for customer_id in set(customer_ids)
+            if customer_id in customers
+        }
+
+    def _append(self, customer_id: int, amount: int, reason: str):
+        self.database.insert(
+            WalletEntry,
+            {
+                "customer_id": customer_id,
+                "amount": amount,
+                "reason": reason,
+                "compacted": False,
+            },
+        )
+
+    async def credit(self, customer_id: int, amount: int, reason: str) -> bool:
+        if customer_id not in self.database.rows[Customer]:
+            return False
+        self._append(customer_id, amount, reason)
+        return True
+
+    async def debit(self, customer_id: int, amount: int, reason: str) -> Optional[int]:
+        balance = await self.get_balance(customer_id)
+        if balance is None or balance < amount:
+            return None
+        if amount:
+            self._append(customer_id, -amount, reason)
+        return balance - amount
+
+    async def set_balance(self, customer_id: int, balance: int, reason: str) -> bool:
+        current = await self.get_balance(customer_id)
+        if current is None:
+            return False
+        if balance != current:
+            self._append(customer_id, balance - current, reason)
+        return True
+
+    async def compact(self) -> int:
+        totals: Dict[int, int] = {}
+        for row in self.database.find(WalletEntry, compacted=False):
+            row["compacted"] = True
+            totals[row["customer_id"]] = totals.get(row["customer_id"], 0) + row["amount"]
+        customers = self.database.rows[Customer]
+        for customer_id, amount in totals.items():
+            customers[customer_id]["wallet_money_amount"] += amount
+        return len(totals)
+
+
+class InMemoryAuthRepository(InMemoryRepository[User]):
+    def __init__(self, uow: InMemoryUnitOfWork):
+        super().__init__(uow, User)
+
+    async def get_by_username_or_email(
+        self, username: str, email: str
+    ) -> Optional[User]:
+        row = next(
+            (
+                row
+                for row in self.rows.values()
+                if row["username"] == username or row["email"] == email
+            ),
+            None,
+        )
+        return self._load(row) if row is not None else None
+
+    async def create_item(self, user_data: UserCreate, hashed_password: str) -> User:
+        user_data.password = hashed_password
+        row = self.database.insert(User, user_data.model_dump())
+        self.forget()
+        return self._load(row)
+
+    async def get_by_username(self, username: str) -> Optional[User]:
+        row = next(self.database.find(User, username=username), None)
+        return self._load(row) if row is not None else None
+
+    async def get_by_id(self, user_id: int) -> Optional[User]:
+        return await self.get(user_id)
+
+    async def get_all(self) -> List[User]:
+        return [self._load(row) for row in self.rows.values()]
+
+    async def update_item(self, id: int, user_data: UserUpdate) -> Optional[User]:
+        updated_user = await self.update_returning(
+            id, **user_data.model_dump(exclude_none=True)
+        )
+        if not updated_user:
+            raise NotFoundException("User not found")
+        return updated_user
+
+    async def delete_item(self, id: int) -> bool:
+        for customer in list(self.database.find(Customer, user_id=id)):
+            delete_dependents(self.database, WalletEntry, customer_id=customer["id"])
+            delete_dependents(self.database, Reservation, customer_id=customer["id"])
+        delete_dependents(self.database, Customer, user_id=id)
+        for author in list(self.database.find(Author, user_id=id)):
+            for author_ids in self.database.book_authors.values():
+                while author["id"] in author_ids:
+                    author_ids.remove(author["id"])
+        delete_dependents(self.database, Author, user_id=id)
+        return await self.delete_returning(id) is not None
+
+
+def delete_dependents(database: InMemoryDatabase, model: type, **values):
+    # Deletes the rows referencing a deleted entity
+    for row in list(database.find(model, **values)):
+        del database.rows[model][row["id"]]
+
+
+# In-memory counterpart of each repository, by the class the services ask for
+REPOSITORIES = {
+    AuthorRepository: InMemoryAuthorRepository,
+    BookRepository: InMemoryBookRepository,
+    CustomerRepository: InMemoryCustomerRepository,
+    GenreRepository: lambda uow: InMemoryRepository(uow, Genre),
+    ReservationRepository: InMemoryReservationRepository,
+    AuthRepository: InMemoryAuthRepository,
+    WalletRepository: InMemoryWalletRepository,
+}
@@ -0,0 +1,137 @@
+import asyncio
+import copy
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+WORD = re.compile(r"\w+")
+
+
+def words(text: Any) -> List[str]:
+    return WORD.findall(str(text).lower()) if text is not None else []
+
+
+def completed(result: Any = None) -> asyncio.Future:
+    # Motor returns a future for every write, the write starting at once whether
+    # or not it is awaited (the catalog handler doesn't await all of them)
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(result)
+    return future
+
+
+class InMemoryCollection:
+    def __init__(self):
+        """
+        In-process stand-in for the Motor collection of the book catalog, with the
+        subset of its API the application uses: text indexes and `$text` search
+        sorted by score, equality filters, `$set` updates and single or bulk
+        inserts.
+
+        Text search matches documents containing any of the searched words in an
+        indexed field, scored by the number of occurrences (no stemming, stop
+        words or phrases).
+        """
+        self.documents: Dict[Any, dict] = {}
+        self.text_fields: Tuple[str, ...] = ()
+
+    async def create_index(self, keys: Iterable[Tuple[str, Any]], **kwargs) -> str:
+        text_fields = tuple(field for field, kind in keys if kind == "text")
+        if text_fields:
+            self.text_fields = text_fields
+        return "_".join(f"{field}_{kind}" for field, kind in keys)
+
+    def insert_one(self, document: dict) -> asyncio.Future:
+        self.documents[document["_id"]] = copy.deepcopy(document)
+        return completed()
+
+    def insert_many(self, documents: List[dict], ordered: bool = True) -> asyncio.Future:
+        for document in documents:
+            self.documents[document["_id"]] = copy.deepcopy(document)
+        return completed()
+
+    def update_one(self, filter: dict, update: dict) -> asyncio.Future:
+        for document in self._matching(filter):
+            document.update(copy.deepcopy(update.get("$set", {})))
+            break
+        return completed()
+
+    def delete_one(self, filter: dict) -> asyncio.Future:
+        for document in self._matching(filter):
+            del self.documents[document["_id"]]
+            break
+        return completed()
+
+    async def count_documents(self, filter: dict) -> int:
+        return sum(1 for _ in self._matching(filter))
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None):
+        filter = dict(filter or {})
+        search = filter.pop("$text", None)
+        terms = set(words(search["$search"])) if search else set()
+        with_score = any(
+            isinstance(value, dict) and value.get("$meta") == "textScore"
+            for value in (projection or {}).values()
+        )
+
+        results = []
+        for document in self._matching(filter):
+            if search:
+                score = sum(
+                    1
+                    for field in self.text_fields
+                    for word in words(document.get(field))
+                    if word in terms
+                )
+                if not score:
+                    continue
+            document = copy.deepcopy(document)
+            if with_score:
+                document["score"] = float(score)
+            results.append(document)
+        return Cursor(results)
+
+    def _matching(self, filter: dict):
+        if set(filter) == {"_id"}:
+            document = self.documents.get(filter["_id"])
+            return [document] if document is not None else []
+        return [
+            document
+            for document in list(self.documents.values())
+            if all(document.get(field) == value for field, value in filter.items())
+        ]
+
+
+class Cursor:
+    def __init__(self, documents: List[dict]):
+        self.documents = documents
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, keys, direction: int = 1) -> "Cursor":
+        if isinstance(keys, str):
+            keys = [(keys, direction)]
+        # Sorted by the last key first, so the first key takes precedence
+        for field, order in reversed(keys):
+            if isinstance(order, dict):  # {"$meta": "textScore"}, best first
+                self.documents.sort(key=lambda d: d.get(field, 0), reverse=True)
+            else:
+                self.documents.sort(key=lambda d: d.get(field), reverse=order < 0)
+        return self
+
+    def skip(self, count: int) -> "Cursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "Cursor":
+        self._limit = count
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        return [document async for document in self][:length]
+
+    def __aiter__(self):
+        end = self._skip + self._limit if self._limit else None
+        return self._iterate(self.documents[self._skip : end])
+
+    async def _iterate(self, documents: List[dict]):
+        for document in documents:
+            yield document
@@ -0,0 +1,132 @@
+import argparse
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Set, Tuple
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# Headers of the upstream response that aren't replayed from the cache
+HOP_BY_HOP = {"connection", "content-length", "transfer-encoding", "keep-alive"}
+
+
+def shared_max_age(cache_control: str) -> Optional[int]:
+    # Seconds a shared cache may keep a response, None if it may not keep it at all
+    directives = cache_control.lower()
+    if "public" not in directives or "no-store" in directives:
+        return None
+    match = re.search(r"s-maxage=(\d+)", directives) or re.search(
+        r"max-age=(\d+)", directives
+    )
+    return int(match.group(1)) if match else None
+
+
+def create_app(
+    upstream: str, transport: Optional[httpx.AsyncBaseTransport] = None
+) -> Starlette:
+    """
+    Builds a caching reverse proxy in front of the application, standing in for
+    Varnish or a CDN.
+
+    GET responses the application marks as public are kept for their `s-maxage`,
+    tagged with their `Surrogate-Key` header, and served without reaching the
+    application (`X-Cache: HIT`). A `PURGE` request drops every response tagged
+    with one of the keys of its `Surrogate-Key` header. Hits, misses and purges
+    are reported by `GET /__stats`.
+
+    :param upstream: Base URL of the application.
+    :param transport: HTTP transport to the application (e.g. an ASGI transport).
+    """
+    client = httpx.AsyncClient(base_url=upstream, transport=transport)
+    # Cached responses by path, query and accepted content codings (responses vary
+    # on Accept-Encoding): when they expire, their body, their headers and their
+    # surrogate keys
+    responses: Dict[str, Tuple[float, bytes, Dict[str, str], Set[str]]] = {}
+    stats = {"hits": 0, "misses": 0, "purges": 0, "purged": 0}
+
+    async def proxy(request: Request):
+        url = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+        key = f"{url} {request.headers.get('accept-encoding', '')}"
+        cached = responses.get(key)
+        if request.method == "GET" and cached and cached[0] > time.monotonic():
+            stats["hits"] += 1
+            _, body, headers, _ = cached
+            return Response(body, headers={**headers, "X-Cache": "HIT"})
+
+        stats["misses"] += 1
+        upstream_response = await client.request(
+            request.method,
+            url,
+            content=await request.body(),
+            headers={
+                name: value
+                for name, value in request.headers.items()
+                if name.lower() != "host"
+            },
+        )
+        body = upstream_response.content
+        headers = {
+            name: value
+            for name, value in upstream_response.headers.items()
+            if name.lower() not in HOP_BY_HOP
+        }
+        max_age = shared_max_age(upstream_response.headers.get("cache-control", ""))
+        if request.method == "GET" and upstream_response.status_code == 200 and max_age:
+            keys = set(upstream_response.headers.get("surrogate-key", "").split())
+            responses[key] = (time.monotonic() + max_age, body, headers, keys)
+        return Response(
+            body,
+            status_code=upstream_response.status_code,
+            headers={**headers, "X-Cache": "MISS"},
+        )
+
+    async def purge(request: Request):
+        keys = set(request.headers.get("surrogate-key", "").split())
+        stale = [key for key, (*_, tags) in responses.items() if tags & keys]
+        for key in stale:
+            del responses[key]
+        stats["purges"] += 1
+        stats["purged"] += len(stale)
+        return JSONResponse({"purged": len(stale)})
+
+    async def get_stats(request: Request):
+        return JSONResponse({**stats, "cached": len(responses)})
+
+    async def route(request: Request):
+        if request.method == "PURGE":
+            return await purge(request)
+        return await proxy(request)
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette):
+        yield
+        await client.aclose()
+
+    return Starlette(
+        routes=[
+            Route("/__stats", get_stats, methods=["GET"]),
+            Route(
+                "/{path:path}",
+                route,
+                methods=["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "PURGE"],
+            ),
+        ],
+        lifespan=lifespan,
+    )
+
+
+# Run with: python -m benchmarks.stubs.purge_proxy --port 8080 --upstream http://127.0.0.1:8000
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Caching reverse proxy with purges")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--upstream", default="http://127.0.0.1:8000")
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.upstream), host="127.0.0.1", port=args.port, log_level="warning"
+    )
@@ -1,14 +1,29 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from prometheus_client import make_asgi_app
 from alembic.config import Config
 from alembic import command
 from app.adapters.mappers import start_mappers
 from app.db.base import mapper_registry
+from app.infrastructure.messaging.sms_provider import (
+    start_sms_dispatcher,
+    stop_sms_dispatcher,
+)
+from app.infrastructure.edge_cache import start_purge_worker, stop_purge_worker
+from app.infrastructure.password_hasher import password_hasher
+from app.infrastructure.redis_registry import OTP, redis_registry
 from app.infrastructure.mongodb.consume_mongo import consume_book_updates
 from app.infrastructure.mongodb.mongodb import init_mongo
 from app.infrastructure.rabbitmq.consume_rabbitmq import consume_event
-from app.reservation.domain.events import check_reservations_ending_soon
+from app.middleware import (
+    CompressionMiddleware,
+    RateLimitMiddleware,
+    default_rate_limit_policies,
+)
+from app.reservation.domain.events import dispatch_due_reminders
+from app.reservation.service_layer.customer_service import compact_wallets
+from app.settings import settings
 from app.user.entrypoints.routers.user_router import router as user_router
 from app.reservation.entrypoints.routers.customer_router import (
     router as customer_router,
@@ -40,22 +55,51 @@ async def lifespan(app: FastAPI):
         consume_event, "interval", minutes=1
     )  # Consuming events from RabbitMQ every 1 minute
     scheduler.add_job(
-        check_reservations_ending_soon, "cron", hour=9, minute=0
-    )  # Check reservations ending at 9:00 AM every day
+        dispatch_due_reminders, "interval", minutes=1
+    )  # Publishing due reservation reminders from the timer wheel every 1 minute
     scheduler.add_job(
         consume_book_updates, "interval", minutes=1
     )  # Consuming book updates from MongoDB every 1 minute
+    scheduler.add_job(
+        compact_wallets, "interval", minutes=settings.WALLET_COMPACTION_INTERVAL_MINUTES
+    )  # Folding the wallet ledger into the customers' balance snapshots
     scheduler.start()  # Start the scheduler
 
     await init_mongo()
+    await redis_registry.health_check()  # Report unreachable Redis databases early
+    await start_sms_dispatcher()  # Start sending queued SMS in the background
+    await start_purge_worker()  # Purge the edge cache of the books that change
 
     yield  # Yield control to the FastAPI app lifecycle
     scheduler.shutdown()  # Shutdown the scheduler when the app stops
+    await stop_sms_dispatcher()  # Send the SMS still queued before exiting
+    await stop_purge_worker()  # Stop purging the edge cache
+    password_hasher.shutdown()  # Stop the password hashing worker processes
+    await redis_registry.close()  # Close the pooled Redis connections
 
 
 # Create the FastAPI app with lifespan context management
 app = FastAPI(lifespan=lifespan)
 
+# Apply per-client rate limits to every route before it reaches the database
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        redis_client=redis_registry.client(OTP),
+        policies=default_rate_limit_policies(),
+        lease_fraction=settings.RATE_LIMIT_LEASE_FRACTION,
+        lease_ttl=settings.RATE_LIMIT_LEASE_TTL_MS / 1000,
+    )
+
+# Compress the JSON responses and NDJSON exports the client accepts compressed
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware, minimum_size=settings.COMPRESSION_MINIMUM_SIZE
+    )
+
+# Expose Prometheus metrics (e.g. SMS circuit breaker states) for scraping
+app.mount("/metrics", make_asgi_app())
+
 # Include routers for different resources, setting API prefix and tags
 app.include_router(user_router, prefix="/users", tags=["Users"])  # User-related routes
 app.include_router(